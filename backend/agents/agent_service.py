@@ -5,6 +5,8 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 import google.generativeai as genai
 
+from services.token_budget import token_budget, count_tokens
+
 from .agent_types import (
     SafetyStatus,
     LearningState,
@@ -96,6 +98,18 @@ class AgentService:
         print('Input:', json.dumps(getattr(input_data, "to_dict", lambda: input_data)(), indent=2))
 
         try:
+            model_name = self.model.model_name.split('/')[-1]
+            payload = {
+                **(input_data if isinstance(input_data, dict) else input_data.to_dict()),
+                'response_format': 'json',
+                'format_instructions': 'Return only valid JSON without any markdown formatting or additional text.'
+            }
+            # Instructions are fixed; long inputs (history, context) are what get trimmed
+            instruction_tokens = count_tokens(instructions, model_name)
+            payload = token_budget.fit_payload(payload, 'agent', model_name, reserve=instruction_tokens,
+                                                 serialize=json.dumps)
+            message = json.dumps(payload)
+
             chat = self.model.start_chat(history=[
                 {
                     'role': 'user',
@@ -107,11 +121,11 @@ class AgentService:
                 }
             ])
 
-            result = chat.send_message(json.dumps({
-                **(input_data if isinstance(input_data, dict) else input_data.to_dict()),
-                'response_format': 'json',
-                'format_instructions': 'Return only valid JSON without any markdown formatting or additional text.'
-            }))
+            result = chat.send_message(message)
+            usage = getattr(result, 'usage_metadata', None)
+            token_budget.record('agent', model_name, instruction_tokens + count_tokens(message, model_name),
+                                getattr(usage, 'prompt_token_count', None),
+                                getattr(usage, 'candidates_token_count', None))
 
             response = result.text
             print('Raw response:', response)
@@ -1,28 +1,44 @@
 import os
 import json
-import requests
 from dotenv import load_dotenv
-from flask import Flask, request, send_file, jsonify
+from flask import Flask, request, send_file, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader
 from werkzeug.utils import secure_filename
-import kokoro
-from kokoro import KPipeline
-import soundfile as sf
-import numpy as np
-import re
-import pdfplumber
-import torch
 import io
 from typing import List
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 # from agents import AgentService, SafetyStatus  # Temporarily disabled
 import time
+import threading
 from datetime import datetime, timedelta
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError
+from requests.exceptions import ConnectionError as HTTPConnectionError, Timeout as HTTPTimeout
 # import whisper  # Temporarily disabled to avoid dependency issues
 from models.gamification import GamificationDB
 from services.points_service import PointsService
+from services.http_client import http_client
+from services.rate_limiter import gemini_rate_limiter
+from services.llm_cache import llm_cache, make_cache_key
+from services.hedging import llm_hedger
+from services.circuit_breaker import circuit_breakers
+from services.single_flight import llm_flight, file_flight, SingleFlightTimeout
+from services.summarizer import MapReduceSummarizer, MAP_REDUCE_CHUNK_TOKENS
+from services.chunker import split_text
+from services.text_cleaner import text_cleaner
+from services.token_budget import token_budget, count_tokens
+from services.audio_stream import (
+    iter_sentences, splice
+)
+from services.audio_encoding import audio_encoding
+from services.tts_cache import tts_cache, make_segment_key
+from services.tts_scheduler import TTSScheduler, synthesize_with
+from services.tts_engine import tts_engine, TTS_LANG_CODE, TTS_VOICE
+from services.job_queue import JobQueue, QueueFullError, FINISHED_STATES
+from services.pdf_extraction import pdf_extractor, SpooledPDF, PAGE_BREAK
+from services.extraction_cache import extraction_cache
+from services.vector_index import vector_index, document_id as make_document_id, is_document_id
+from services.bm25_index import bm25_index
 import sqlite3
 import uuid
 from datetime import datetime
@@ -38,42 +54,57 @@ load_dotenv()
 api_key = os.getenv("GEMINI_API_KEY")
 github_token = os.getenv("GITHUB_TOKEN")
 
-pipeline = KPipeline(lang_code='a')
-
 app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "http://localhost:3001"], "methods": ["GET", "POST"], "allow_headers": ["Content-Type"]}})
+CORS(app, resources={r"/*": {"origins": ["http://localhost:3000", "http://localhost:3001"], "methods": ["GET", "POST"], "allow_headers": ["Content-Type"], "expose_headers": ["X-Audio-Format", "X-Audio-Bytes", "X-Encode-Ms"]}})
+
+# A hedged loser can't be interrupted; the timeout is what gives its pool slot back
+GITHUB_TIMEOUT = float(os.getenv("GITHUB_TIMEOUT", "30"))
 
 client = OpenAI(
     base_url="https://models.github.ai/inference",
     api_key=github_token,
+    timeout=GITHUB_TIMEOUT,
+    max_retries=1,
 ) if github_token else None
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Errors that mean the provider itself is unreachable or too slow
+TRANSPORT_ERRORS = (HTTPTimeout, HTTPConnectionError, APIConnectionError, TimeoutError, ConnectionError)
+
+def is_provider_failure(error):
+    """Whether an error says the provider is unhealthy (timeouts, connection errors, 429/5xx).
+
+    Anything else -- a 4xx, a blocked prompt, a 200 we could not parse -- is about
+    this request and must not open the breaker for everyone else.
+    """
+    if isinstance(error, TRANSPORT_ERRORS):
+        return True
+    status = getattr(getattr(error, 'response', None), 'status_code', None)
+    if status is None:
+        status = getattr(error, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
 class RateLimitedGeminiAPI:
-    def __init__(self, api_key, model="gemini-1.5-pro-latest"):
+    def __init__(self, api_key, model="gemini-1.5-pro-latest", rate_limiter=gemini_rate_limiter):
         self.api_key = api_key
-        self.last_request_time = None
-        self.min_interval = 1
+        self.rate_limiter = rate_limiter
         self.retry_attempts = 2
         self.base_delay = 0.5
         self.model = model
         
-    def call_gemini_api(self, prompt, model_override=None):
+    def generate(self, prompt, model=None, endpoint="default"):
+        """One uncached Gemini call; caching and the fallback chain live in call_gemini_api"""
+        model = model or self.model
         if not self.api_key:
             return None
         if not self.api_key.startswith('AIzaSy'):
             return None
-        if self.last_request_time:
-            time_since_last = time.time() - self.last_request_time
-            if time_since_last < self.min_interval:
-                sleep_time = self.min_interval - time_since_last
-                time.sleep(sleep_time)
         url = (
             f"https://generativelanguage.googleapis.com/v1beta/models/"
-            f"{model_override or self.model}:generateContent?key={self.api_key}"
+            f"{model}:generateContent?key={self.api_key}"
         )
         headers = {"Content-Type": "application/json"}
         data = {
@@ -85,13 +116,22 @@ class RateLimitedGeminiAPI:
                 }
             ]
         }
+        breaker = circuit_breakers.get(f"gemini:{model}")
         for attempt in range(self.retry_attempts):
+            # Skip straight to the next provider while this model's breaker is open
+            if not breaker.allow_request():
+                return None
             try:
-                self.last_request_time = time.time()
-                response = requests.post(url, headers=headers, json=data, timeout=15)
+                # Shared across gunicorn workers; False means the queue for this model is too long
+                if not self.rate_limiter.acquire(model):
+                    breaker.release()
+                    return None
+                response = http_client.post(url, headers=headers, json=data, timeout=15)
                 if response.status_code == 200:
-                    return response.json()["candidates"][0]["content"]["parts"][0]["text"]
+                    breaker.record_success()
+                    return self._parse_response(response, prompt, model, endpoint)
                 elif response.status_code == 429:
+                    breaker.record_failure()
                     if attempt < self.retry_attempts - 1:
                         time.sleep(self.base_delay * (2 ** attempt))
                         continue
@@ -99,40 +139,244 @@ class RateLimitedGeminiAPI:
                         return None
                 else:
                     response.raise_for_status()
-            except Exception:
+            except Exception as e:
+                if not is_provider_failure(e):
+                    # The provider answered; the request itself was bad and retrying won't help
+                    breaker.record_success()
+                    return None
+                breaker.record_failure()
                 if attempt < self.retry_attempts - 1:
                     time.sleep(self.base_delay * (2 ** attempt))
                     continue
                 return None
         return None
 
+    def _parse_response(self, response, prompt, model, endpoint):
+        """Text of a 200 response, or None when it has none (e.g. a safety-blocked prompt)"""
+        try:
+            body = response.json()
+            usage = body.get("usageMetadata", {})
+            token_budget.record(endpoint, model, count_tokens(prompt, model),
+                                usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+            return body["candidates"][0]["content"]["parts"][0]["text"]
+        except (ValueError, KeyError, IndexError, TypeError) as e:
+            print(f"⚠️ Gemini {model} returned no usable text: {e!r}")
+            return None
+
+    def stream_generate(self, prompt, model, endpoint="default"):
+        """Yield text deltas from Gemini's streamGenerateContent endpoint.
+
+        Retries only while nothing has been yielded; a failure after the first
+        delta is re-raised so the caller can reset and fall back.
+        """
+        if not self.api_key or not self.api_key.startswith('AIzaSy'):
+            return
+        url = (
+            f"https://generativelanguage.googleapis.com/v1beta/models/"
+            f"{model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        )
+        headers = {"Content-Type": "application/json"}
+        data = {"contents": [{"parts": [{"text": prompt}]}]}
+        breaker = circuit_breakers.get(f"gemini:{model}")
+        for attempt in range(self.retry_attempts):
+            emitted = False
+            if not breaker.allow_request():
+                return
+            try:
+                if not self.rate_limiter.acquire(model):
+                    breaker.release()
+                    return
+                with http_client.post(url, headers=headers, json=data, timeout=15, stream=True) as response:
+                    if response.status_code == 429:
+                        breaker.record_failure()
+                        if attempt < self.retry_attempts - 1:
+                            time.sleep(self.base_delay * (2 ** attempt))
+                            continue
+                        return
+                    response.raise_for_status()
+                    usage = {}
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        chunk = json.loads(line[len("data:"):].strip())
+                        # The last chunk carries the totals for the whole stream
+                        usage = chunk.get("usageMetadata", usage)
+                        for part in chunk.get("candidates", [{}])[0].get("content", {}).get("parts", []):
+                            if part.get("text"):
+                                emitted = True
+                                yield part["text"]
+                breaker.record_success()
+                token_budget.record(endpoint, model, count_tokens(prompt, model),
+                                    usage.get("promptTokenCount"), usage.get("candidatesTokenCount"))
+                return
+            except Exception as e:
+                if not is_provider_failure(e):
+                    # The provider answered; the request itself was bad and retrying won't help
+                    breaker.record_success()
+                    if emitted:
+                        raise
+                    return
+                breaker.record_failure()
+                if emitted:
+                    raise
+                if attempt < self.retry_attempts - 1:
+                    time.sleep(self.base_delay * (2 ** attempt))
+                    continue
+                return
+
 gemini_api = RateLimitedGeminiAPI(GEMINI_API_KEY, model="gemini-1.5-pro-latest")
 gemini_flash_api = RateLimitedGeminiAPI(GEMINI_API_KEY, model="gemini-1.5-flash")
 
-def call_gemini_api(prompt, use_github_api=True, model_override=None):
-    if use_github_api and client and github_token:
+GITHUB_MODEL = "openai/gpt-4o"
+GITHUB_TEMPERATURE = 0.8
+GITHUB_SYSTEM_PROMPT = "You are a helpful AI assistant that creates educational content and answers questions. Always include at least one diagram or visual explanation in the output."
+
+# Register breakers up front so /metrics lists every provider in the chain
+for provider_name in ("github", f"gemini:{gemini_api.model}", f"gemini:{gemini_flash_api.model}"):
+    circuit_breakers.get(provider_name)
+
+def call_github_api(prompt, endpoint="default"):
+    breaker = circuit_breakers.get("github")
+    if not breaker.allow_request():
+        return None
+    try:
+        response = client.chat.completions.create(
+            messages=[
+                {
+                    "role": "system",
+                    "content": GITHUB_SYSTEM_PROMPT,
+                },
+                {
+                    "role": "user",
+                    "content": prompt,
+                }
+            ],
+            model=GITHUB_MODEL,
+            temperature=GITHUB_TEMPERATURE,
+            max_tokens=1800,
+            top_p=1
+        )
+    except Exception as e:
+        if is_provider_failure(e):
+            breaker.record_failure()
+        else:
+            # The provider answered; the request itself was bad
+            breaker.record_success()
+        return None
+    breaker.record_success()
+    try:
+        usage = getattr(response, 'usage', None)
+        token_budget.record(endpoint, GITHUB_MODEL, count_tokens(GITHUB_SYSTEM_PROMPT + prompt, GITHUB_MODEL),
+                            getattr(usage, 'prompt_tokens', None), getattr(usage, 'completion_tokens', None))
+        return response.choices[0].message.content
+    except (AttributeError, IndexError, TypeError) as e:
+        print(f"⚠️ GitHub Models returned no usable text: {e!r}")
+        return None
+
+def call_gemini_api(prompt, use_github_api=True, model_override=None, use_cache=True, endpoint="default"):
+    # GitHub Models rejects prompts over its input limit; don't spend a round trip finding out
+    use_github = bool(use_github_api and client and github_token) and token_budget.fits_model(
+        count_tokens(GITHUB_SYSTEM_PROMPT + prompt, GITHUB_MODEL), GITHUB_MODEL)
+    api = gemini_flash_api if model_override == "flash" else gemini_api
+    gemini_model = "gemini-1.5-flash" if model_override == "flash" else api.model
+    github_key = make_cache_key("github", GITHUB_MODEL, prompt, GITHUB_TEMPERATURE)
+    gemini_key = make_cache_key("gemini", gemini_model, prompt, None)
+    if use_cache:
+        # Any provider in the fallback chain that already answered this prompt wins
+        cached = llm_cache.get_any(([github_key] if use_github else []) + [gemini_key])
+        if cached is not None:
+            return cached
+    else:
+        llm_cache.record_bypass()
+
+    def generate():
+        if use_github:
+            # Hedged race: Gemini starts if GitHub has not answered within its p95 latency
+            provider, result = llm_hedger.race(
+                ("github", lambda: call_github_api(prompt, endpoint)),
+                ("gemini", lambda: api.generate(prompt, gemini_model, endpoint)),
+            )
+            if result:
+                llm_cache.set(github_key if provider == "github" else gemini_key, result)
+            return result
+        result = api.generate(prompt, gemini_model, endpoint)
+        if result:
+            llm_cache.set(gemini_key, result)
+        return result
+
+    # Identical prompts already in flight share one provider call
+    flight_key = make_cache_key("chain", gemini_model, prompt, use_github)
+    try:
+        return llm_flight.do(flight_key, generate)
+    except SingleFlightTimeout:
+        return generate()
+
+def stream_gemini_api(prompt, use_github_api=True, model_override=None, use_cache=True, endpoint="default"):
+    """Streaming variant of call_gemini_api with the same fallback chain.
+
+    Yields ("token", text) events, plus ("reset", None) when a provider fails
+    mid-stream and the next one starts over, so the text after the last reset
+    is exactly what call_gemini_api would have returned.
+    """
+    github_prompt_tokens = count_tokens(GITHUB_SYSTEM_PROMPT + prompt, GITHUB_MODEL)
+    use_github = bool(use_github_api and client and github_token) and token_budget.fits_model(
+        github_prompt_tokens, GITHUB_MODEL)
+    api = gemini_flash_api if model_override == "flash" else gemini_api
+    gemini_model = "gemini-1.5-flash" if model_override == "flash" else api.model
+    github_key = make_cache_key("github", GITHUB_MODEL, prompt, GITHUB_TEMPERATURE)
+    gemini_key = make_cache_key("gemini", gemini_model, prompt, None)
+    if use_cache:
+        cached = llm_cache.get_any(([github_key] if use_github else []) + [gemini_key])
+        if cached is not None:
+            yield ("token", cached)
+            return
+    else:
+        llm_cache.record_bypass()
+    github_breaker = circuit_breakers.get("github")
+    if use_github and github_breaker.allow_request():
+        parts = []
         try:
-            response = client.chat.completions.create(
+            stream = client.chat.completions.create(
                 messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful AI assistant that creates educational content and answers questions. Always include at least one diagram or visual explanation in the output.",
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt,
-                    }
+                    {"role": "system", "content": GITHUB_SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt},
                 ],
-                model="openai/gpt-4o",
-                temperature=0.8,
+                model=GITHUB_MODEL,
+                temperature=GITHUB_TEMPERATURE,
                 max_tokens=1800,
-                top_p=1
+                top_p=1,
+                stream=True
             )
-            return response.choices[0].message.content
-        except Exception:
-            pass
-    api = gemini_flash_api if model_override == "flash" else gemini_api
-    return api.call_gemini_api(prompt, model_override="gemini-1.5-flash" if model_override == "flash" else None)
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield ("token", delta)
+            github_breaker.record_success()
+            if parts:
+                # This client version can't request usage on streams; count the completion locally
+                token_budget.record(endpoint, GITHUB_MODEL, github_prompt_tokens,
+                                    completion_tokens=count_tokens("".join(parts), GITHUB_MODEL))
+                llm_cache.set(github_key, "".join(parts))
+                return
+        except Exception as e:
+            if is_provider_failure(e):
+                github_breaker.record_failure()
+            else:
+                # The provider answered; the request itself was bad
+                github_breaker.record_success()
+        if parts:
+            yield ("reset", None)
+    parts = []
+    try:
+        for delta in api.stream_generate(prompt, gemini_model, endpoint):
+            parts.append(delta)
+            yield ("token", delta)
+    except Exception:
+        yield ("reset", None)
+        return
+    if parts:
+        llm_cache.set(gemini_key, "".join(parts))
 
 def build_prompt_with_heading_and_diagram(title, content, icon="📘"):
     return (
@@ -145,16 +389,61 @@ def build_prompt_with_heading_and_diagram(title, content, icon="📘"):
         f"Content to answer: {content}\n"
     )
 
-def process_with_gemini(text, use_github_api=True):
-    summary_title = "AI Answer"
-    prompt = build_prompt_with_heading_and_diagram(summary_title, text, "📘")
-    result = call_gemini_api(prompt, use_github_api=use_github_api, model_override="flash")
-    if result is None:
-        result = gemini_flash_api.call_gemini_api(prompt, model_override="gemini-1.5-flash")
-    
-    # Fallback response when API keys are not configured
-    if result is None:
-        return f"""## 📘 {summary_title}
+PROMPT_SCAFFOLD_TOKENS = 600  # instructions wrapped around the content in our prompt builders
+
+def prompt_text(text):
+    """Extracted text as it goes into a prompt: page breaks (form feeds) become newlines"""
+    return text.replace(PAGE_BREAK, "\n") if text else text
+
+def build_map_prompt(chunk):
+    return (
+        "You are summarizing one section of a larger study document.\n"
+        "Write a dense summary of this section as bullet points. Keep every definition, formula, "
+        "acronym, name, date and worked example; drop filler and repetition.\n\n"
+        f"Section:\n{prompt_text(chunk)}\n"
+    )
+
+def content_token_limit(endpoint):
+    """Tokens of content an endpoint's prompt can hold next to its instructions"""
+    return token_budget.budget(endpoint) - PROMPT_SCAFFOLD_TOKENS
+
+def condense_content(text, use_github_api=True, use_cache=True, endpoint="process_content", report=None):
+    """Map step for large inputs: returns text that fits the endpoint's token budget.
+
+    If `report` is a dict it is filled with what happened to the text, so the
+    response can say when part of the document had to be cut.
+    """
+    token_limit = content_token_limit(endpoint)
+    map_reduced = summarizer.needs_map_reduce(text, token_limit)
+    condensed = summarizer.condense(
+        text,
+        # Chunks are sized to the map budget (see `summarizer` below), so map input is never trimmed
+        lambda chunk: call_gemini_api(build_map_prompt(chunk), use_github_api=use_github_api,
+                                      model_override="flash", use_cache=use_cache, endpoint="map"),
+        token_limit=token_limit
+    )
+    condensed = prompt_text(condensed)
+    # Map-reduce stops after max_rounds rounds; whatever is still over budget is trimmed
+    fitted = token_budget.fit(condensed, endpoint, reserve=PROMPT_SCAFFOLD_TOKENS)
+    if report is not None:
+        report.update(condense_report(map_reduced, condensed, fitted))
+    return fitted
+
+def condense_report(map_reduced, condensed, fitted):
+    """Response fields describing how the content was condensed before prompting"""
+    truncated = fitted != condensed
+    report = {'map_reduced': map_reduced, 'content_truncated': truncated}
+    if truncated:
+        report['truncation'] = {
+            'condensed_tokens': count_tokens(condensed),
+            'kept_tokens': count_tokens(fitted),
+            'message': 'The document was too long to summarize in full; its end was left out.',
+        }
+    return report
+
+def demo_answer(text, summary_title="AI Answer"):
+    """Fallback response when API keys are not configured"""
+    return f"""## 📘 {summary_title}
 
 **Demo Mode - API Keys Not Configured**
 
@@ -173,12 +462,22 @@ Here's a sample educational response about: "{text[:100]}..."
 4. **Review** - Test your knowledge with assessments
 
 *Note: Configure your API keys in the backend/.env file to unlock full AI-powered responses.*"""
+
+def process_with_gemini(text, use_github_api=True, use_cache=True, report=None):
+    summary_title = "AI Answer"
+    prompt = build_prompt_with_heading_and_diagram(
+        summary_title, condense_content(text, use_github_api, use_cache, report=report), "📘")
+    result = call_gemini_api(prompt, use_github_api=use_github_api, model_override="flash", use_cache=use_cache,
+                             endpoint="process_content")
+    
+    # Fallback response when API keys are not configured
+    if result is None:
+        return demo_answer(text, summary_title)
     
     return result
 
-def generate_quiz_with_gemini(text, use_github_api=True):
-    """Generate quiz questions based on the provided text using Gemini AI"""
-    quiz_prompt = f"""You are an expert educational quiz generator. Based on the following content, create a comprehensive quiz with explanations and visual diagrams.
+def build_quiz_prompt(text):
+    return f"""You are an expert educational quiz generator. Based on the following content, create a comprehensive quiz with explanations and visual diagrams.
 
 Content to create quiz from: {text}
 
@@ -212,20 +511,15 @@ Important guidelines:
 - Focus on the most important aspects of the content
 - Vary question difficulty from basic to application level"""
 
-    result = call_gemini_api(quiz_prompt, use_github_api=use_github_api, model_override="flash")
-    if result is None:
-        result = gemini_flash_api.call_gemini_api(quiz_prompt, model_override="gemini-1.5-flash")
-    
-    # Clean up the response format
-    if result:
-        # Remove markdown code blocks around diagrams
-        result = result.replace('```mermaid\n', '').replace('\n```', '')
-        # Remove extra dashes/separators
-        result = result.replace('\n---\n', '\n\n')
-    
-    # Fallback quiz when API keys are not configured
-    if result is None:
-        return f"""**QUIZ START**
+def clean_quiz_response(result):
+    # Remove markdown code blocks around diagrams
+    result = result.replace('```mermaid\n', '').replace('\n```', '')
+    # Remove extra dashes/separators
+    return result.replace('\n---\n', '\n\n')
+
+def demo_quiz(text):
+    """Fallback quiz when API keys are not configured"""
+    return f"""**QUIZ START**
 
 **Question 1:** Based on the content about "{text[:50]}...", what is the main concept being discussed?
 A) A technical process that requires advanced knowledge
@@ -257,12 +551,75 @@ D) Skipping the basics and jumping to advanced concepts
 **QUIZ END**
 
 *Note: These are sample questions. Configure your API keys to get AI-generated quizzes tailored to your specific content.*"""
+
+def generate_quiz_with_gemini(text, use_github_api=True, use_cache=True, report=None):
+    """Generate quiz questions based on the provided text using Gemini AI"""
+    quiz_prompt = build_quiz_prompt(condense_content(text, use_github_api, use_cache, endpoint="quiz", report=report))
+
+    result = call_gemini_api(quiz_prompt, use_github_api=use_github_api, model_override="flash", use_cache=use_cache,
+                             endpoint="quiz")
+    
+    # Clean up the response format
+    if result:
+        result = clean_quiz_response(result)
+    
+    # Fallback quiz when API keys are not configured
+    if result is None:
+        return demo_quiz(text)
     
     return result
 
+def _stream_flash_with_fallback(prompt, use_github_api, use_cache, endpoint):
+    """Stream the chain used by process_with_gemini; yields ("done", text or None) last."""
+    parts = []
+    for kind, value in stream_gemini_api(prompt, use_github_api=use_github_api, model_override="flash",
+                                         use_cache=use_cache, endpoint=endpoint):
+        if kind == "reset":
+            parts = []
+        else:
+            parts.append(value)
+        yield kind, value
+    yield "done", "".join(parts) if parts else None
+
+def stream_process_with_gemini(text, use_github_api=True, use_cache=True, report=None):
+    """Streaming process_with_gemini; the "done" event carries the identical final document."""
+    summary_title = "AI Answer"
+    prompt = build_prompt_with_heading_and_diagram(
+        summary_title, condense_content(text, use_github_api, use_cache, report=report), "📘")
+    for kind, value in _stream_flash_with_fallback(prompt, use_github_api, use_cache, "process_content"):
+        if kind == "done" and value is None:
+            value = demo_answer(text, summary_title)
+            yield "token", value
+        yield kind, value
+
+def stream_quiz_with_gemini(text, use_github_api=True, use_cache=True, report=None):
+    """Streaming generate_quiz_with_gemini; raw tokens are streamed and "done" carries the cleaned quiz."""
+    quiz_prompt = build_quiz_prompt(condense_content(text, use_github_api, use_cache, endpoint="quiz",
+                                                     report=report))
+    for kind, value in _stream_flash_with_fallback(quiz_prompt, use_github_api, use_cache, "quiz"):
+        if kind == "done":
+            value = clean_quiz_response(value) if value else demo_quiz(text)
+        yield kind, value
+
+def sse_event(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def sse_response(events):
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def wants_stream(data):
+    return bool((data or {}).get('stream')) or 'text/event-stream' in request.headers.get('Accept', '')
+
 chat_history = []
-vector_store = None
-CORS(app, resources={r"/*": {"origins": ["http://localhost:3000"], "methods": ["GET", "POST"], "allow_headers": ["Content-Type"]}})
+vector_store = vector_index
+# BM25 hits are resolved to chunk texts through the vector store, so both indexes drop a document together
+vector_store.eviction_listeners.append(bm25_index.remove_document)
+bm25_index.eviction_listeners.append(vector_store.remove_document)
+CORS(app, resources={r"/*": {"origins": ["http://localhost:3000"], "methods": ["GET", "POST"], "allow_headers": ["Content-Type"], "expose_headers": ["X-Audio-Format", "X-Audio-Bytes", "X-Encode-Ms"]}})
 # agent_service = AgentService(api_key=GEMINI_API_KEY)  # Temporarily disabled
 
 
@@ -404,60 +761,52 @@ def award_points(user_id, points, activity_type, description):
     
     return transaction_id
 
-# INITIALIZE THE DATABASE WHEN THE APP STARTS
-print("🚀 Initializing Tayyari.ai backend...")
-init_gamification_db()
-
 DOWNLOADS_DIR = "downloads"
 UPLOAD_FOLDER = "uploads"
 os.makedirs(DOWNLOADS_DIR, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-def download_file(file_url):
+def download_file(file_url, validators=None):
+    """Download file_url into a SpooledPDF (in memory unless large), hashing it on the way.
+
+    Returns (spool, etag, last_modified); spool is None when the server answers
+    304 to the cached validators. Returns None on failure. The caller closes the spool.
+    """
+    spool = None
     try:
-        if file_url.endswith('.pdf'):
-            filename = file_url.split("/")[-1]
-        else:
-            filename = file_url.split("/")[-2] + ".pdf"
-        local_filename = os.path.join(DOWNLOADS_DIR, filename)
-        response = requests.get(file_url, stream=True, timeout=30)
-        response.raise_for_status()
-        with open(local_filename, "wb") as file:
-            for chunk in response.iter_content(chunk_size=8192):
-                file.write(chunk)
-        return local_filename
-    except requests.exceptions.RequestException:
-        return None
+        headers = validators.conditional_headers() if validators else {}
+        with http_client.get(file_url, stream=True, timeout=30, headers=headers) as response:
+            etag = response.headers.get('ETag')
+            last_modified = response.headers.get('Last-Modified')
+            if response.status_code == 304:
+                return None, etag, last_modified
+            response.raise_for_status()
+            spool = SpooledPDF(spill_dir=DOWNLOADS_DIR)
+            for chunk in response.iter_content(chunk_size=65536):
+                if not spool.size:
+                    remember_pdf_verdict(file_url, chunk.lstrip().startswith(b'%PDF'))
+                spool.write(chunk)
+        return spool, etag, last_modified
     except Exception:
+        if spool is not None:
+            spool.close()
         return None
 
-def extract_text_from_pdf(pdf_path):
-    try:
-        try:
-            loader = PyPDFLoader(pdf_path)
-            pages = loader.load()
-            text = "\n".join([page.page_content for page in pages if page.page_content])
-            if text.strip():
-                return text
-        except Exception:
-            pass
-        try:
-            import pdfplumber
-            with pdfplumber.open(pdf_path) as pdf:
-                text_parts = []
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-                if text_parts:
-                    text = "\n".join(text_parts)
-                    text = re.sub(r"(\w+)\s*\n\s*(\w+)", r"\1 \2", text)
-                    return text
-        except Exception:
-            pass
-        return ""
-    except Exception:
-        return ""
+def extract_text_from_pdf(pdf, lineage=None):
+    """Extract text from a path, PDF bytes or a SpooledPDF.
+
+    With a `lineage` (where the document came from, e.g. its URL), pages already
+    extracted from an earlier version of that document are reused.
+    Failures propagate, so callers never cache the text of a failed extraction.
+    """
+    if not lineage:
+        return pdf_extractor.extract(pdf).text
+    result = pdf_extractor.extract(pdf, page_lookup=partial(extraction_cache.get_pages, lineage))
+    extraction_cache.put_pages(lineage, {
+        page.fingerprint: page.text for page in result.pages
+        if page.fingerprint and page.backend != "cached"
+    })
+    return result.text
 
 @app.route('/upload-pdf', methods=['POST'])
 def upload_pdf():
@@ -485,9 +834,69 @@ def upload_pdf():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def split_text_for_rag(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    return text_splitter.split_text(text)
+def split_text_for_rag(text, chunk_size=1000, chunk_overlap=100, page_anchors=1, length_function=len):
+    """Split text (or an iterable of pages) into overlapping paragraph/sentence-aligned chunks.
+
+    By default chunks never cross a page break, so unchanged pages of an edited
+    document produce the same chunks (and reuse their cached embeddings).
+    Sizes are in characters unless `length_function` measures something else (e.g. tokens).
+    """
+    return split_text(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap, page_anchors=page_anchors,
+                      length_function=length_function)
+
+# A map prompt is one chunk plus the map instructions, and must fit the "map" token budget
+MAP_CHUNK_TOKENS = min(MAP_REDUCE_CHUNK_TOKENS, token_budget.budget("map") - count_tokens(build_map_prompt("")))
+summarizer = MapReduceSummarizer(split_text_for_rag, chunk_tokens=MAP_CHUNK_TOKENS, token_counter=count_tokens)
+
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index")
+
+RRF_K = 60  # reciprocal rank fusion damping
+
+def _index_document(text, doc_id):
+    chunks = split_text_for_rag(text)
+    try:
+        bm25_index.add_document(doc_id, chunks)
+    except Exception as e:
+        print(f"⚠️ Could not build keyword index for {doc_id}: {e}")
+    try:
+        vector_store.add_document(text, chunks, doc_id=doc_id)
+    except Exception as e:
+        print(f"⚠️ Could not index document {doc_id}: {e}")
+        bm25_index.remove_document(doc_id)  # its hits would have no chunk text to return
+
+def index_document(text):
+    """Queue text for retrieval indexing and return its document id right away"""
+    if not text or not text.strip():
+        return None
+    doc_id = make_document_id(text)
+    if not (vector_store.has_document(doc_id) and bm25_index.has_document(doc_id)):
+        index_pool.submit(_index_document, text, doc_id)
+    return doc_id
+
+def retrieve_context(doc_id, query, k=RETRIEVAL_TOP_K):
+    """The k chunks of an indexed document most relevant to query, or None if unavailable.
+
+    Keyword (BM25) and dense rankings are merged with reciprocal rank fusion.
+    """
+    if not is_document_id(doc_id) or not query:
+        return None
+    fused = {}
+    rankings = (
+        ('keyword', lambda: [chunk_id for chunk_id, _ in bm25_index.search(doc_id, query, k * 2)]),
+        ('dense', lambda: [hit.chunk_id for hit in vector_store.search(doc_id, query, k * 2)]),
+    )
+    for name, ranking in rankings:
+        try:
+            for rank, chunk_id in enumerate(ranking()):
+                fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (RRF_K + rank + 1)
+        except Exception as e:
+            print(f"⚠️ {name} retrieval failed for {doc_id}: {e}")
+    if not fused:
+        return None
+    best = sorted(sorted(fused, key=fused.get, reverse=True)[:k])
+    passages = vector_store.chunk_texts(doc_id, best)
+    return prompt_text("\n\n".join(passages)) or None
 
 @app.route('/test-github-api', methods=['POST'])
 def test_github_api():
@@ -544,16 +953,79 @@ def process_interaction():
             'error': str(e)
         }), 500
 
-def generate_audio(text):
-    generator = pipeline(
-        text, voice='af_heart',
-        speed=1
-    )
-    all_audio = []
-    for i, (gs, ps, audio) in enumerate(generator):
-        all_audio.append(audio)
-    final_audio = np.concatenate(all_audio)
-    return final_audio
+TTS_SPEED = 1
+# Part of every segment cache key, so upgrading the engine never replays old audio
+TTS_ENGINE_VERSION = os.getenv("TTS_ENGINE_VERSION") or tts_engine.version()
+
+tts_scheduler = TTSScheduler(lang_code=TTS_LANG_CODE, preload_mode=tts_engine.preload_mode)
+
+def synthesize_sentence(sentence, voice, speed):
+    return synthesize_with(tts_engine.get(), sentence, voice, speed)
+
+def iter_audio_segments(text, voice=TTS_VOICE, speed=TTS_SPEED):
+    """Yield float32 audio per sentence in order: cached sentences directly, the rest
+    synthesized in parallel sentence batches by the scheduler"""
+    sentences = list(iter_sentences(text))
+    keys = [make_segment_key(sentence, voice, speed, TTS_LANG_CODE, TTS_ENGINE_VERSION) for sentence in sentences]
+    cached = tts_cache.contains(keys)
+    pending = {}
+    for sentence, key in zip(sentences, keys):
+        if key not in cached:
+            pending.setdefault(key, sentence)
+    synthesized = tts_scheduler.synthesize(list(pending.values()), voice, speed, local=synthesize_sentence)
+    try:
+        for sentence, key in zip(sentences, keys):
+            if pending.pop(key, None) is not None:
+                audio = next(synthesized)
+                tts_cache.put(key, audio)
+            else:
+                audio = tts_cache.get(key)
+                if audio is None:
+                    # Evicted since the lookup
+                    audio = synthesize_sentence(sentence, voice, speed)
+                    tts_cache.put(key, audio)
+            yield splice(audio)
+    finally:
+        synthesized.close()
+
+def encode_audio(text, output):
+    """Whole response body, encoded segment by segment (no full-length float buffer)"""
+    encoder = audio_encoding.encoder(output, streaming=False)
+    try:
+        for audio in iter_audio_segments(text):
+            encoder.write(audio)
+        return encoder.close(), encoder
+    finally:
+        audio_encoding.record(encoder)
+
+def stream_audio(segments, output):
+    """Chunked body: each segment's encoded bytes as soon as the encoder emits them"""
+    encoder = audio_encoding.encoder(output, streaming=True)
+    try:
+        for audio in segments:
+            chunk = encoder.write(audio)
+            if chunk:
+                yield chunk
+        yield encoder.close()
+    except Exception as e:
+        # Headers are already sent; end the stream early rather than emit a JSON error
+        print(f"⚠️ Audio stream aborted: {e}")
+    finally:
+        encoder.close()
+        audio_encoding.record(encoder)
+        print(f"🔊 Streamed {encoder.bytes_out} bytes of {output.format.name} "
+              f"({encoder.audio_seconds:.1f}s audio, {encoder.seconds * 1000:.0f} ms encoding)")
+
+def audio_output():
+    """Negotiated output format: `format` form/query field, else the Accept header"""
+    def field(name):
+        return request.form.get(name) or request.args.get(name)
+    return audio_encoding.negotiate(field('format'), request.headers.get('Accept'),
+                                    quality=field('quality'), sample_rate=field('sample_rate'))
+
+def wants_audio_stream():
+    flag = request.form.get('stream') or request.args.get('stream') or ''
+    return flag.lower() in ('1', 'true', 'yes')
 
 @app.route("/process-text2speech", methods=["POST"])
 def process_text2speech():
@@ -562,56 +1034,85 @@ def process_text2speech():
         file = request.files["pdf"]
         if file.filename == "":
             return jsonify({"error": "No selected file"}), 400
-        filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
         try:
-            with pdfplumber.open(file_path) as pdf:
-                text_parts = []
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_parts.append(page_text)
-                text = " ".join(text_parts)
-            text = re.sub(r"(\w+)\s*\n\s*(\w+)", r"\1 \2", text)
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+            with SpooledPDF(spill_dir=UPLOAD_FOLDER) as spool:
+                for block in iter(lambda: file.stream.read(65536), b""):
+                    spool.write(block)
+                text = extraction_cache.get_text(spool.sha256)
+                if text is None:
+                    text = extract_text_from_pdf(spool, lineage=f"upload:{file.filename}")
+                    extraction_cache.put_text(spool.sha256, text)
         except Exception as e:
-            try:
-                os.remove(file_path)
-            except:
-                pass
             return jsonify({"error": f"Could not extract text from PDF: {str(e)}"}), 400
     else:
         text = request.form.get("text", "").strip()
     if not text:
         return jsonify({"error": "No text provided"}), 400
     try:
-        audio = generate_audio(text)
-        wav_file = io.BytesIO()
-        sf.write(wav_file, audio, 24000, format='WAV')
-        wav_file.seek(0)
-        return send_file(wav_file, mimetype='audio/wav', as_attachment=False)
+        output = audio_output()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # FLAC headers are only complete at the end, so it is always sent buffered
+    if wants_audio_stream() and output.format.streamable:
+        return Response(
+            stream_with_context(stream_audio(iter_audio_segments(text), output)),
+            mimetype=output.format.mimetype,
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Audio-Format": output.format.name}
+        )
+    try:
+        data, encoder = encode_audio(text, output)
+        response = send_file(io.BytesIO(data), mimetype=output.format.mimetype, as_attachment=False)
+        response.headers["X-Audio-Format"] = output.format.name
+        response.headers["X-Audio-Bytes"] = str(encoder.bytes_out)
+        response.headers["X-Encode-Ms"] = str(round(encoder.seconds * 1000))
+        return response
     except Exception as e:
         return jsonify({"error": f"Could not generate audio: {str(e)}"}), 500
 
+PDF_PROBE_TTL = float(os.getenv("PDF_PROBE_TTL", "600"))
+PDF_PROBE_MAX_ENTRIES = int(os.getenv("PDF_PROBE_MAX_ENTRIES", "1024"))
+PDF_PROBE_BYTES = 1024
+_pdf_verdicts = {}  # url -> (is_pdf, expires_at)
+_pdf_verdicts_lock = threading.Lock()
+
+def remember_pdf_verdict(file_url, is_pdf):
+    now = time.time()
+    with _pdf_verdicts_lock:
+        if len(_pdf_verdicts) >= PDF_PROBE_MAX_ENTRIES:
+            for url in [url for url, (_, expires_at) in _pdf_verdicts.items() if expires_at <= now]:
+                del _pdf_verdicts[url]
+            if len(_pdf_verdicts) >= PDF_PROBE_MAX_ENTRIES:
+                _pdf_verdicts.pop(next(iter(_pdf_verdicts)))
+        _pdf_verdicts[file_url] = (is_pdf, now + PDF_PROBE_TTL)
+
+def cached_pdf_verdict(file_url):
+    with _pdf_verdicts_lock:
+        entry = _pdf_verdicts.get(file_url)
+    if entry and entry[1] > time.time():
+        return entry[0]
+    return None
+
 def is_valid_pdf(file_url):
     try:
         if any(domain in file_url.lower() for domain in ['ucarecdn.com', 'drive.google.com', 'dropbox.com']):
             return True
         if file_url.lower().endswith('.pdf'):
             return True
-        response = requests.head(file_url, timeout=10, allow_redirects=True)
-        response.raise_for_status()
-        content_type = response.headers.get('content-type', '').lower()
-        if 'application/pdf' in content_type:
-            return True
-        response = requests.get(file_url, stream=True, timeout=10)
-        response.raise_for_status()
-        first_chunk = next(response.iter_content(chunk_size=4), b'')
-        is_pdf = first_chunk.startswith(b'%PDF')
+        verdict = cached_pdf_verdict(file_url)
+        if verdict is not None:
+            return verdict
+        # One ranged GET gives both the content type and the magic bytes
+        with http_client.get(file_url, stream=True, timeout=10, allow_redirects=True,
+                             headers={'Range': f'bytes=0-{PDF_PROBE_BYTES - 1}'}) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('content-type', '').lower()
+            head = next(response.iter_content(chunk_size=PDF_PROBE_BYTES), b'')
+            if response.status_code == 206:
+                # Drain the (tiny) partial body so the pooled connection is reused by the download
+                for _ in response.iter_content(chunk_size=PDF_PROBE_BYTES):
+                    pass
+        is_pdf = 'application/pdf' in content_type or head.lstrip().startswith(b'%PDF')
+        remember_pdf_verdict(file_url, is_pdf)
         return is_pdf
     except Exception:
         return True
@@ -620,6 +1121,189 @@ def is_valid_pdf(file_url):
 def home():
     return jsonify({"status": "MindFlow backend is running 🚀"})
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness probe: 503 until a preloaded TTS model and the TTS pool have finished warming up"""
+    body = {'tts': tts_engine.stats(), 'tts_pool': tts_scheduler.stats()}
+    if tts_engine.required_for_readiness and not (tts_engine.ready and tts_scheduler.is_ready()):
+        return jsonify(dict(body, ready=False)), 503
+    return jsonify(dict(body, ready=True))
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Expose internal performance counters for monitoring"""
+    return jsonify({
+        'http': http_client.stats(),
+        'rate_limits': gemini_rate_limiter.stats(),
+        'llm_cache': llm_cache.stats(),
+        'hedging': llm_hedger.stats(),
+        'circuit_breakers': circuit_breakers.stats(),
+        'single_flight': {
+            'llm': llm_flight.stats(),
+            'files': file_flight.stats()
+        },
+        'map_reduce': summarizer.stats(),
+        'jobs': job_queue.stats(),
+        'pdf_extraction': pdf_extractor.stats(),
+        'extraction_cache': extraction_cache.stats(),
+        'vector_index': vector_store.stats(),
+        'bm25_index': bm25_index.stats(),
+        'text_cleaning': text_cleaner.stats(),
+        'tokens': token_budget.stats(),
+        'tts_cache': tts_cache.stats(),
+        'tts_scheduler': tts_scheduler.stats(),
+        'tts_engine': tts_engine.stats(),
+        'audio_encoding': audio_encoding.stats()
+    })
+
+class ContentProcessingError(Exception):
+    """Raised while gathering request content; carries the JSON error payload"""
+    def __init__(self, payload, status_code=400):
+        super().__init__(payload.get('error'))
+        self.payload = payload
+        self.status_code = status_code
+
+FILE_WORKERS = int(os.getenv("FILE_WORKERS", "4"))
+file_pool = ThreadPoolExecutor(max_workers=FILE_WORKERS, thread_name_prefix="file")
+
+class FileDownloadError(Exception):
+    """Raised when a file URL could not be downloaded"""
+
+class NotAPDFError(Exception):
+    """Raised when a file URL does not point at a PDF"""
+
+def download_and_extract(file_url):
+    """Download one PDF and return its text, skipping extraction for content already cached.
+
+    A PDF that can't be extracted (e.g. corrupt past its header) yields "", so the
+    request goes on without it; nothing is cached for it, so a later request tries again.
+    """
+    validators = extraction_cache.lookup_url(file_url)
+    # A URL we have never extracted is probed with one ranged GET, so a non-PDF is
+    # rejected after ~1 KB instead of a full download and a failed parse
+    if validators is None and not is_valid_pdf(file_url):
+        raise NotAPDFError(file_url)
+    download = download_file(file_url, validators)
+    if download is None:
+        raise FileDownloadError(file_url)
+    spool, etag, last_modified = download
+    if spool is None:
+        # 304: the bytes we extracted last time are still current
+        extraction_cache.record_not_modified()
+        text = extraction_cache.get_text(validators.sha256)
+        if text is not None:
+            extraction_cache.touch_url(file_url)
+            return text
+        download = download_file(file_url)
+        if download is None or download[0] is None:
+            raise FileDownloadError(file_url)
+        spool, etag, last_modified = download
+    with spool:
+        text = extraction_cache.get_text(spool.sha256)
+        if text is None:
+            try:
+                text = extract_text_from_pdf(spool, lineage=f"url:{file_url}")
+            except Exception as e:
+                print(f"⚠️ Skipping {file_url}: text extraction failed: {e!r}")
+                return ""
+            extraction_cache.put_text(spool.sha256, text)
+        extraction_cache.remember_url(file_url, spool.sha256, etag, last_modified)
+        return text
+
+def gather_content_text(notes, files, progress=None):
+    """Download and extract every file, returning notes and file text joined in order.
+
+    Running headers/footers and paragraphs duplicated across the request are removed first.
+    """
+    all_text = []
+    has_pages = []
+    if notes and notes.strip():
+        all_text.append(notes.strip())
+        has_pages.append(False)
+    entries = [(i, file_url.strip()) for i, file_url in enumerate(files or []) if file_url and file_url.strip()]
+    if entries:
+        if progress:
+            progress("downloading", files=len(files))
+        # Concurrent requests for the same URL share one download and extraction
+        futures = [
+            (i, file_url, file_pool.submit(file_flight.do, file_url, partial(download_and_extract, file_url)))
+            for i, file_url in entries
+        ]
+        try:
+            # Results are consumed in file order, so text order and the reported error match the sequential loop
+            for i, file_url, future in futures:
+                try:
+                    text = future.result()
+                except FileDownloadError:
+                    raise ContentProcessingError({
+                        'error': f'Could not download file {i+1}. Please check the URL: {file_url}'
+                    })
+                except NotAPDFError:
+                    raise ContentProcessingError({
+                        'error': f'File {i+1} is not a PDF. Please check the URL: {file_url}'
+                    })
+                except Exception as e:
+                    raise ContentProcessingError({
+                        'error': f'Could not extract text from PDF {i+1}: {str(e)}'
+                    })
+                if progress:
+                    progress("extracted", file=i + 1, files=len(files))
+                if text and text.strip():
+                    all_text.append(text.strip())
+                    has_pages.append(True)
+        finally:
+            for _, _, future in futures:
+                future.cancel()
+    if all_text:
+        all_text, report = text_cleaner.clean(all_text, has_pages)
+        all_text = [text for text in all_text if text]
+        if progress:
+            progress("cleaned", **report.to_dict())
+    if not all_text:
+        raise ContentProcessingError({
+            'error': 'No content to process. Please provide PDF files with readable text or add notes.',
+            'debug_info': {
+                'files_received': len(files),
+                'notes_length': len(notes) if notes else 0,
+                'text_extracted': len(all_text)
+            }
+        })
+    return "\n\n".join(all_text)
+
+def stream_process_content(notes, files, mode, use_cache=True):
+    """SSE body for /process-content: status, token and reset events, then a final done event"""
+    yield sse_event("status", {"stage": "started"})
+    try:
+        combined_text = gather_content_text(notes, files)
+    except ContentProcessingError as e:
+        yield sse_event("error", {**e.payload, "status_code": e.status_code})
+        return
+    document_id = index_document(combined_text)
+    yield sse_event("status", {"stage": "extracted", "content_length": len(combined_text)})
+    condensing = {}
+    if mode == 'quiz':
+        events = stream_quiz_with_gemini(combined_text, use_cache=use_cache, report=condensing)
+    else:
+        events = stream_process_with_gemini(combined_text, use_cache=use_cache, report=condensing)
+    for kind, value in events:
+        if kind == "token":
+            yield sse_event("token", {"text": value})
+        elif kind == "reset":
+            yield sse_event("reset", {})
+        else:
+            yield sse_event("done", {
+                'response': value,
+                'status': 'success',
+                'mode': mode,
+                'document_id': document_id,
+                **condensing,
+                'debug_info': {
+                    'content_length': len(combined_text),
+                    'files_processed': len(files),
+                    'had_notes': bool(notes and notes.strip())
+                }
+            })
+
 @app.route('/process-content', methods=['POST'])
 def process_content():
     try:
@@ -629,6 +1313,7 @@ def process_content():
         notes = data.get('notes', '')
         files = data.get('files', [])
         mode = data.get('mode', 'learn')  # 'learn' or 'quiz'
+        use_cache = not data.get('bypass_cache', False)
         
         if not files and not notes.strip():
             return jsonify({
@@ -638,49 +1323,33 @@ def process_content():
                     'received_notes_length': len(notes) if notes else 0
                 }
             }), 400
-        all_text = []
-        if notes and notes.strip():
-            all_text.append(notes.strip())
-        if files and len(files) > 0:
-            for i, file_url in enumerate(files):
-                if not file_url or not file_url.strip():
-                    continue
-                file_url = file_url.strip()
-                local_file = download_file(file_url)
-                if not local_file:
-                    return jsonify({
-                        'error': f'Could not download file {i+1}. Please check the URL: {file_url}'
-                    }), 400
-                try:
-                    text = extract_text_from_pdf(local_file)
-                    if text and text.strip():
-                        all_text.append(text.strip())
-                except Exception as e:
-                    return jsonify({
-                        'error': f'Could not extract text from PDF {i+1}: {str(e)}'
-                    }), 400
-                finally:
-                    try:
-                        if local_file and os.path.exists(local_file):
-                            os.remove(local_file)
-                    except Exception:
-                        pass
-        if not all_text:
+        if data.get('async'):
+            try:
+                job_id = job_queue.submit('process_content', {
+                    'notes': notes, 'files': files, 'mode': mode, 'use_cache': use_cache
+                })
+            except QueueFullError:
+                return jsonify({'error': 'Too many jobs queued. Please try again shortly.'}), 503
             return jsonify({
-                'error': 'No content to process. Please provide PDF files with readable text or add notes.',
-                'debug_info': {
-                    'files_received': len(files),
-                    'notes_length': len(notes) if notes else 0,
-                    'text_extracted': len(all_text)
-                }
-            }), 400
-        combined_text = "\n\n".join(all_text)
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/jobs/{job_id}',
+                'events_url': f'/jobs/{job_id}/events'
+            }), 202
+        if wants_stream(data):
+            return sse_response(stream_process_content(notes, files, mode, use_cache=use_cache))
+        try:
+            combined_text = gather_content_text(notes, files)
+        except ContentProcessingError as e:
+            return jsonify(e.payload), e.status_code
+        document_id = index_document(combined_text)
         
         # Choose processing method based on mode
+        condensing = {}
         if mode == 'quiz':
-            processed_content = generate_quiz_with_gemini(combined_text)
+            processed_content = generate_quiz_with_gemini(combined_text, use_cache=use_cache, report=condensing)
         else:
-            processed_content = process_with_gemini(combined_text)
+            processed_content = process_with_gemini(combined_text, use_cache=use_cache, report=condensing)
             
         if not processed_content:
             return jsonify({
@@ -690,6 +1359,8 @@ def process_content():
             'response': processed_content,
             'status': 'success',
             'mode': mode,
+            'document_id': document_id,
+            **condensing,
             'debug_info': {
                 'content_length': len(combined_text),
                 'files_processed': len(files),
@@ -704,6 +1375,89 @@ def process_content():
             'technical_error': str(e)
         }), 500
 
+def run_process_content_job(payload, progress):
+    """Background version of /process-content; returns the same response body"""
+    notes = payload.get('notes', '')
+    files = payload.get('files', [])
+    mode = payload.get('mode', 'learn')
+    use_cache = payload.get('use_cache', True)
+    combined_text = gather_content_text(notes, files, progress=progress)
+    document_id = index_document(combined_text)
+    # Condensing happens once, inside the generator, under the mode's own token budget
+    endpoint = "quiz" if mode == 'quiz' else "process_content"
+    progress("chunked", content_length=len(combined_text),
+             map_reduce=summarizer.needs_map_reduce(combined_text, content_token_limit(endpoint)))
+    condensing = {}
+    if mode == 'quiz':
+        processed_content = generate_quiz_with_gemini(combined_text, use_cache=use_cache, report=condensing)
+    else:
+        processed_content = process_with_gemini(combined_text, use_cache=use_cache, report=condensing)
+    if not processed_content:
+        raise ContentProcessingError({'error': 'AI processing failed. Please try again.'}, status_code=503)
+    progress("generated", response_length=len(processed_content))
+    return {
+        'response': processed_content,
+        'status': 'success',
+        'mode': mode,
+        'document_id': document_id,
+        **condensing,
+        'debug_info': {
+            'content_length': len(combined_text),
+            'files_processed': len(files),
+            'had_notes': bool(notes and notes.strip())
+        }
+    }
+
+job_queue = JobQueue()
+job_queue.register('process_content', run_process_content_job)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+JOB_EVENTS_MAX_SECONDS = float(os.getenv("JOB_EVENTS_MAX_SECONDS", "60"))
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream job progress as SSE until the job finishes.
+
+    A stream ends after JOB_EVENTS_MAX_SECONDS even if the job has not, so one
+    client never holds a worker thread for a whole job; EventSource reconnects
+    by itself and picks up the job's current state.
+    """
+    if not job_queue.get(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+
+    def events():
+        last_seen = None
+        deadline = time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        yield "retry: 1000\n\n"
+        while time.monotonic() < deadline:
+            job = job_queue.get(job_id)
+            if job is None:
+                yield sse_event("error", {'error': 'Job not found'})
+                return
+            state = (job['status'], job['stage'], json.dumps(job['progress'], sort_keys=True))
+            if state != last_seen:
+                last_seen = state
+                yield sse_event("progress", {k: job[k] for k in ('job_id', 'status', 'stage', 'progress')})
+            if job['status'] in FINISHED_STATES:
+                yield sse_event("done", job)
+                return
+            time.sleep(0.5)
+
+    return sse_response(events())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify({'job_id': job_id, 'status': status})
+
 @app.route("/get-summary", methods=["GET"])
 def get_summary():
     # summary = agent_service.get_session_summary()  # Temporarily disabled
@@ -729,14 +1483,37 @@ def transcribe():
     os.remove(temp_file)  
     return jsonify({"text": text})
 
+def stream_explain_more(prompt):
+    """SSE body for /explain-more; the done event matches the JSON response"""
+    parts = []
+    for kind, value in stream_gemini_api(prompt, model_override=None, endpoint="explain_more"):
+        if kind == "reset":
+            parts = []
+            yield sse_event("reset", {})
+        else:
+            parts.append(value)
+            yield sse_event("token", {"text": value})
+    if not parts:
+        yield sse_event("error", {'error': 'Failed to get response from AI APIs', 'status_code': 500})
+        return
+    yield sse_event("done", {'response': "".join(parts), 'status': 'success'})
+
 @app.route('/explain-more', methods=['POST'])
 def explain_more():
     try:
         data = request.json
         question = data.get('question')
         context = data.get('context', '')
+        document_id = data.get('document_id')
+        if document_id and not is_document_id(document_id):
+            return jsonify({'error': 'Invalid document_id'}), 400
+        # With a document_id only the passages relevant to the question are sent, not the whole context
+        context = retrieve_context(document_id, question or context) or context
+        context = token_budget.fit(context, "explain_more", reserve=PROMPT_SCAFFOLD_TOKENS)
         prompt = build_prompt_with_heading_and_diagram("More About This Topic", context, "🤔")
-        response_text = call_gemini_api(prompt, model_override=None)
+        if wants_stream(data):
+            return sse_response(stream_explain_more(prompt))
+        response_text = call_gemini_api(prompt, model_override=None, endpoint="explain_more")
         if not response_text:
             return jsonify({'error': 'Failed to get response from AI APIs'}), 500
         return jsonify({'response': response_text, 'status': 'success'})
@@ -749,6 +1526,12 @@ def interactive_questions():
         data = request.json
         context = data.get('context', '')
         user_id = data.get('user_id')  # Add this line
+        topic = context
+        document_id = data.get('document_id')
+        if document_id and not is_document_id(document_id):
+            return jsonify({'error': 'Invalid document_id'}), 400
+        context = retrieve_context(document_id, data.get('question') or context) or context
+        context = token_budget.fit(context, "interactive_questions", reserve=PROMPT_SCAFFOLD_TOKENS)
         
         prompt = (
             "You are an educational quiz generator.\n"
@@ -771,7 +1554,7 @@ def interactive_questions():
             f"Topic: {context}\n"
         )
 
-        response_text = call_gemini_api(prompt, model_override="flash")
+        response_text = call_gemini_api(prompt, model_override="flash", endpoint="interactive_questions")
 
         try:
             questions = json.loads(response_text)
@@ -789,7 +1572,7 @@ def interactive_questions():
             points_service.award_content_upload_points(
                 user_id=user_id,
                 content_type="Quiz Generation",
-                content_name=context[:50] + "..." if len(context) > 50 else context
+                content_name=topic[:50] + "..." if len(topic) > 50 else topic
             )
 
         return jsonify({'questions': questions, 'status': 'success'})
@@ -980,6 +1763,37 @@ def get_leaderboard():
         print(f"❌ Error getting leaderboard: {e}")
         return jsonify({'error': str(e)}), 500
 
+_services_pid = None  # process that started the services below
+_services_lock = threading.Lock()
+
+def start_worker_services():
+    """Start everything that belongs to one serving process, exactly once per process.
+
+    Nothing here runs at import: gunicorn calls this from post_worker_init (after
+    fork, so a preloading master never owns pools or threads), `python app.py`
+    calls it below, and any other runner (`flask run`, another WSGI server) gets
+    it from the first request. Processes that merely import this module, such as
+    TTS pool workers re-importing `__main__` under spawn, start nothing.
+    """
+    global _services_pid
+    with _services_lock:
+        if _services_pid == os.getpid():
+            return
+        print("🚀 Initializing Tayyari.ai backend...")
+        init_gamification_db()
+        tts_engine.start()
+        tts_scheduler.start()
+        job_queue.start()
+        _services_pid = os.getpid()
+
+@app.before_request
+def ensure_worker_services():
+    if _services_pid != os.getpid():
+        start_worker_services()
+
 if __name__ == "__main__":
+    # With the reloader, the first process only watches files; the child it starts serves
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_worker_services()
     print("🚀 Starting Tayyari.ai backend with gamification on http://localhost:5000...")
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
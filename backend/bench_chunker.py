@@ -0,0 +1,86 @@
+"""Compare services.chunker against langchain's RecursiveCharacterTextSplitter.
+
+Usage: python bench_chunker.py [path/to/text.txt] [--size-mb 4] [--repeat 3]
+
+Without a path a synthetic multi-page document is generated. Reports chunk
+count, throughput (MB/s) and peak traced memory for each splitter.
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from services.chunker import iter_chunks, split_text
+
+WORDS = ("photosynthesis chlorophyll mitochondria membrane enzyme substrate newton force acceleration "
+         "momentum derivative integral matrix eigenvalue vector theorem proof lemma equation").split()
+
+
+def synthetic_pages(size_mb, seed=0):
+    rng = random.Random(seed)
+    pages, size = [], 0
+    while size < size_mb * 1024 * 1024:
+        paragraphs = []
+        for _ in range(rng.randint(3, 8)):
+            sentences = (" ".join(rng.choice(WORDS) for _ in range(rng.randint(6, 30))).capitalize() + "."
+                         for _ in range(rng.randint(2, 9)))
+            paragraphs.append(" ".join(sentences))
+        page = "\n\n".join(paragraphs)
+        pages.append(page)
+        size += len(page)
+    return pages
+
+
+def measure(name, fn, text_mb, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = fn()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<34} chunks={count:<7} {text_mb / best:8.1f} MB/s  peak={peak / 1024 / 1024:8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", nargs="?")
+    parser.add_argument("--size-mb", type=float, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    args = parser.parse_args()
+
+    if args.path:
+        with open(args.path, encoding="utf-8") as f:
+            pages = [f.read()]
+    else:
+        pages = synthetic_pages(args.size_mb)
+    text = "\n".join(pages)
+    text_mb = len(text) / 1024 / 1024
+    print(f"{text_mb:.1f} MB, {len(pages)} page(s), chunk_size={args.chunk_size}, overlap={args.chunk_overlap}\n")
+
+    size, overlap = args.chunk_size, args.chunk_overlap
+    measure("chunker.split_text (joined text)", lambda: len(split_text(text, size, overlap)), text_mb, args.repeat)
+    measure("chunker.iter_chunks (page stream)", lambda: sum(1 for _ in iter_chunks(iter(pages), size, overlap)),
+            text_mb, args.repeat)
+    try:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+    except ImportError:
+        try:
+            from langchain.text_splitter import RecursiveCharacterTextSplitter
+        except ImportError:
+            print("langchain is not installed; skipping RecursiveCharacterTextSplitter")
+            return
+
+    def langchain_split():
+        return len(RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap).split_text(text))
+
+    measure("RecursiveCharacterTextSplitter", langchain_split, text_mb, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Gunicorn settings, read automatically from the working directory (see Procfile)."""
+
+import os
+
+# SSE and chunked-audio responses hold a request open for as long as the work runs.
+# Threaded workers keep one open stream from blocking every other request on its
+# worker, and their heartbeat does not depend on any one request finishing, so the
+# timeout only catches a wedged worker, not a long stream.
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# TTS_PRELOAD=master loads the TTS model once in the master; forked workers share its
+# pages copy-on-write instead of each loading their own copy
+preload_app = os.getenv("TTS_PRELOAD", "lazy").lower() == "master"
+
+
+def when_ready(server):
+    # In the master, after a preloaded app is imported and before any worker forks
+    if preload_app:
+        from services.tts_engine import tts_engine
+        tts_engine.preload()
+
+
+def post_worker_init(worker):
+    # In each worker once the app is loaded (after fork when preloading): pools, job
+    # recovery and warm-ups belong to the worker; /ready answers 503 until they are warm
+    from app import start_worker_services
+    start_worker_services()
@@ -0,0 +1,298 @@
+"""Output format negotiation and incremental encoding for text-to-speech.
+
+The format comes from a `format` form/query field, or else the request's
+`Accept` header: WAV, FLAC, Ogg/Vorbis or Ogg/Opus, all through soundfile.
+libsndfile sets lossy bitrate through its compression level, so callers pass
+a `quality` between 0 and 1 (per-format defaults suit speech; Opus at the
+default is roughly 32 kbit/s). Audio can also be downsampled to a lower rate
+the codecs support.
+
+Segments are encoded as they arrive. Streamed responses send encoded bytes
+as soon as libsndfile has written them; Ogg pages need no fix-ups, and
+streamed WAV uses the open-ended header from services.audio_stream instead.
+FLAC is not streamable: its header's sample count and seek table are only
+patched at the end, and a FLAC sent before that (total_samples=0) cannot be
+read back by libsndfile, so a FLAC encoder always buffers the whole file.
+Buffered responses get a fully patched file. Output bytes and encode time are
+recorded per format.
+"""
+
+import io
+import os
+import threading
+import time
+from dataclasses import dataclass
+from math import gcd
+from typing import Dict, Optional
+
+import numpy as np
+import soundfile as sf
+
+from services.audio_stream import TTS_SAMPLE_RATE, pcm16_bytes, wav_stream_header
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str
+    container: str
+    subtype: str
+    mimetype: str
+    lossy: bool = False
+    streamable: bool = True
+
+
+FORMATS = {
+    "wav": AudioFormat("wav", "WAV", "PCM_16", "audio/wav"),
+    "flac": AudioFormat("flac", "FLAC", "PCM_16", "audio/flac", streamable=False),
+    "vorbis": AudioFormat("vorbis", "OGG", "VORBIS", "audio/ogg", lossy=True),
+    "opus": AudioFormat("opus", "OGG", "OPUS", "audio/ogg; codecs=opus", lossy=True),
+}
+FORMAT_ALIASES = {"wave": "wav", "ogg": "vorbis"}
+MIME_FORMATS = {
+    "audio/wav": "wav", "audio/wave": "wav", "audio/x-wav": "wav", "audio/vnd.wave": "wav",
+    "audio/flac": "flac", "audio/x-flac": "flac",
+    "audio/ogg": "vorbis", "audio/vorbis": "vorbis",
+    "audio/opus": "opus",
+}
+
+TTS_AUDIO_FORMAT = os.getenv("TTS_AUDIO_FORMAT", "wav")
+# Quality 0..1 for lossy formats (libsndfile compression level = 1 - quality)
+DEFAULT_QUALITY = {
+    "vorbis": float(os.getenv("TTS_VORBIS_QUALITY", "0.4")),
+    "opus": float(os.getenv("TTS_OPUS_QUALITY", "0.1")),
+}
+TTS_FLAC_COMPRESSION = float(os.getenv("TTS_FLAC_COMPRESSION", "0.5"))
+# Rates every format (Opus in particular) can encode, up to the synthesis rate
+SUPPORTED_SAMPLE_RATES = (8000, 12000, 16000, 24000)
+RESAMPLE_TAPS_PER_PHASE = 16
+
+
+@dataclass(frozen=True)
+class AudioOutput:
+    format: AudioFormat
+    sample_rate: int = TTS_SAMPLE_RATE
+    quality: Optional[float] = None
+
+    @property
+    def compression_level(self) -> Optional[float]:
+        if self.format.lossy:
+            quality = DEFAULT_QUALITY[self.format.name] if self.quality is None else self.quality
+            return 1.0 - quality
+        if self.format.name == "flac":
+            return TTS_FLAC_COMPRESSION
+        return None
+
+
+def _accepted_format(accept: str) -> Optional[str]:
+    """Best supported format from an Accept header; None when only wildcards (or nothing) match."""
+    ranked = []
+    for position, entry in enumerate(accept.split(",")):
+        parts = [part.strip().lower() for part in entry.split(";")]
+        params = dict(part.split("=", 1) for part in parts[1:] if "=" in part)
+        try:
+            q = float(params.get("q", "1"))
+        except ValueError:
+            q = 0.0
+        if q > 0 and parts[0]:
+            ranked.append((-q, position, parts[0], params))
+    for _, _, mimetype, params in sorted(ranked):
+        if mimetype in ("audio/*", "*/*"):
+            return None
+        name = MIME_FORMATS.get(mimetype)
+        if name == "vorbis" and params.get("codecs", "").strip('"') == "opus":
+            name = "opus"
+        if name:
+            return name
+    return None
+
+
+def resample(audio: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Rational-factor resampling through a windowed-sinc low-pass filter."""
+    if source_rate == target_rate or not len(audio):
+        return audio
+    divisor = gcd(source_rate, target_rate)
+    up, down = target_rate // divisor, source_rate // divisor
+    taps = RESAMPLE_TAPS_PER_PHASE * max(up, down) + 1
+    cutoff = 1.0 / max(up, down)
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = (cutoff * up * np.sinc(cutoff * n) * np.hamming(taps)).astype(np.float32)
+    stuffed = np.zeros(len(audio) * up, dtype=np.float32)
+    stuffed[::up] = audio
+    return np.convolve(stuffed, kernel, mode="same")[::down]
+
+
+class _StreamSink:
+    """Write-only file object for libsndfile that hands out bytes once they are final.
+
+    Drained bytes are gone, so writes that seek back into them (end-of-file
+    header fix-ups) are dropped.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._base = 0  # file offset of _buffer[0]
+        self._pos = 0
+        self._size = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        written = len(data)
+        start, end = self._pos, self._pos + written
+        if start < self._base:
+            data = data[self._base - start:]
+            start = self._base
+        if data:
+            offset = start - self._base
+            if offset > len(self._buffer):
+                self._buffer.extend(b"\0" * (offset - len(self._buffer)))
+            self._buffer[offset:offset + len(data)] = data
+        self._pos = end
+        self._size = max(self._size, end)
+        return written
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self._size}[whence]
+        self._pos = base + offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = bytes(self._buffer)
+        self._base += len(data)
+        self._buffer.clear()
+        return data
+
+
+class AudioEncoder:
+    """Encodes float32 segments one at a time; `write` and `close` return bytes ready to send."""
+
+    def __init__(self, output: AudioOutput, streaming: bool, source_rate: int = TTS_SAMPLE_RATE):
+        self.output = output
+        self.streaming = streaming and output.format.streamable
+        self.source_rate = source_rate
+        self.bytes_out = 0
+        self.samples_in = 0
+        self.seconds = 0.0
+        self._closed = False
+        self._raw_wav = self.streaming and output.format.name == "wav"
+        self._header_sent = False
+        self._sink = _StreamSink() if self.streaming else io.BytesIO()
+        self._file = None
+        if not self._raw_wav:
+            self._file = sf.SoundFile(self._sink, "w", samplerate=output.sample_rate, channels=1,
+                                      subtype=output.format.subtype, format=output.format.container,
+                                      compression_level=output.compression_level)
+
+    @property
+    def audio_seconds(self) -> float:
+        return self.samples_in / self.source_rate
+
+    def _take(self) -> bytes:
+        data = self._sink.drain() if self.streaming else b""
+        self.bytes_out += len(data)
+        return data
+
+    def write(self, audio: np.ndarray) -> bytes:
+        start = time.perf_counter()
+        self.samples_in += len(audio)
+        audio = resample(audio, self.source_rate, self.output.sample_rate)
+        if self._raw_wav:
+            data = pcm16_bytes(audio)
+            if not self._header_sent:
+                data = wav_stream_header(self.output.sample_rate) + data
+                self._header_sent = True
+            self.bytes_out += len(data)
+        else:
+            self._file.write(audio)
+            data = self._take()
+        self.seconds += time.perf_counter() - start
+        return data
+
+    def close(self) -> bytes:
+        """Flush the encoder; a buffered encoder returns the whole file here."""
+        if self._closed:
+            return b""
+        self._closed = True
+        start = time.perf_counter()
+        data = b""
+        if self._raw_wav:
+            if not self._header_sent:
+                data = wav_stream_header(self.output.sample_rate)
+                self.bytes_out += len(data)
+        else:
+            self._file.close()
+            if self.streaming:
+                data = self._take()
+            else:
+                data = self._sink.getvalue()
+                self.bytes_out += len(data)
+        self.seconds += time.perf_counter() - start
+        return data
+
+
+class AudioEncoding:
+    """Negotiates output formats and aggregates encoded bytes and encode time per format."""
+
+    def __init__(self, default_format: str = TTS_AUDIO_FORMAT):
+        self.default_format = FORMAT_ALIASES.get(default_format, default_format)
+        if self.default_format not in FORMATS:
+            self.default_format = "wav"
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def negotiate(self, requested: Optional[str] = None, accept: Optional[str] = None,
+                  quality: Optional[str] = None, sample_rate: Optional[str] = None) -> AudioOutput:
+        """Output settings from request fields; raises ValueError for values we can't honor."""
+        if requested:
+            name = requested.strip().lower()
+            name = FORMAT_ALIASES.get(name, name)
+            if name not in FORMATS:
+                raise ValueError(f"Unsupported audio format '{requested}'; choose one of {', '.join(FORMATS)}")
+        else:
+            name = (accept and _accepted_format(accept)) or self.default_format
+        rate = TTS_SAMPLE_RATE
+        if sample_rate:
+            try:
+                rate = int(sample_rate)
+            except ValueError:
+                rate = 0
+            if rate not in SUPPORTED_SAMPLE_RATES:
+                raise ValueError(f"sample_rate must be one of {', '.join(map(str, SUPPORTED_SAMPLE_RATES))}")
+        level = None
+        if quality:
+            try:
+                level = float(quality)
+            except ValueError:
+                level = -1.0
+            if not 0.0 <= level <= 1.0:
+                raise ValueError("quality must be a number between 0 and 1")
+        return AudioOutput(FORMATS[name], rate, level)
+
+    def encoder(self, output: AudioOutput, streaming: bool) -> AudioEncoder:
+        return AudioEncoder(output, streaming)
+
+    def record(self, encoder: AudioEncoder):
+        with self._lock:
+            stats = self._stats.setdefault(encoder.output.format.name, {
+                "responses": 0, "streamed": 0, "bytes_out": 0, "encode_seconds": 0.0, "audio_seconds": 0.0,
+            })
+            stats["responses"] += 1
+            stats["streamed"] += int(encoder.streaming)
+            stats["bytes_out"] += encoder.bytes_out
+            stats["encode_seconds"] += encoder.seconds
+            stats["audio_seconds"] += encoder.audio_seconds
+
+    def stats(self):
+        with self._lock:
+            formats = {name: dict(values) for name, values in self._stats.items()}
+        for values in formats.values():
+            seconds = values["audio_seconds"]
+            values["kbps"] = round(values["bytes_out"] * 8 / seconds / 1000, 1) if seconds else None
+            values["encode_seconds"] = round(values["encode_seconds"], 3)
+            values["audio_seconds"] = round(seconds, 1)
+        return {"default_format": self.default_format, "formats": formats}
+
+
+audio_encoding = AudioEncoding()
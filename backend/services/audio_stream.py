@@ -0,0 +1,85 @@
+"""Sentence splitting and incremental WAV framing for text-to-speech output.
+
+Text is split at sentence boundaries (via services.chunker) and every
+sentence is synthesized on its own, so the first audio is ready after one
+sentence and each sentence can be cached by itself. Synthesized audio is
+converted to 16-bit PCM and written straight to the response after a
+streaming WAV header, so only a few sentences are ever held in memory.
+
+Sentences are synthesized (and cached) one at a time, so `splice` evens out
+their joins: edge silence is trimmed to a fixed pad, a few milliseconds are
+faded at each end to avoid clicks, and a constant pause follows every
+sentence, whether its audio came from the cache or the pipeline.
+"""
+
+import os
+import struct
+from typing import Iterator
+
+import numpy as np
+
+from services.chunker import PAGE_BREAK, PARAGRAPH_BREAK, SENTENCE_END, iter_chunks
+
+TTS_SAMPLE_RATE = 24000
+TTS_SENTENCE_CHARS = int(os.getenv("TTS_SENTENCE_CHARS", "250"))
+TTS_SENTENCE_PAUSE_MS = int(os.getenv("TTS_SENTENCE_PAUSE_MS", "150"))
+TTS_EDGE_PAD_MS = 20
+TTS_FADE_MS = 5
+SILENCE_THRESHOLD = 1e-3
+
+STREAMING_SIZE = 0xFFFFFFFF  # "unknown length" for RIFF and data chunk sizes
+
+
+def iter_sentences(text: str) -> Iterator[str]:
+    """Individual sentences; ones longer than TTS_SENTENCE_CHARS are split at lines/words."""
+    for page in PAGE_BREAK.split(text):
+        for paragraph in PARAGRAPH_BREAK.split(page):
+            for sentence in SENTENCE_END.split(paragraph):
+                sentence = " ".join(sentence.split())
+                if not sentence:
+                    continue
+                if len(sentence) <= TTS_SENTENCE_CHARS:
+                    yield sentence
+                else:
+                    yield from iter_chunks(sentence, chunk_size=TTS_SENTENCE_CHARS, chunk_overlap=0)
+
+
+def wav_stream_header(sample_rate: int = TTS_SAMPLE_RATE, channels: int = 1, bits_per_sample: int = 16) -> bytes:
+    """44-byte PCM WAV header with open-ended sizes, for audio of unknown length."""
+    block_align = channels * bits_per_sample // 8
+    return (
+        b"RIFF" + struct.pack("<I", STREAMING_SIZE) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, channels, sample_rate, sample_rate * block_align,
+                                block_align, bits_per_sample)
+        + b"data" + struct.pack("<I", STREAMING_SIZE)
+    )
+
+
+def to_float32(audio) -> np.ndarray:
+    """Mono float32 samples from a pipeline segment (NumPy array or CPU tensor)."""
+    if hasattr(audio, "detach"):
+        audio = audio.detach().cpu().numpy()
+    audio = np.asarray(audio, dtype=np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return audio
+
+
+def pcm16_bytes(audio: np.ndarray) -> bytes:
+    return (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def splice(audio: np.ndarray, sample_rate: int = TTS_SAMPLE_RATE) -> np.ndarray:
+    """Normalize one sentence's edges so consecutive sentences join seamlessly."""
+    voiced = np.flatnonzero(np.abs(audio) > SILENCE_THRESHOLD)
+    if not len(voiced):
+        return np.zeros(sample_rate * TTS_SENTENCE_PAUSE_MS // 1000, dtype=np.float32)
+    pad = sample_rate * TTS_EDGE_PAD_MS // 1000
+    audio = np.array(audio[max(0, voiced[0] - pad):voiced[-1] + 1 + pad], dtype=np.float32)
+    fade = min(sample_rate * TTS_FADE_MS // 1000, len(audio) // 2)
+    if fade:
+        ramp = np.linspace(0.0, 1.0, fade, dtype=np.float32)
+        audio[:fade] *= ramp
+        audio[-fade:] *= ramp[::-1]
+    pause = np.zeros(sample_rate * TTS_SENTENCE_PAUSE_MS // 1000, dtype=np.float32)
+    return np.concatenate([audio, pause])
@@ -0,0 +1,212 @@
+"""BM25 inverted index over document chunks for exact-term retrieval.
+
+Dense vectors blur rare exact terms (formula names, acronyms), so each
+indexed document also gets a lexical index under `bm25_index/<doc_id>/`. The
+postings are stored as flat arrays (CSR layout): `offsets[t]:offsets[t + 1]`
+slices `chunk_ids` / `tfs` for term id `t`. The arrays are saved as `.npy` and
+memory-mapped when a document is first queried, and scoring is vectorised
+per query term. Like the vector index, only valid document ids reach the
+filesystem, and least recently used documents are evicted past
+`BM25_INDEX_MAX_BYTES`. The chunk texts live in the vector index; the app
+links both indexes' `eviction_listeners`, so a document evicted from
+either is removed from both.
+"""
+
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from services.vector_index import evict_documents, is_document_id, remove_document_dir, tokenize, touch
+
+BM25_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bm25_index")
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+BM25_OPEN_DOCUMENTS = int(os.getenv("BM25_OPEN_DOCUMENTS", "64"))
+BM25_INDEX_MAX_BYTES = int(os.getenv("BM25_INDEX_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class BM25Builder:
+    """Accumulates postings chunk by chunk; `save` writes the CSR arrays."""
+
+    def __init__(self):
+        self.vocabulary: Dict[str, int] = {}
+        self._postings: List[Tuple[array, array]] = []  # term id -> (chunk ids, term frequencies)
+        self.lengths = array("i")
+
+    def add_chunk(self, text: str) -> int:
+        chunk_id = len(self.lengths)
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            term_id = self.vocabulary.setdefault(term, len(self.vocabulary))
+            if term_id == len(self._postings):
+                self._postings.append((array("i"), array("i")))
+            chunk_ids, tfs = self._postings[term_id]
+            chunk_ids.append(chunk_id)
+            tfs.append(tf)
+        self.lengths.append(sum(counts.values()))
+        return chunk_id
+
+    def save(self, path: str):
+        sizes = np.fromiter((len(ids) for ids, _ in self._postings), dtype=np.int64, count=len(self._postings))
+        offsets = np.zeros(len(sizes) + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        chunk_ids = np.empty(offsets[-1], dtype=np.int32)
+        tfs = np.empty(offsets[-1], dtype=np.int32)
+        for term_id, (ids, counts) in enumerate(self._postings):
+            chunk_ids[offsets[term_id]:offsets[term_id + 1]] = np.frombuffer(ids, dtype=np.int32)
+            tfs[offsets[term_id]:offsets[term_id + 1]] = np.frombuffer(counts, dtype=np.int32)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        np.save(os.path.join(path, "chunk_ids.npy"), chunk_ids)
+        np.save(os.path.join(path, "tfs.npy"), tfs)
+        np.save(os.path.join(path, "lengths.npy"), np.frombuffer(self.lengths, dtype=np.int32))
+        # vocabulary.json is written last: its presence marks a complete index
+        with open(os.path.join(path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+
+
+class _Postings:
+    """One document's memory-mapped postings, loaded on first query."""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "vocabulary.json"), encoding="utf-8") as f:
+            self.vocabulary = json.load(f)
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.chunk_ids = np.load(os.path.join(path, "chunk_ids.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(path, "tfs.npy"), mmap_mode="r")
+        self.lengths = np.asarray(np.load(os.path.join(path, "lengths.npy")), dtype=np.float32)
+        self.average_length = float(self.lengths.mean()) if len(self.lengths) else 0.0
+
+
+class BM25Index:
+    """Per-document BM25 indexes, persisted to disk and loaded lazily."""
+
+    def __init__(self, root: str = BM25_INDEX_DIR, k1: float = BM25_K1, b: float = BM25_B,
+                 open_documents: int = BM25_OPEN_DOCUMENTS, max_bytes: int = BM25_INDEX_MAX_BYTES):
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        self.open_documents = open_documents
+        self.max_bytes = max_bytes
+        self._open = OrderedDict()  # doc_id -> _Postings
+        self._lock = threading.Lock()
+        self._stats = {"documents_indexed": 0, "chunks_indexed": 0, "already_indexed": 0,
+                       "documents_evicted": 0, "documents_removed": 0, "queries": 0, "postings_scored": 0}
+        self.eviction_listeners: List[Callable[[str], None]] = []
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, doc_id: str) -> str:
+        if not is_document_id(doc_id):
+            raise ValueError(f"Invalid document id {doc_id!r}")
+        return os.path.join(self.root, doc_id)
+
+    def has_document(self, doc_id: str) -> bool:
+        return is_document_id(doc_id) and os.path.exists(os.path.join(self._path(doc_id), "vocabulary.json"))
+
+    def add_document(self, doc_id: str, chunks: Iterable[str]) -> str:
+        """Index chunks as they are produced; chunk ids are their positions in `chunks`."""
+        if self.has_document(doc_id):
+            touch(self._path(doc_id))
+            with self._lock:
+                self._stats["already_indexed"] += 1
+            return doc_id
+        path = self._path(doc_id)
+        builder = BM25Builder()
+        for chunk in chunks:
+            builder.add_chunk(chunk)
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        try:
+            builder.save(staging)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                pass  # another worker indexed the same document first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        evicted = evict_documents(self.root, self.max_bytes, keep=(doc_id,))
+        with self._lock:
+            self._stats["documents_indexed"] += 1
+            self._stats["chunks_indexed"] += len(builder.lengths)
+            self._stats["documents_evicted"] += len(evicted)
+            for evicted_id in evicted:
+                self._open.pop(evicted_id, None)
+        for evicted_id in evicted:
+            for listener in self.eviction_listeners:
+                listener(evicted_id)
+        return doc_id
+
+    def remove_document(self, doc_id: str) -> bool:
+        """Drop one document (e.g. because the vector index evicted it)."""
+        if not is_document_id(doc_id):
+            return False
+        removed = remove_document_dir(self.root, doc_id)
+        with self._lock:
+            self._open.pop(doc_id, None)
+            self._stats["documents_removed"] += int(removed)
+        return removed
+
+    def _postings(self, doc_id: str) -> Optional[_Postings]:
+        if not is_document_id(doc_id):
+            return None
+        touch(self._path(doc_id))
+        with self._lock:
+            postings = self._open.get(doc_id)
+            if postings is not None:
+                self._open.move_to_end(doc_id)
+                return postings
+        if not self.has_document(doc_id):
+            return None
+        postings = _Postings(self._path(doc_id))
+        with self._lock:
+            self._open[doc_id] = postings
+            while len(self._open) > self.open_documents:
+                self._open.popitem(last=False)
+        return postings
+
+    def search(self, doc_id: str, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """Top-k (chunk_id, score) pairs for `query`, best first."""
+        postings = self._postings(doc_id)
+        if postings is None or not len(postings.lengths):
+            return []
+        chunk_count = len(postings.lengths)
+        scores = np.zeros(chunk_count, dtype=np.float32)
+        # Per-chunk length normalisation, shared by every query term
+        norm = self.k1 * (1 - self.b + self.b * postings.lengths / max(postings.average_length, 1e-9))
+        scored = 0
+        for term in set(tokenize(query)):
+            term_id = postings.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = postings.offsets[term_id], postings.offsets[term_id + 1]
+            ids = np.asarray(postings.chunk_ids[start:stop])
+            tfs = np.asarray(postings.tfs[start:stop], dtype=np.float32)
+            df = stop - start
+            idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            scores[ids] += idf * tfs * (self.k1 + 1) / (tfs + norm[ids])
+            scored += df
+        with self._lock:
+            self._stats["queries"] += 1
+            self._stats["postings_scored"] += int(scored)
+        if not scored:
+            return []
+        k = min(k, chunk_count)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(i), float(scores[i])) for i in best if scores[i] > 0]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_documents"] = len(self._open)
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+bm25_index = BM25Index()
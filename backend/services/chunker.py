@@ -0,0 +1,142 @@
+"""Streaming, paragraph- and sentence-aware text chunker.
+
+Drop-in for langchain's `RecursiveCharacterTextSplitter` as used by
+`split_text_for_rag`: chunks are at most `chunk_size` long, consecutive chunks
+share up to `chunk_overlap` of trailing text, and boundaries are preferred in
+the order paragraph > sentence > line > word > character. Unlike the langchain
+splitter it is a generator, accepts an iterable of pages so extracted pages
+never have to be joined first, and measures length with any `length_function`
+(e.g. a tokenizer's token count) instead of only characters.
+
+A string is treated as pages separated by form feeds (how extracted PDF text
+is joined). With `page_anchors`, chunk boundaries are pinned to page breaks:
+every break when it is 1, otherwise content-defined breaks (pages whose hash
+is divisible by it). Editing one page then only changes the chunks up to the
+next anchor, so chunks of unchanged pages keep their cached embeddings and
+summaries.
+"""
+
+import re
+import zlib
+from collections import deque
+from typing import Callable, Iterable, Iterator, Optional, Tuple, Union
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=\S)")
+LINE_BREAK = re.compile(r"\n")
+WORD_BREAK = re.compile(r"\s+")
+
+# (separator regex, joiner used when pieces split by it are merged back)
+LEVELS = ((PARAGRAPH_BREAK, "\n\n"), (SENTENCE_END, " "), (LINE_BREAK, "\n"), (WORD_BREAK, " "))
+PAGE_BREAK = re.compile(r"\f")
+PAGE_JOINER = "\n"
+
+
+def _spans(pattern: re.Pattern, text: str) -> Iterator[str]:
+    """Lazily split `text` on `pattern` without building a list."""
+    start = 0
+    for match in pattern.finditer(text):
+        yield text[start:match.start()]
+        start = match.end()
+    yield text[start:]
+
+
+def _hard_split(text: str, chunk_size: int, length: Callable[[str], int]) -> Iterator[str]:
+    """Cut `text` into consecutive pieces of at most chunk_size, as measured by `length`."""
+    if length is len:
+        for start in range(0, len(text), chunk_size):
+            yield text[start:start + chunk_size]
+        return
+    start = 0
+    while start < len(text):
+        # Longest prefix that fits (lengths grow with the prefix); always at least one character
+        low, high = start + 1, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if length(text[start:middle]) <= chunk_size:
+                low = middle
+            else:
+                high = middle - 1
+        yield text[start:low]
+        start = low
+
+
+def _pieces(text: str, chunk_size: int, length: Callable[[str], int], level: int = 0) -> Iterator[Tuple[str, str]]:
+    """Yield (piece, joiner) pairs where every piece fits in chunk_size.
+
+    `joiner` is what goes between this piece and the previous one.
+    """
+    if level == len(LEVELS):
+        # A single unbreakable run (e.g. a long URL): hard-split into the longest pieces that fit
+        for piece in _hard_split(text, chunk_size, length):
+            yield piece, ""
+        return
+    pattern, joiner = LEVELS[level]
+    for span in _spans(pattern, text):
+        span = span.strip()
+        if not span:
+            continue
+        if length(span) <= chunk_size:
+            yield span, joiner
+            continue
+        first = True
+        for piece, inner_joiner in _pieces(span, chunk_size, length, level + 1):
+            yield piece, joiner if first else inner_joiner
+            first = False
+
+
+def _is_anchor(page: str, page_anchors: Optional[int]) -> bool:
+    if not page_anchors:
+        return False
+    return page_anchors == 1 or zlib.crc32(page.encode("utf-8")) % page_anchors == 0
+
+
+def iter_chunks(pages: Union[str, Iterable[str]], chunk_size: int = 1000, chunk_overlap: int = 100,
+                length_function: Callable[[str], int] = len, page_anchors: Optional[int] = None) -> Iterator[str]:
+    """Yield chunks of `pages` (a string or an iterable of page strings) one at a time."""
+    if chunk_overlap >= chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+    if isinstance(pages, str):
+        pages = _spans(PAGE_BREAK, pages)
+    window = deque()  # (piece, joiner, piece_length)
+    total = 0
+
+    first_page = True
+    for page in pages:
+        page_first_piece = True
+        for piece, joiner in _pieces(page, chunk_size, length_function):
+            if page_first_piece and not first_page:
+                joiner = PAGE_JOINER
+            page_first_piece = False
+            piece_length = length_function(piece)
+            joiner_length = length_function(joiner) if window else 0
+            if window and total + joiner_length + piece_length > chunk_size:
+                yield "".join(_render(window))
+                # Keep a tail of at most chunk_overlap that still leaves room for the new piece
+                while window and (total > chunk_overlap or total + joiner_length + piece_length > chunk_size):
+                    _, _, dropped = window.popleft()
+                    total -= dropped
+                    if window:
+                        total -= length_function(window[0][1])
+                joiner_length = length_function(joiner) if window else 0
+            total += piece_length + joiner_length
+            window.append((piece, joiner, piece_length))
+        first_page = False
+        if window and _is_anchor(page, page_anchors):
+            yield "".join(_render(window))
+            window.clear()
+            total = 0
+    if window:
+        yield "".join(_render(window))
+
+
+def _render(window) -> Iterator[str]:
+    for index, (piece, joiner, _) in enumerate(window):
+        if index:
+            yield joiner
+        yield piece
+
+
+def split_text(pages: Union[str, Iterable[str]], chunk_size: int = 1000, chunk_overlap: int = 100,
+               length_function: Callable[[str], int] = len, page_anchors: Optional[int] = None):
+    return list(iter_chunks(pages, chunk_size, chunk_overlap, length_function, page_anchors))
@@ -0,0 +1,130 @@
+"""Per-provider circuit breakers for the LLM fallback chain.
+
+A breaker is closed while its provider is healthy. After `failure_threshold`
+consecutive failures it opens and every call is skipped immediately for
+`recovery_timeout` seconds. It then turns half-open and lets a limited number
+of trial calls through: one success closes it again, one failure reopens it.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", "3"))
+BREAKER_RECOVERY_TIMEOUT = float(os.getenv("LLM_BREAKER_RECOVERY_TIMEOUT", "30"))
+BREAKER_HALF_OPEN_CALLS = int(os.getenv("LLM_BREAKER_HALF_OPEN_CALLS", "1"))
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker guarding a single provider."""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_timeout: float = BREAKER_RECOVERY_TIMEOUT,
+                 half_open_max_calls: int = BREAKER_HALF_OPEN_CALLS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._half_open_in_flight = 0
+        self._counters = {"successes": 0, "failures": 0, "short_circuited": 0}
+        self.transitions = deque(maxlen=50)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _transition(self, new_state: str):
+        if new_state == self._state:
+            return
+        self.transitions.append({"from": self._state, "to": new_state, "at": time.time()})
+        print(f"⚡ Circuit breaker '{self.name}': {self._state} -> {new_state}")
+        self._state = new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        if new_state != HALF_OPEN:
+            self._half_open_in_flight = 0
+
+    def _maybe_half_open(self):
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._transition(HALF_OPEN)
+
+    def allow_request(self) -> bool:
+        """Whether a call may go out now; False means skip this provider."""
+        with self._lock:
+            self._maybe_half_open()
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._half_open_in_flight < self.half_open_max_calls:
+                self._half_open_in_flight += 1
+                return True
+            self._counters["short_circuited"] += 1
+            return False
+
+    def release(self):
+        """Give back a half-open trial slot for a call that never reached the provider."""
+        with self._lock:
+            if self._state == HALF_OPEN and self._half_open_in_flight > 0:
+                self._half_open_in_flight -= 1
+
+    def record_success(self):
+        with self._lock:
+            self._counters["successes"] += 1
+            self._consecutive_failures = 0
+            self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._counters["failures"] += 1
+            self._consecutive_failures += 1
+            if self._state == HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def snapshot(self):
+        with self._lock:
+            self._maybe_half_open()
+            snapshot = {
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "failure_threshold": self.failure_threshold,
+                "recovery_timeout": self.recovery_timeout,
+                **self._counters,
+            }
+            if self._state == OPEN:
+                snapshot["retry_in"] = round(max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at)), 1)
+            snapshot["transitions"] = list(self.transitions)
+        return snapshot
+
+
+class CircuitBreakerRegistry:
+    """Lazily creates one breaker per provider name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def stats(self):
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,353 @@
+"""Persistent cache of extracted PDF text.
+
+Text is keyed by the SHA-256 of the PDF bytes, so the same file uploaded under
+different URLs is only extracted once. A separate URL index remembers each
+URL's ETag / Last-Modified validators and content hash, which lets downloads
+be made conditional: a 304 (or a hash we have already seen) skips extraction.
+Individual pages are also cached by fingerprint (see services.pdf_extraction)
+within a document lineage: the URL a PDF was downloaded from, or the name it
+was uploaded under. A lightly edited re-upload only extracts the pages that
+changed, and page text is never shared between unrelated documents.
+Stored text is compressed with zstd when `zstandard` is installed, zlib
+otherwise. Document text and page text share one size cap with
+least-recently-used eviction across both; the URL index is capped separately
+by entry count. Triggers keep a running total of the stored bytes, so a write
+only reads one row to know whether anything has to be evicted.
+The database records the extraction format it was written with; a store from
+another `EXTRACTION_FORMAT_VERSION` is emptied on start instead of served.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+from services.pdf_extraction import EXTRACTION_FORMAT_VERSION
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXTRACTION_CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "extraction_cache.db")
+EXTRACTION_CACHE_MAX_BYTES = int(os.getenv("EXTRACTION_CACHE_MAX_BYTES", str(500 * 1024 * 1024)))
+EXTRACTION_CACHE_MAX_URLS = int(os.getenv("EXTRACTION_CACHE_MAX_URLS", "10000"))
+EXTRACTION_CACHE_ZSTD_LEVEL = int(os.getenv("EXTRACTION_CACHE_ZSTD_LEVEL", "3"))
+
+
+@dataclass
+class URLValidators:
+    sha256: str
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ExtractionCache:
+    """SQLite-backed, compressed, size-capped LRU of extracted text."""
+
+    def __init__(self, db_path: str = EXTRACTION_CACHE_DB_PATH, max_bytes: int = EXTRACTION_CACHE_MAX_BYTES,
+                 zstd_level: int = EXTRACTION_CACHE_ZSTD_LEVEL, max_urls: int = EXTRACTION_CACHE_MAX_URLS):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_urls = max_urls
+        self.codec = "zstd" if zstandard is not None else "zlib"
+        self.zstd_level = zstd_level
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "not_modified": 0, "stores": 0, "evictions": 0, "url_evictions": 0,
+                       "raw_bytes_stored": 0, "compressed_bytes_stored": 0,
+                       "page_hits": 0, "page_misses": 0, "page_stores": 0}
+        self.init_database()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        # INSERT OR REPLACE only fires the size triggers for the row it replaces with this on
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS extracted_texts (
+                    sha256 TEXT PRIMARY KEY,
+                    codec TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    raw_size INTEGER NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS url_index (
+                    url TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL,
+                    etag TEXT,
+                    last_modified TEXT,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            # The old page_texts table was shared by every document; its rows can't be attributed to a lineage
+            conn.execute("DROP TABLE IF EXISTS page_texts")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS document_pages (
+                    lineage TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    codec TEXT NOT NULL,
+                    data BLOB NOT NULL,
+                    stored_size INTEGER NOT NULL,
+                    last_access REAL NOT NULL,
+                    PRIMARY KEY (lineage, fingerprint)
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_extracted_texts_access ON extracted_texts (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_document_pages_access ON document_pages (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_url_index_updated ON url_index (updated_at)")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    stored_bytes INTEGER NOT NULL
+                )
+            ''')
+            for table in ("extracted_texts", "document_pages"):
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_size_insert AFTER INSERT ON {table} BEGIN
+                        UPDATE cache_size SET stored_bytes = stored_bytes + new.stored_size WHERE id = 0;
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER IF NOT EXISTS {table}_size_delete AFTER DELETE ON {table} BEGIN
+                        UPDATE cache_size SET stored_bytes = stored_bytes - old.stored_size WHERE id = 0;
+                    END
+                ''')
+            # Text extracted in another format (e.g. another page separator) must not be served
+            if conn.execute("PRAGMA user_version").fetchone()[0] != EXTRACTION_FORMAT_VERSION:
+                for table in ("document_pages", "url_index", "extracted_texts"):
+                    conn.execute(f"DELETE FROM {table}")
+                conn.execute(f"PRAGMA user_version = {EXTRACTION_FORMAT_VERSION}")
+            # Recounted once per start, so rows written before the triggers existed are counted too
+            conn.execute('''
+                INSERT OR REPLACE INTO cache_size (id, stored_bytes)
+                SELECT 0, (SELECT COALESCE(SUM(stored_size), 0) FROM extracted_texts)
+                        + (SELECT COALESCE(SUM(stored_size), 0) FROM document_pages)
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _compress(self, raw: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.zstd_level).compress(raw)
+        return zlib.compress(raw, 6)
+
+    @staticmethod
+    def _decompress(codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise ValueError("zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def get_text(self, sha256: str) -> Optional[str]:
+        """Cached text for a content hash (may be "" for text-less PDFs), or None."""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT codec, data FROM extracted_texts WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None:
+                self._count("misses")
+                return None
+            conn.execute("UPDATE extracted_texts SET last_access = ? WHERE sha256 = ?", (time.time(), sha256))
+            conn.commit()
+        finally:
+            conn.close()
+        try:
+            text = self._decompress(row[0], row[1]).decode("utf-8")
+        except Exception:
+            self._count("misses")
+            return None
+        self._count("hits")
+        return text
+
+    def put_text(self, sha256: str, text: str):
+        raw = text.encode("utf-8")
+        data = self._compress(raw)
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO extracted_texts (sha256, codec, data, raw_size, stored_size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (sha256, self.codec, data, len(raw), len(data), now, now))
+            evicted = self._evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["evictions"] += evicted
+            self._stats["raw_bytes_stored"] += len(raw)
+            self._stats["compressed_bytes_stored"] += len(data)
+
+    def _evict(self, conn) -> int:
+        """Drop least-recently-used documents and pages until both tables together fit max_bytes."""
+        total = conn.execute("SELECT stored_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            # The oldest row of each table comes straight off its last_access index
+            oldest = [row for row in (
+                conn.execute("SELECT last_access, 'extracted_texts', sha256, stored_size FROM extracted_texts "
+                             "ORDER BY last_access ASC LIMIT 1").fetchone(),
+                conn.execute("SELECT last_access, 'document_pages', rowid, stored_size FROM document_pages "
+                             "ORDER BY last_access ASC LIMIT 1").fetchone(),
+            ) if row is not None]
+            if not oldest:
+                break
+            _, table, value, size = min(oldest)
+            if table == "extracted_texts":
+                conn.execute("DELETE FROM extracted_texts WHERE sha256 = ?", (value,))
+                conn.execute("DELETE FROM url_index WHERE sha256 = ?", (value,))
+            else:
+                conn.execute("DELETE FROM document_pages WHERE rowid = ?", (value,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def get_pages(self, lineage: str, fingerprints: Iterable[str]) -> Dict[str, str]:
+        """Cached text for whichever page fingerprints are known in this document lineage."""
+        wanted = list(dict.fromkeys(fingerprints))
+        found = {}
+        conn = self._connect()
+        try:
+            # Stay under SQLite's bound-parameter limit
+            for start in range(0, len(wanted), 500):
+                batch = wanted[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for fingerprint, codec, data in conn.execute(
+                    f"SELECT fingerprint, codec, data FROM document_pages WHERE lineage = ? AND fingerprint IN ({marks})",
+                    (lineage, *batch)
+                ).fetchall():
+                    try:
+                        found[fingerprint] = self._decompress(codec, data).decode("utf-8")
+                    except Exception:
+                        continue
+                conn.execute(
+                    f"UPDATE document_pages SET last_access = ? WHERE lineage = ? AND fingerprint IN ({marks})",
+                    (time.time(), lineage, *batch)
+                )
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats["page_hits"] += len(found)
+            self._stats["page_misses"] += len(wanted) - len(found)
+        return found
+
+    def put_pages(self, lineage: str, pages: Dict[str, str]):
+        if not pages:
+            return
+        now = time.time()
+        rows = []
+        for fingerprint, text in pages.items():
+            data = self._compress(text.encode("utf-8"))
+            rows.append((lineage, fingerprint, self.codec, data, len(data), now))
+        conn = self._connect()
+        try:
+            conn.executemany('''
+                INSERT OR REPLACE INTO document_pages (lineage, fingerprint, codec, data, stored_size, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            evicted = self._evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._stats["page_stores"] += len(rows)
+            self._stats["evictions"] += evicted
+
+    def lookup_url(self, url: str) -> Optional[URLValidators]:
+        """Validators for `url`, only if its text is still cached."""
+        conn = self._connect()
+        try:
+            row = conn.execute('''
+                SELECT u.sha256, u.etag, u.last_modified FROM url_index u
+                JOIN extracted_texts t ON t.sha256 = u.sha256
+                WHERE u.url = ?
+            ''', (url,)).fetchone()
+        finally:
+            conn.close()
+        return URLValidators(*row) if row else None
+
+    def remember_url(self, url: str, sha256: str, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO url_index (url, sha256, etag, last_modified, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (url, sha256, etag, last_modified, time.time()))
+            # URL rows are small but unbounded in number; keep the most recently updated ones
+            evicted = conn.execute('''
+                DELETE FROM url_index WHERE url IN (
+                    SELECT url FROM url_index ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_urls,)).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        if evicted:
+            self._count("url_evictions", evicted)
+
+    def touch_url(self, url: str):
+        """The server answered 304 for `url`: its entry is current, so it must not age out as stale."""
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE url_index SET updated_at = ? WHERE url = ?", (time.time(), url))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def record_not_modified(self):
+        self._count("not_modified")
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        conn = self._connect()
+        try:
+            count, raw, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(raw_size), 0), COALESCE(SUM(stored_size), 0) FROM extracted_texts"
+            ).fetchone()
+            urls = conn.execute("SELECT COUNT(*) FROM url_index").fetchone()[0]
+            pages = conn.execute("SELECT COUNT(*) FROM document_pages").fetchone()[0]
+        finally:
+            conn.close()
+        stats.update({
+            "codec": self.codec,
+            "entries": count,
+            "urls": urls,
+            "pages": pages,
+            "raw_bytes": raw,
+            "stored_bytes": stored,
+            "compression_ratio": round(raw / stored, 2) if stored else None,
+            "max_bytes": self.max_bytes,
+            "max_urls": self.max_urls,
+        })
+        return stats
+
+
+extraction_cache = ExtractionCache()
@@ -0,0 +1,195 @@
+"""Hedged requests across LLM providers.
+
+The primary provider gets a head start equal to its observed p95 latency. If it
+has not answered by then, the secondary provider is started in parallel and the
+first non-empty answer wins; the loser is cancelled if it has not started yet
+and otherwise left to finish in the background with its result ignored.
+
+Calls share one thread pool, and a running loser keeps its slot until it
+returns, so a call can sit queued behind other races. Latency samples and the
+primary's head start therefore count from when a call starts running, not
+from when it was submitted; time spent queued is tracked on its own. A
+provider's win rate is its share of the races where a hedge was started.
+
+The wait for the primary to start is itself bounded by its hedge delay: when
+the pool is so busy that the primary is still queued by then, it is taken
+out of the queue and the chain runs in the caller's thread instead,
+secondary first, rather than queuing a hedge behind the same backlog.
+Running losers cannot be interrupted, so provider calls must carry their own
+request timeouts to give their slot back.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, Tuple
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGING", "1") == "1"
+HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "3.0"))
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "10.0"))
+HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "16"))
+
+Provider = Tuple[str, Callable[[], Optional[str]]]
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies per provider."""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+
+    def record(self, provider: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(provider, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, provider: str, pct: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(provider, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def count(self, provider: str) -> int:
+        with self._lock:
+            return len(self._samples.get(provider, ()))
+
+
+class HedgedRequester:
+    """Races a primary and a secondary provider, hedging after the primary's p95."""
+
+    def __init__(self, enabled: bool = HEDGE_ENABLED, percentile: float = HEDGE_PERCENTILE,
+                 default_delay: float = HEDGE_DEFAULT_DELAY, min_delay: float = HEDGE_MIN_DELAY,
+                 max_delay: float = HEDGE_MAX_DELAY, min_samples: int = HEDGE_MIN_SAMPLES,
+                 max_workers: int = HEDGE_WORKERS):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.latencies = LatencyTracker()
+        self.queue_waits = LatencyTracker()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="llm-hedge")
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._hedges_started = 0
+        self._races = 0
+        self._saturated = 0
+
+    def hedge_delay(self, provider: str) -> float:
+        """Seconds to wait on `provider` before starting the secondary."""
+        if self.latencies.count(provider) < self.min_samples:
+            return self.default_delay
+        observed = self.latencies.percentile(provider, self.percentile)
+        return min(self.max_delay, max(self.min_delay, observed))
+
+    def _provider_stats(self, provider: str) -> Dict[str, int]:
+        return self._stats.setdefault(provider, {"calls": 0, "wins": 0, "hedged_wins": 0, "failures": 0})
+
+    def _submit(self, provider: str, fn: Callable[[], Optional[str]],
+                started: Optional[threading.Event] = None) -> Future:
+        return self._pool.submit(self._timed, provider, fn, time.monotonic(), started)
+
+    def _timed(self, provider: str, fn: Callable[[], Optional[str]], submitted: float,
+               started: Optional[threading.Event] = None) -> Optional[str]:
+        start = time.monotonic()
+        self.queue_waits.record("pool", start - submitted)
+        if started is not None:
+            started.set()
+        try:
+            result = fn()
+        except Exception:
+            result = None
+        with self._lock:
+            stats = self._provider_stats(provider)
+            stats["calls"] += 1
+            if not result:
+                stats["failures"] += 1
+        if result:
+            self.latencies.record(provider, time.monotonic() - start)
+        return result
+
+    def race(self, primary: Provider, secondary: Provider) -> Tuple[Optional[str], Optional[str]]:
+        """Return (provider_name, result) for the first good answer, or (None, None)."""
+        primary_name, primary_fn = primary
+        secondary_name, secondary_fn = secondary
+        with self._lock:
+            self._races += 1
+        started = threading.Event()
+        primary_future = self._submit(primary_name, primary_fn, started)
+        futures = {primary_future: primary_name}
+        # Without hedging this degrades to the old sequential fallback
+        delay = self.hedge_delay(primary_name) if self.enabled else None
+        # The head start begins when the primary runs, not while it waits for a slot
+        if delay is not None and not started.wait(delay) and primary_future.cancel():
+            return self._race_inline(primary, secondary)
+        done, _ = wait(futures, timeout=delay)
+        hedged = not done
+        if done:
+            result = next(iter(done)).result()
+            if result:
+                return self._win(primary_name, result, hedged)
+        else:
+            with self._lock:
+                self._hedges_started += 1
+        futures[self._submit(secondary_name, secondary_fn)] = secondary_name
+        pending = {future for future in futures if future not in done}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    for loser in pending:
+                        loser.cancel()
+                    return self._win(futures[future], result, hedged)
+        return None, None
+
+    def _race_inline(self, primary: Provider, secondary: Provider) -> Tuple[Optional[str], Optional[str]]:
+        """The pool is saturated: run secondary, then primary, in the calling thread."""
+        with self._lock:
+            self._saturated += 1
+            self._hedges_started += 1
+        for name, fn in (secondary, primary):
+            result = self._timed(name, fn, time.monotonic())
+            if result:
+                return self._win(name, result, True)
+        return None, None
+
+    def _win(self, provider: str, result: str, hedged: bool) -> Tuple[str, str]:
+        with self._lock:
+            stats = self._provider_stats(provider)
+            stats["wins"] += 1
+            stats["hedged_wins"] += int(hedged)
+        return provider, result
+
+    def stats(self):
+        with self._lock:
+            providers = {name: dict(stats) for name, stats in self._stats.items()}
+            races = self._races
+            hedges_started = self._hedges_started
+            saturated = self._saturated
+        for name, stats in providers.items():
+            stats["win_rate"] = round(stats["hedged_wins"] / hedges_started, 3) if hedges_started else None
+            p95 = self.latencies.percentile(name, self.percentile)
+            stats["p95_latency"] = round(p95, 3) if p95 is not None else None
+            stats["hedge_delay"] = round(self.hedge_delay(name), 3)
+        queue_p95 = self.queue_waits.percentile("pool", self.percentile)
+        return {
+            "enabled": self.enabled,
+            "races": races,
+            "hedges_started": hedges_started,
+            "saturated_races": saturated,
+            "queue_wait_p95": round(queue_p95, 3) if queue_p95 is not None else None,
+            "providers": providers,
+        }
+
+
+llm_hedger = HedgedRequester()
@@ -0,0 +1,158 @@
+"""Shared, connection-pooled HTTP client for all outbound calls from the backend."""
+
+import os
+import threading
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+DEFAULT_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+DEFAULT_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+# Per-host overrides, e.g. "generativelanguage.googleapis.com=32,ucarecdn.com=8"
+HOST_POOL_SIZES = os.getenv("HTTP_HOST_POOL_SIZES", "generativelanguage.googleapis.com=32")
+
+
+class HTTPStats:
+    """Thread-safe counters for connection reuse, broken down by host."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, host: str, reused: bool):
+        with self._lock:
+            counters = self._hosts.setdefault(host, {"requests": 0, "pool_hits": 0, "handshakes": 0})
+            counters["requests"] += 1
+            if reused:
+                counters["pool_hits"] += 1
+            else:
+                counters["handshakes"] += 1
+
+    def snapshot(self):
+        with self._lock:
+            hosts = {host: dict(counters) for host, counters in self._hosts.items()}
+        totals = {"requests": 0, "pool_hits": 0, "handshakes": 0}
+        for counters in hosts.values():
+            for key in totals:
+                totals[key] += counters[key]
+        totals["reuse_ratio"] = round(totals["pool_hits"] / totals["requests"], 3) if totals["requests"] else 0.0
+        return {"totals": totals, "hosts": hosts}
+
+    def reset(self):
+        with self._lock:
+            self._hosts.clear()
+
+
+http_stats = HTTPStats()
+
+
+class _CountingPoolMixin:
+    """Records whether each checked-out connection still holds a live socket."""
+
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout=timeout)
+        # A connection without a socket has to do a fresh TCP (and TLS) handshake.
+        http_stats.record(self.host, reused=getattr(conn, "sock", None) is not None)
+        return conn
+
+
+class _CountingHTTPConnectionPool(_CountingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _CountingHTTPSConnectionPool(_CountingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report reuse to `http_stats`."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+def _parse_host_pool_sizes(spec: str) -> Dict[str, int]:
+    sizes = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        host, size = item.split("=", 1)
+        try:
+            sizes[host.strip()] = int(size)
+        except ValueError:
+            continue
+    return sizes
+
+
+class PooledHTTPClient:
+    """Keep-alive `requests.Session` wrapper shared by the whole process.
+
+    One session is built per process so that gunicorn workers never share
+    sockets inherited across fork.
+    """
+
+    def __init__(self, pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 host_pool_sizes: Optional[Dict[str, int]] = None):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.host_pool_sizes = host_pool_sizes if host_pool_sizes is not None else _parse_host_pool_sizes(HOST_POOL_SIZES)
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    def _build_session(self):
+        session = requests.Session()
+        session.headers.update({"Connection": "keep-alive"})
+        default_adapter = PooledHTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+        session.mount("http://", default_adapter)
+        session.mount("https://", default_adapter)
+        for host, size in self.host_pool_sizes.items():
+            adapter = PooledHTTPAdapter(pool_connections=1, pool_maxsize=size)
+            session.mount(f"https://{host}", adapter)
+            session.mount(f"http://{host}", adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        pid = os.getpid()
+        if self._session is None or self._pid != pid:
+            with self._lock:
+                if self._session is None or self._pid != pid:
+                    self._session = self._build_session()
+                    self._pid = pid
+        return self._session
+
+    def request(self, method, url, **kwargs):
+        return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request("HEAD", url, **kwargs)
+
+    def stats(self):
+        stats = http_stats.snapshot()
+        stats["pool_maxsize"] = self.pool_maxsize
+        stats["host_pool_sizes"] = dict(self.host_pool_sizes)
+        return stats
+
+    def close(self):
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._pid = None
+
+
+http_client = PooledHTTPClient()
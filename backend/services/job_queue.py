@@ -0,0 +1,378 @@
+"""Background job queue with SQLite-persisted state.
+
+Jobs are stored in `jobs.db` next to `gamification.db` and executed on a
+bounded thread pool inside each worker process. A job is claimed atomically
+(`queued` -> `running`) so only one process ever runs it. Running jobs report
+progress stages through the database, which is what lets `/jobs/<id>` be
+served by any worker. While a process has jobs running, a heartbeat thread
+touches their `updated_at` every `JOB_HEARTBEAT_INTERVAL` seconds, so a job
+stuck inside one long LLM or extraction call is not mistaken for an orphan.
+
+The thread pool and the worker id (host:pid:start time) belong to the process
+using them: both are created on first use in each process, so a queue built in
+a preloading gunicorn master is rebuilt in every forked worker. `start()` runs
+once per serving process and requeues jobs whose owning process is gone. On
+the same host a process counts as gone when its pid is free or now belongs to
+a process started at another time (pid reuse); where start times can't be
+read, and for other hosts, a heartbeat older than `JOB_STALE_AFTER` does.
+Finished jobs are purged `JOB_RETENTION` seconds after they finish.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional
+
+JOBS_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "jobs.db")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "300"))
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "30"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(24 * 3600)))
+JOB_PURGE_INTERVAL = 60.0
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+def process_start_time(pid: int) -> Optional[str]:
+    """Start time of a live process (clock ticks since boot, from /proc), or None if unknown."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name (field 2) may contain spaces; starttime is field 22
+    fields = stat[stat.rfind(")") + 2:].split()
+    return fields[19] if len(fields) > 19 else None
+
+
+@lru_cache(maxsize=None)
+def _own_start_time(pid: int) -> str:
+    # Keyed by pid, so a forked child computes its own
+    return process_start_time(pid) or "0"
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once cancellation has been requested."""
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting."""
+
+
+class JobQueue:
+    """Submits, runs, tracks and recovers background jobs."""
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, max_workers: int = JOB_WORKERS,
+                 max_queued: int = JOB_MAX_QUEUED, stale_after: float = JOB_STALE_AFTER,
+                 heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL, retention: float = JOB_RETENTION):
+        self.db_path = db_path
+        self.retention = retention
+        self._last_purge = 0.0
+        self._purged = 0
+        self.max_queued = max_queued
+        self.stale_after = stale_after
+        self.heartbeat_interval = min(heartbeat_interval, stale_after / 3)
+        self.max_workers = max_workers
+        self._running = set()
+        self._running_lock = threading.Lock()
+        self._heartbeat_thread: Optional[threading.Thread] = None
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        self.init_database()
+
+    @property
+    def worker_id(self) -> str:
+        pid = os.getpid()
+        return f"{socket.gethostname()}:{pid}:{_own_start_time(pid)}"
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        # Threads don't survive fork, so each process builds its own pool (and heartbeat)
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+                self._pool_pid = os.getpid()
+                self._running = set()
+                self._heartbeat_thread = None
+            return self._pool
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    stage TEXT,
+                    progress TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    worker TEXT,
+                    attempts INTEGER DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs (updated_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def register(self, job_type: str, handler: Callable[..., Any]):
+        """Register `handler(payload, progress)` for `job_type`; it returns the JSON result."""
+        self._handlers[job_type] = handler
+
+    def submit(self, job_type: str, payload: Dict[str, Any]) -> str:
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        if now - self._last_purge > JOB_PURGE_INTERVAL:
+            self.purge(now)
+        conn = self._connect()
+        try:
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if queued >= self.max_queued:
+                raise QueueFullError(f"{queued} jobs already queued")
+            conn.execute('''
+                INSERT INTO jobs (job_id, job_type, status, payload, stage, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (job_id, job_type, QUEUED, json.dumps(payload), QUEUED, now, now))
+            conn.commit()
+        finally:
+            conn.close()
+        self._get_pool().submit(self._run, job_id)
+        return job_id
+
+    def _claim(self, job_id: str) -> Optional[sqlite3.Row]:
+        conn = self._connect()
+        try:
+            claimed = conn.execute('''
+                UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, updated_at = ?
+                WHERE job_id = ? AND status = ?
+            ''', (RUNNING, self.worker_id, time.time(), job_id, QUEUED)).rowcount
+            conn.commit()
+            if not claimed:
+                return None
+            return conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+
+    def _update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return bool(row and row["cancel_requested"])
+        finally:
+            conn.close()
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+            marks = ",".join("?" * len(running))
+            conn = self._connect()
+            try:
+                conn.execute(f"UPDATE jobs SET updated_at = ? WHERE status = ? AND job_id IN ({marks})",
+                             (time.time(), RUNNING, *running))
+                conn.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ Job heartbeat failed: {e}")
+            finally:
+                conn.close()
+
+    def _track(self, job_id: str):
+        with self._running_lock:
+            self._running.add(job_id)
+            if self._heartbeat_thread is None or not self._heartbeat_thread.is_alive():
+                self._heartbeat_thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+                self._heartbeat_thread.start()
+
+    def _untrack(self, job_id: str):
+        with self._running_lock:
+            self._running.discard(job_id)
+
+    def _run(self, job_id: str):
+        job = self._claim(job_id)
+        if job is None:
+            return
+        self._track(job_id)
+        try:
+            self._execute(job_id, job)
+        finally:
+            self._untrack(job_id)
+
+    def _execute(self, job_id: str, job: sqlite3.Row):
+        handler = self._handlers.get(job["job_type"])
+
+        def progress(stage: str, **details):
+            """Record a progress stage; raises JobCancelled if the job was cancelled."""
+            if self._cancel_requested(job_id):
+                raise JobCancelled(job_id)
+            self._update(job_id, stage=stage, progress=json.dumps(details))
+
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for {job['job_type']}")
+            progress("started")
+            result = handler(json.loads(job["payload"]), progress)
+            self._update(job_id, status=SUCCEEDED, stage="done", result=json.dumps(result))
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED, stage=CANCELLED)
+        except Exception as e:
+            error = getattr(e, "payload", None) or {"error": str(e)}
+            self._update(job_id, status=FAILED, stage=FAILED, error=json.dumps(error))
+
+    def cancel(self, job_id: str) -> Optional[str]:
+        """Cancel a queued job immediately or flag a running one; returns the new status."""
+        conn = self._connect()
+        try:
+            now = time.time()
+            conn.execute('''
+                UPDATE jobs SET status = ?, stage = ?, cancel_requested = 1, updated_at = ?
+                WHERE job_id = ? AND status = ?
+            ''', (CANCELLED, CANCELLED, now, job_id, QUEUED))
+            conn.execute('''
+                UPDATE jobs SET cancel_requested = 1, updated_at = ?
+                WHERE job_id = ? AND status = ?
+            ''', (now, job_id, RUNNING))
+            conn.commit()
+            row = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            return row["status"] if row else None
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return {
+            "job_id": row["job_id"],
+            "job_type": row["job_type"],
+            "status": row["status"],
+            "stage": row["stage"],
+            "progress": json.loads(row["progress"]) if row["progress"] else {},
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": json.loads(row["error"]) if row["error"] else None,
+            "cancel_requested": bool(row["cancel_requested"]),
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+        }
+
+    def _is_orphaned(self, job_id: str, worker: Optional[str], updated_at: float, now: float) -> bool:
+        stale = now - updated_at > self.stale_after
+        host, pid, started = ((worker or "").split(":") + [None, None])[:3]
+        if host != socket.gethostname() or not (pid or "").isdigit():
+            # Another host (or no owner recorded): the heartbeat stops when its process dies
+            return stale
+        if worker == self.worker_id:
+            with self._running_lock:
+                return job_id not in self._running
+        if int(pid) == os.getpid():
+            return True  # claimed by an earlier process that had our pid
+        current = process_start_time(int(pid))
+        if current is not None and started not in (None, "0"):
+            return current != started  # a different start time means the pid was reused
+        try:
+            os.kill(int(pid), 0)
+        except OSError:
+            return True
+        # The pid is taken but we can't tell by whom: trust the heartbeat
+        return stale
+
+    def start(self) -> int:
+        """Start this process's pool and recover orphaned jobs; call once per serving process."""
+        self._get_pool()
+        self.purge()
+        return self.recover()
+
+    def purge(self, now: Optional[float] = None) -> int:
+        """Delete finished jobs older than the retention period; returns how many went."""
+        now = time.time() if now is None else now
+        self._last_purge = now
+        marks = ",".join("?" * len(FINISHED_STATES))
+        conn = self._connect()
+        try:
+            purged = conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({marks}) AND updated_at < ?",
+                (*FINISHED_STATES, now - self.retention)
+            ).rowcount
+            conn.commit()
+        finally:
+            conn.close()
+        self._purged += purged
+        return purged
+
+    def recover(self) -> int:
+        """Requeue jobs orphaned by a dead or stale worker and resubmit everything queued."""
+        now = time.time()
+        conn = self._connect()
+        try:
+            requeued = 0
+            for row in conn.execute("SELECT job_id, worker, updated_at FROM jobs WHERE status = ?", (RUNNING,)).fetchall():
+                if self._is_orphaned(row["job_id"], row["worker"], row["updated_at"], now):
+                    requeued += conn.execute('''
+                        UPDATE jobs SET status = ?, stage = ?, worker = NULL, updated_at = ?
+                        WHERE job_id = ? AND status = ?
+                    ''', (QUEUED, QUEUED, now, row["job_id"], RUNNING)).rowcount
+            conn.commit()
+            queued = [row["job_id"] for row in conn.execute(
+                "SELECT job_id FROM jobs WHERE status = ? ORDER BY created_at", (QUEUED,)
+            ).fetchall()]
+        finally:
+            conn.close()
+        pool = self._get_pool()
+        for job_id in queued:
+            pool.submit(self._run, job_id)
+        if requeued:
+            print(f"♻️ Requeued {requeued} orphaned job(s)")
+        return requeued
+
+    def stats(self):
+        conn = self._connect()
+        try:
+            counts = {row[0]: row[1] for row in conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")}
+        finally:
+            conn.close()
+        return {"worker": self.worker_id, "by_status": counts, "retention": self.retention, "purged": self._purged}
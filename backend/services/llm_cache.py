@@ -0,0 +1,214 @@
+"""Content-addressed cache for LLM responses.
+
+Responses are keyed by a SHA-256 of (provider, model, prompt, temperature) and
+stored in two tiers: a per-process in-memory LRU for hot entries and a SQLite
+file shared by all workers. Both tiers honour a TTL; the disk tier is bounded
+by total size and evicts least recently used entries first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+LLM_CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+LLM_CACHE_MEMORY_ENTRIES = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "256"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+def make_cache_key(provider: str, model: str, prompt: str, temperature: Optional[float] = None) -> str:
+    payload = json.dumps([provider, model, prompt, temperature], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Two-tier (memory LRU + SQLite) response cache with TTL and size bound."""
+
+    def __init__(self, db_path: str = LLM_CACHE_DB_PATH, ttl: float = LLM_CACHE_TTL,
+                 memory_entries: int = LLM_CACHE_MEMORY_ENTRIES, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self._memory = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "bypassed": 0}
+        self.init_database()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        # INSERT OR REPLACE only fires the size triggers for the row it replaces with this on
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_access ON llm_responses (last_access)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_created ON llm_responses (created_at)")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    stored_bytes INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS llm_responses_size_insert AFTER INSERT ON llm_responses BEGIN
+                    UPDATE cache_size SET stored_bytes = stored_bytes + new.size WHERE id = 0;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS llm_responses_size_delete AFTER DELETE ON llm_responses BEGIN
+                    UPDATE cache_size SET stored_bytes = stored_bytes - old.size WHERE id = 0;
+                END
+            ''')
+            # Recounted once per start, so rows written before the triggers existed are counted too
+            conn.execute('''
+                INSERT OR REPLACE INTO cache_size (id, stored_bytes)
+                SELECT 0, COALESCE(SUM(size), 0) FROM llm_responses
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _remember(self, key: str, stored_at: float, value: str):
+        with self._lock:
+            self._memory[key] = (stored_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str, count_miss: bool = True) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return entry[1]
+                del self._memory[key]
+        try:
+            conn = self._connect()
+            try:
+                row = conn.execute(
+                    "SELECT response, created_at FROM llm_responses WHERE cache_key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    conn.execute("UPDATE llm_responses SET last_access = ? WHERE cache_key = ?", (now, key))
+                    conn.commit()
+                elif row:
+                    conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (key,))
+                    conn.commit()
+                    row = None
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            row = None
+        if row is None:
+            if count_miss:
+                self._count("misses")
+            return None
+        self._count("disk_hits")
+        self._remember(key, row[1], row[0])
+        return row[0]
+
+    def get_any(self, keys) -> Optional[str]:
+        """Return the first cached value among `keys`, counting a single miss if none hit."""
+        for key in keys:
+            value = self.get(key, count_miss=False)
+            if value is not None:
+                return value
+        self._count("misses")
+        return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        self._remember(key, now, value)
+        size = len(value.encode("utf-8"))
+        try:
+            conn = self._connect()
+            try:
+                conn.execute('''
+                    INSERT OR REPLACE INTO llm_responses (cache_key, response, size, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (key, value, size, now, now))
+                evicted = self._evict(conn, now)
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            evicted = 0
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["evictions"] += evicted
+
+    def _evict(self, conn, now: float) -> int:
+        """Drop expired responses, then least-recently-used ones until the store fits max_bytes."""
+        evicted = conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl,)).rowcount
+        total = conn.execute("SELECT stored_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+        while total > self.max_bytes:
+            # The oldest response comes straight off the last_access index
+            row = conn.execute("SELECT cache_key, size FROM llm_responses "
+                               "ORDER BY last_access ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM llm_responses WHERE cache_key = ?", (row[0],))
+            total -= row[1]
+            evicted += 1
+        return evicted
+
+    def record_bypass(self):
+        """Count a lookup skipped on request; fresh results are still stored."""
+        self._count("bypassed")
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        conn = self._connect()
+        try:
+            conn.execute("DELETE FROM llm_responses")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        try:
+            conn = self._connect()
+            try:
+                count = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+                size = conn.execute("SELECT stored_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+            finally:
+                conn.close()
+            stats["disk_entries"] = count
+            stats["disk_bytes"] = size
+        except sqlite3.Error:
+            pass
+        return stats
+
+
+llm_cache = LLMResponseCache()
@@ -0,0 +1,462 @@
+"""Page-parallel PDF text extraction.
+
+Page ranges are sharded across a process pool and merged back in page order.
+Every page is read with pypdf first and only falls back to pdfplumber when
+pypdf yields no text for that page, so one scanned or oddly encoded page no
+longer forces a second full pass over the document. A file pypdf cannot open
+at all is extracted with pdfplumber alone, in-process. Small documents are
+extracted in-process, where pool start-up would cost more than it saves. A
+pool whose worker died (OOM kill, parser crash) is replaced and the document
+retried once on the new pool.
+
+Sources are either a file path or the raw PDF bytes. `SpooledPDF` keeps
+downloads and uploads in memory and only spills them to a temporary file past
+`PDF_SPOOL_MAX_BYTES`, so small documents never touch the disk and pypdf and
+pdfplumber parse the same buffer. When in-memory bytes are extracted in
+parallel they are placed in one shared-memory block per document; shards carry
+only its name, and each task copies the bytes out and lets go of them (and of
+the block) before it returns, so an idle worker never holds a document.
+
+Pages are fingerprinted by the SHA-256 of their content stream together with
+everything it draws from: the resolved /Resources (fonts, their encodings and
+form XObjects, recursively) and the page rotation. Two pages that both draw
+`/Fm0 Do` therefore only match when `/Fm0` is the same form. Given a
+`page_lookup` for fingerprints seen before, only new or edited pages are
+extracted. Fingerprinting parses every page as well, so documents large
+enough for the pool are fingerprinted there too, shard by shard: the request
+thread only looks the fingerprints up, and several files of one request are
+hashed in parallel instead of one after another under the GIL.
+
+Pages are joined with a form feed (`PAGE_BREAK`), not a newline, so the
+cleaner, the chunker and TTS sentence splitting can see page boundaries;
+text is converted back to newlines before it is put into a prompt
+(app.prompt_text). Caches of extracted text are versioned with
+`EXTRACTION_FORMAT_VERSION` and must be bumped when this format changes.
+"""
+
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 2)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "16"))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "25"))
+# Never fork: workers would inherit the request threads, executors and SQLite handles of the app
+PDF_POOL_START_METHOD = os.getenv("PDF_POOL_START_METHOD", "forkserver")
+PDF_SPOOL_MAX_BYTES = int(os.getenv("PDF_SPOOL_MAX_BYTES", str(32 * 1024 * 1024)))
+
+PAGE_BREAK = "\f"
+EXTRACTION_FORMAT_VERSION = 2  # 1: pages joined with "\n"; 2: joined with PAGE_BREAK
+
+PDFSource = Union[str, bytes]
+PageLookup = Callable[[List[str]], Dict[str, str]]
+
+
+@dataclass
+class PageResult:
+    page_number: int
+    text: str
+    backend: str  # "pypdf", "pdfplumber", "cached" or "none"
+    seconds: float
+    fingerprint: Optional[str] = None
+
+
+@dataclass
+class ExtractionResult:
+    pages: List[PageResult] = field(default_factory=list)
+    seconds: float = 0.0
+    parallel: bool = False
+
+    @property
+    def text(self) -> str:
+        return PAGE_BREAK.join(page.text for page in self.pages if page.text)
+
+    def timings(self):
+        return {
+            "pages": len(self.pages),
+            "seconds": round(self.seconds, 3),
+            "parallel": self.parallel,
+            "backends": {
+                backend: sum(1 for page in self.pages if page.backend == backend)
+                for backend in {page.backend for page in self.pages}
+            },
+            "slowest_pages": [
+                {"page": page.page_number, "backend": page.backend, "seconds": round(page.seconds, 3)}
+                for page in sorted(self.pages, key=lambda page: page.seconds, reverse=True)[:5]
+            ],
+        }
+
+
+def _clean_plumber_text(text: str) -> str:
+    # pdfplumber breaks lines mid-sentence; rejoin words split across lines
+    return re.sub(r"(\w+)\s*\n\s*(\w+)", r"\1 \2", text)
+
+
+def _open(source: PDFSource):
+    # Each parser gets its own stream over the same bytes (BytesIO shares, not copies, them)
+    return source if isinstance(source, str) else io.BytesIO(source)
+
+
+def count_pages(source: PDFSource) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(_open(source)).pages)
+
+
+def _object_digest(obj, memo: Dict[Tuple[int, int], bytes]) -> bytes:
+    """Digest of a PDF object with indirect references resolved (memoized per document)."""
+    from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+    if isinstance(obj, IndirectObject):
+        key = (obj.idnum, obj.generation)
+        if key not in memo:
+            memo[key] = b"cycle"  # placeholder while resolving, for self-referencing objects
+            memo[key] = _object_digest(obj.get_object(), memo)
+        return memo[key]
+    digest = hashlib.sha256(type(obj).__name__.encode())
+    if isinstance(obj, DictionaryObject):
+        for name in sorted(obj):
+            if name in ("/Parent", "/P"):
+                continue  # back-references to the page tree
+            digest.update(name.encode("utf-8", "replace"))
+            digest.update(_object_digest(obj.raw_get(name), memo))
+        if isinstance(obj, StreamObject) and obj.get("/Subtype") != "/Image":
+            # Image pixels never change extracted text; every other stream can
+            digest.update(obj.get_data())
+    elif isinstance(obj, ArrayObject):
+        for item in obj:
+            digest.update(_object_digest(item, memo))
+    elif isinstance(obj, bytes):
+        digest.update(obj)
+    else:
+        digest.update(repr(obj).encode("utf-8", "replace"))
+    return digest.digest()
+
+
+def fingerprint_pages(source: PDFSource, indices: Optional[Iterable[int]] = None) -> List[str]:
+    """SHA-256 of each page's content stream, resolved resources and rotation, in page order.
+
+    Covers every page, or only the given 0-based `indices` (in pool workers).
+    """
+    from pypdf import PdfReader
+    fingerprints = []
+    memo: Dict[Tuple[int, int], bytes] = {}
+    pages = PdfReader(_open(source)).pages
+    for index in range(len(pages)) if indices is None else indices:
+        page = pages[index]
+        digest = hashlib.sha256()
+        try:
+            contents = page.get_contents()
+            if contents is not None:
+                digest.update(contents.get_data())
+            for name in ("/Resources", "/Rotate"):
+                digest.update(_object_digest(page.raw_get(name) if name in page else None, memo))
+        except Exception:
+            # Never reuse text for a page we could not fully identify
+            digest.update(b"unreadable" + os.urandom(16))
+        fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+
+def extract_page_range(source: PDFSource, start: int, stop: int) -> List[Tuple[int, str, str, float]]:
+    """Extract pages [start, stop) choosing the backend per page."""
+    return extract_pages(source, range(start, stop))
+
+
+def extract_pages(source: PDFSource, indices: Iterable[int]) -> List[Tuple[int, str, str, float]]:
+    """Extract the given 0-based pages choosing the backend per page; runs in pool workers."""
+    from pypdf import PdfReader
+    reader = PdfReader(_open(source))
+    plumber_pdf = None
+    results = []
+    try:
+        for index in indices:
+            page_start = time.perf_counter()
+            text, backend = "", "none"
+            try:
+                text = reader.pages[index].extract_text() or ""
+                backend = "pypdf"
+            except Exception:
+                text = ""
+            if not text.strip():
+                try:
+                    if plumber_pdf is None:
+                        import pdfplumber
+                        plumber_pdf = pdfplumber.open(_open(source))
+                    text = _clean_plumber_text(plumber_pdf.pages[index].extract_text() or "")
+                    backend = "pdfplumber" if text.strip() else "none"
+                except Exception:
+                    text, backend = "", "none"
+            results.append((index + 1, text, backend, time.perf_counter() - page_start))
+    finally:
+        if plumber_pdf is not None:
+            plumber_pdf.close()
+    return results
+
+
+def extract_plumber_pages(source: PDFSource) -> List[Tuple[int, str, str, float]]:
+    """Every page with pdfplumber only, for files pypdf cannot open."""
+    import pdfplumber
+    results = []
+    with pdfplumber.open(_open(source)) as pdf:
+        for number, page in enumerate(pdf.pages, start=1):
+            page_start = time.perf_counter()
+            text = _clean_plumber_text(page.extract_text() or "")
+            results.append((number, text, "pdfplumber" if text.strip() else "none", time.perf_counter() - page_start))
+    return results
+
+
+def _read_shared(name: str, size: int) -> bytes:
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        return bytes(block.buf[:size])
+    finally:
+        block.close()
+
+
+def extract_shared_pages(name: str, size: int, indices: Iterable[int]) -> List[Tuple[int, str, str, float]]:
+    """Pool entry point for in-memory PDFs published with `_publish`; keeps nothing once it returns."""
+    return extract_pages(_read_shared(name, size), indices)
+
+
+def fingerprint_shared_pages(name: str, size: int, indices: Iterable[int]) -> List[str]:
+    """Pool entry point: `fingerprint_pages` for an in-memory PDF published with `_publish`."""
+    return fingerprint_pages(_read_shared(name, size), indices)
+
+
+def _publish(data: bytes) -> shared_memory.SharedMemory:
+    block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    block.buf[:len(data)] = data
+    return block
+
+
+class SpooledPDF:
+    """Write-once PDF buffer that stays in memory until it outgrows `max_size`.
+
+    Bytes are hashed as they are written. Past the threshold everything is moved
+    to one temporary file in `spill_dir`; `source()` then returns its path
+    instead of the bytes. Use as a context manager so the spill file is removed.
+    """
+
+    def __init__(self, max_size: int = PDF_SPOOL_MAX_BYTES, spill_dir: Optional[str] = None):
+        self.max_size = max_size
+        self.spill_dir = spill_dir
+        self.size = 0
+        self.path: Optional[str] = None
+        self._memory: Optional[io.BytesIO] = io.BytesIO()
+        self._file = None
+        self._data: Optional[bytes] = None
+        self._digest = hashlib.sha256()
+
+    def write(self, chunk: bytes):
+        self._digest.update(chunk)
+        self.size += len(chunk)
+        if self._file is None and self.path is None and self.size > self.max_size:
+            fd, self.path = tempfile.mkstemp(suffix=".pdf", dir=self.spill_dir)
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(self._memory.getbuffer())
+            self._memory = None
+        if self._file is not None:
+            self._file.write(chunk)
+        else:
+            self._memory.write(chunk)
+
+    @property
+    def spilled(self) -> bool:
+        return self.path is not None
+
+    @property
+    def sha256(self) -> str:
+        return self._digest.hexdigest()
+
+    def source(self) -> PDFSource:
+        """Finish writing and return what the extractor should read."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            return self.path
+        if self._data is None:
+            self._data = self._memory.getvalue()
+            self._memory = None
+        return self._data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self._memory = None
+        self._data = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PDFExtractor:
+    """Shards page ranges across a per-process pool and merges them in order."""
+
+    def __init__(self, max_workers: int = PDF_WORKERS, parallel_min_pages: int = PDF_PARALLEL_MIN_PAGES,
+                 pages_per_shard: int = PDF_PAGES_PER_SHARD, start_method: str = PDF_POOL_START_METHOD):
+        self.max_workers = max(1, max_workers)
+        self.parallel_min_pages = parallel_min_pages
+        self.pages_per_shard = max(1, pages_per_shard)
+        self.start_method = start_method
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid = None
+        self._stats = {"documents": 0, "pages": 0, "pages_reused": 0, "parallel_documents": 0, "seconds": 0.0,
+                       "broken_pools": 0, "backends": {}, "sources": {"memory": 0, "file": 0}}
+        self._last_timings = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Pools don't survive fork, so each gunicorn worker builds its own on first use
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                try:
+                    context = multiprocessing.get_context(self.start_method)
+                except ValueError:
+                    context = multiprocessing.get_context("spawn")
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _drop_pool(self, pool: ProcessPoolExecutor):
+        # A worker died and the executor is permanently broken; the next _get_pool builds a new one
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+                self._pool_pid = None
+                self._stats["broken_pools"] += 1
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _map_shards(self, pool: ProcessPoolExecutor, source: PDFSource, block, indices: List[int],
+                    task: Callable, shared_task: Callable) -> list:
+        """Run `task` over shards of `indices` and concatenate the results in page order."""
+        futures = []
+        try:
+            if block is None:
+                futures = [pool.submit(task, source, shard) for shard in self._shards(indices)]
+            else:
+                futures = [pool.submit(shared_task, block.name, len(source), shard) for shard in self._shards(indices)]
+            return [row for future in futures for row in future.result()]
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _extract_pooled(self, source: PDFSource, page_count: int, page_lookup: Optional[PageLookup]):
+        """(fingerprints, known pages, extracted rows, parallel) for a document large enough for the pool."""
+        pool = self._get_pool()
+        # Pickle in-memory bytes zero times instead of once per shard
+        block = None if isinstance(source, str) else _publish(source)
+        try:
+            fingerprints, known = [None] * page_count, {}
+            if page_lookup is not None:
+                fingerprints = self._map_shards(pool, source, block, list(range(page_count)),
+                                                fingerprint_pages, fingerprint_shared_pages)
+                known = page_lookup(fingerprints)
+            todo = [index for index, fingerprint in enumerate(fingerprints) if fingerprint not in known]
+            if len(todo) < self.parallel_min_pages:
+                return fingerprints, known, extract_pages(source, todo), False
+            return fingerprints, known, self._map_shards(pool, source, block, todo,
+                                                         extract_pages, extract_shared_pages), True
+        except BrokenProcessPool:
+            self._drop_pool(pool)
+            raise
+        finally:
+            if block is not None:
+                block.close()
+                block.unlink()
+
+    def _shards(self, indices: List[int]) -> List[List[int]]:
+        # At least one shard per worker, but no shard larger than pages_per_shard
+        size = min(self.pages_per_shard, -(-len(indices) // self.max_workers))
+        return [indices[start:start + size] for start in range(0, len(indices), size)]
+
+    def extract(self, source: Union[PDFSource, SpooledPDF], page_lookup: Optional[PageLookup] = None) -> ExtractionResult:
+        """Extract a PDF given as a path, its bytes, or a SpooledPDF.
+
+        With `page_lookup` (fingerprints -> {fingerprint: text}), pages whose
+        fingerprint is already known are reused instead of extracted.
+        """
+        if isinstance(source, SpooledPDF):
+            source = source.source()
+        start = time.perf_counter()
+        try:
+            page_count = count_pages(source)
+            pooled = self.max_workers > 1 and page_count >= self.parallel_min_pages
+            if not pooled:
+                fingerprints = fingerprint_pages(source) if page_lookup is not None else [None] * page_count
+                known = page_lookup(fingerprints) if page_lookup is not None else {}
+        except Exception:
+            # pypdf cannot open the file at all; pdfplumber may still read it
+            rows = extract_plumber_pages(source)
+            result = ExtractionResult(pages=[PageResult(*row) for row in rows], seconds=time.perf_counter() - start)
+            self._record(result, "file" if isinstance(source, str) else "memory")
+            return result
+        if pooled:
+            try:
+                fingerprints, known, rows, parallel = self._extract_pooled(source, page_count, page_lookup)
+            except BrokenProcessPool:
+                # once more, on a fresh pool
+                fingerprints, known, rows, parallel = self._extract_pooled(source, page_count, page_lookup)
+        else:
+            todo = [index for index, fingerprint in enumerate(fingerprints) if fingerprint not in known]
+            rows, parallel = extract_pages(source, todo), False
+        extracted = {row[0] - 1: PageResult(*row, fingerprint=fingerprints[row[0] - 1]) for row in rows}
+        result = ExtractionResult(
+            pages=[
+                extracted.get(index) or PageResult(index + 1, known[fingerprint], "cached", 0.0, fingerprint)
+                for index, fingerprint in enumerate(fingerprints)
+            ],
+            seconds=time.perf_counter() - start,
+            parallel=parallel,
+        )
+        self._record(result, "file" if isinstance(source, str) else "memory")
+        return result
+
+    def _record(self, result: ExtractionResult, source_kind: str):
+        timings = result.timings()
+        with self._lock:
+            self._stats["sources"][source_kind] += 1
+            self._stats["documents"] += 1
+            self._stats["pages"] += timings["pages"]
+            self._stats["pages_reused"] += timings["backends"].get("cached", 0)
+            self._stats["parallel_documents"] += int(result.parallel)
+            self._stats["seconds"] += result.seconds
+            for backend, count in timings["backends"].items():
+                self._stats["backends"][backend] = self._stats["backends"].get(backend, 0) + count
+            self._last_timings = timings
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats, backends=dict(self._stats["backends"]), sources=dict(self._stats["sources"]))
+            stats["last_document"] = self._last_timings
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats["workers"] = self.max_workers
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pool_pid = None
+
+
+pdf_extractor = PDFExtractor()
@@ -0,0 +1,143 @@
+"""Token-bucket rate limiter shared by every worker process through SQLite.
+
+Each bucket is stored as a single "theoretical arrival time" (GCRA), which is
+equivalent to a token bucket with `rate` tokens per second and room for
+`capacity` tokens. Acquiring a token reserves the next free slot inside one
+`BEGIN IMMEDIATE` transaction, so callers across all gunicorn workers are
+served strictly in arrival order and each one sleeps only until its own slot.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+RATE_LIMIT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rate_limits.db")
+
+
+@dataclass
+class BucketConfig:
+    rate: float  # tokens refilled per second
+    capacity: int = 1  # burst size
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.rate
+
+
+DEFAULT_BUCKETS = {
+    "gemini-1.5-pro-latest": BucketConfig(
+        rate=float(os.getenv("GEMINI_PRO_RATE_PER_SEC", "1")),
+        capacity=int(os.getenv("GEMINI_PRO_BURST", "1")),
+    ),
+    "gemini-1.5-flash": BucketConfig(
+        rate=float(os.getenv("GEMINI_FLASH_RATE_PER_SEC", "1")),
+        capacity=int(os.getenv("GEMINI_FLASH_BURST", "1")),
+    ),
+}
+
+
+class SharedTokenBucketLimiter:
+    """Cross-process, FIFO-fair token buckets keyed by name (e.g. model)."""
+
+    def __init__(self, db_path: str = RATE_LIMIT_DB_PATH, buckets: Optional[Dict[str, BucketConfig]] = None,
+                 default_bucket: Optional[BucketConfig] = None, max_wait: float = 30.0,
+                 clock: Callable[[], float] = time.time):
+        self.db_path = db_path
+        self.buckets = dict(buckets if buckets is not None else DEFAULT_BUCKETS)
+        self.default_bucket = default_bucket or BucketConfig(rate=1.0, capacity=1)
+        self.max_wait = max_wait
+        # Wall-clock seconds shared by every process on the database; injectable for tests
+        self.clock = clock
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self.init_database()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    name TEXT PRIMARY KEY,
+                    tat REAL NOT NULL
+                )
+            ''')
+        finally:
+            conn.close()
+
+    def config_for(self, name: str) -> BucketConfig:
+        return self.buckets.get(name, self.default_bucket)
+
+    def reserve(self, name: str, max_wait: Optional[float] = None) -> Optional[float]:
+        """Reserve the next slot in `name` and return how long to wait for it.
+
+        Returns None, without consuming a slot, if the wait would exceed `max_wait`.
+        """
+        config = self.config_for(name)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        burst_tolerance = (config.capacity - 1) * config.interval
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT tat FROM token_buckets WHERE name = ?", (name,)).fetchone()
+            now = self.clock()
+            tat = max(row[0] if row else now, now)
+            wait = max(0.0, tat - burst_tolerance - now)
+            if wait > max_wait:
+                conn.execute("ROLLBACK")
+                self._record(name, granted=False, wait=0.0)
+                return None
+            conn.execute(
+                "INSERT OR REPLACE INTO token_buckets (name, tat) VALUES (?, ?)",
+                (name, tat + config.interval),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            try:
+                conn.execute("ROLLBACK")
+            except Exception:
+                pass
+            raise
+        finally:
+            conn.close()
+        self._record(name, granted=True, wait=wait)
+        return wait
+
+    def acquire(self, name: str, max_wait: Optional[float] = None) -> bool:
+        """Block until a token from `name` is available; False if the queue is too long."""
+        wait = self.reserve(name, max_wait=max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def _record(self, name: str, granted: bool, wait: float):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {"granted": 0, "rejected": 0, "waited": 0, "total_wait_seconds": 0.0})
+            if granted:
+                stats["granted"] += 1
+                if wait > 0:
+                    stats["waited"] += 1
+                    stats["total_wait_seconds"] += wait
+            else:
+                stats["rejected"] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            buckets = {name: dict(stats) for name, stats in self._stats.items()}
+        for name, stats in buckets.items():
+            config = self.config_for(name)
+            stats["total_wait_seconds"] = round(stats["total_wait_seconds"], 3)
+            stats["rate_per_sec"] = config.rate
+            stats["capacity"] = config.capacity
+        return buckets
+
+
+gemini_rate_limiter = SharedTokenBucketLimiter()
@@ -0,0 +1,77 @@
+"""Single-flight coalescing of identical concurrent work.
+
+The first caller for a key (the leader) runs the computation; callers that
+arrive while it is in flight wait for the same outcome instead of repeating
+it. Errors raised by the leader are re-raised in every waiter.
+"""
+
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", "120"))
+
+
+class SingleFlightTimeout(TimeoutError):
+    """A waiter gave up before the leader finished."""
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key within this process."""
+
+    def __init__(self, name: str, timeout: float = SINGLE_FLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._stats = {"calls": 0, "executions": 0, "coalesced": 0, "timeouts": 0, "errors": 0}
+
+    def do(self, key: str, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """Run `fn` once for all concurrent callers of `key` and return its result."""
+        with self._lock:
+            self._stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+                self._stats["executions"] += 1
+            else:
+                call.waiters += 1
+                leader = False
+                self._stats["coalesced"] += 1
+        if leader:
+            try:
+                call.result = fn()
+            except BaseException as e:
+                call.error = e
+                with self._lock:
+                    self._stats["errors"] += 1
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+        elif not call.done.wait(self.timeout if timeout is None else timeout):
+            with self._lock:
+                self._stats["timeouts"] += 1
+            raise SingleFlightTimeout(f"{self.name}: timed out waiting for in-flight call")
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
+
+
+llm_flight = SingleFlight("llm")
+file_flight = SingleFlight("file", timeout=float(os.getenv("FILE_SINGLE_FLIGHT_TIMEOUT", "300")))
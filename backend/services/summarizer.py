@@ -0,0 +1,143 @@
+"""Map-reduce condensing of large documents before they are prompted.
+
+Text that fits the single-shot budget is returned untouched. Callers pass the
+budget of the prompt the text is headed for (`token_limit`);
+`MAP_REDUCE_TOKEN_THRESHOLD` is only the default. Larger text is
+split into chunks of at most `chunk_tokens` tokens, each chunk is summarized
+on a bounded worker pool (map), and the joined chunk summaries are returned so
+that the caller's normal prompt runs once over them (reduce). Chunk size never
+grows with the document: a long document simply has more chunks, and if their
+summaries are still too large they are chunked and mapped again, round after
+round, until they fit. A round that does not make the text shorter is
+discarded.
+
+A failed map call is retried `MAP_REDUCE_MAP_RETRIES` times; a chunk that
+still has no summary is passed on whole (never cut) and counted in
+`map_failures`. Every chunk of the document is mapped: a document submits at
+most `MAP_REDUCE_MAX_IN_FLIGHT` map calls at a time, waiting for a wave to
+finish before the next, so one huge upload cannot queue hundreds of calls
+ahead of everyone else on the shared pool and provider rate limit. Text that
+is still over budget after `MAP_REDUCE_MAX_ROUNDS` rounds is returned as is;
+trimming it (and telling the user) is the caller's job.
+
+Chunks are anchored to content-defined page breaks (see services.chunker), and
+summaries are joined with page breaks for the next round, so when an edited
+document is condensed again the chunks of unchanged pages are identical and
+their summaries come straight from the LLM response cache.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+MAP_REDUCE_TOKEN_THRESHOLD = int(os.getenv("MAP_REDUCE_TOKEN_THRESHOLD", "12000"))
+MAP_REDUCE_CHUNK_TOKENS = int(os.getenv("MAP_REDUCE_CHUNK_TOKENS", "3000"))
+MAP_REDUCE_CHUNK_OVERLAP = int(os.getenv("MAP_REDUCE_CHUNK_OVERLAP", "50"))  # tokens
+MAP_REDUCE_MAX_WORKERS = int(os.getenv("MAP_REDUCE_MAX_WORKERS", "4"))
+MAP_REDUCE_MAX_ROUNDS = int(os.getenv("MAP_REDUCE_MAX_ROUNDS", "6"))
+MAP_REDUCE_MAX_IN_FLIGHT = int(os.getenv("MAP_REDUCE_MAX_IN_FLIGHT", "16"))  # map calls queued per document
+MAP_REDUCE_MAP_RETRIES = int(os.getenv("MAP_REDUCE_MAP_RETRIES", "1"))
+MAP_REDUCE_PAGE_ANCHORS = int(os.getenv("MAP_REDUCE_PAGE_ANCHORS", "4"))
+
+CHARS_PER_TOKEN = 4
+PAGE_BREAK = "\f"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English prose)."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class MapReduceSummarizer:
+    """Chooses between single-shot and map-reduce and runs the map step."""
+
+    def __init__(self, split_fn: Callable[..., List[str]],
+                 token_threshold: int = MAP_REDUCE_TOKEN_THRESHOLD,
+                 chunk_tokens: int = MAP_REDUCE_CHUNK_TOKENS,
+                 chunk_overlap: int = MAP_REDUCE_CHUNK_OVERLAP,
+                 max_workers: int = MAP_REDUCE_MAX_WORKERS,
+                 max_rounds: int = MAP_REDUCE_MAX_ROUNDS,
+                 max_in_flight: int = MAP_REDUCE_MAX_IN_FLIGHT,
+                 map_retries: int = MAP_REDUCE_MAP_RETRIES,
+                 page_anchors: int = MAP_REDUCE_PAGE_ANCHORS,
+                 token_counter: Callable[[str], int] = estimate_tokens):
+        self.split_fn = split_fn
+        self.token_threshold = token_threshold
+        self.chunk_tokens = chunk_tokens
+        self.chunk_overlap = chunk_overlap
+        self.max_rounds = max_rounds
+        self.max_in_flight = max(1, max_in_flight)
+        self.map_retries = max(0, map_retries)
+        self.page_anchors = page_anchors
+        self.token_counter = token_counter
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="map-reduce")
+        self._lock = threading.Lock()
+        self._stats = {"single_shot": 0, "map_reduce": 0, "chunks_mapped": 0, "map_rounds": 0, "map_failures": 0,
+                       "map_retries": 0, "map_waves": 0}
+
+    def needs_map_reduce(self, text: str, token_limit: Optional[int] = None) -> bool:
+        limit = self.token_threshold if token_limit is None else token_limit
+        return self.token_counter(text) > limit
+
+    def split(self, text: str) -> List[str]:
+        """Chunks of at most `chunk_tokens` tokens; concurrency is bounded by the pool, not by merging."""
+        return self.split_fn(text, chunk_size=self.chunk_tokens, chunk_overlap=self.chunk_overlap,
+                             page_anchors=self.page_anchors, length_function=self.token_counter)
+
+    def _map_one(self, map_fn: Callable[[str], Optional[str]], chunk: str) -> str:
+        for attempt in range(self.map_retries + 1):
+            if attempt:
+                with self._lock:
+                    self._stats["map_retries"] += 1
+            try:
+                summary = map_fn(chunk)
+            except Exception:
+                summary = None
+            if summary:
+                return summary
+        with self._lock:
+            self._stats["map_failures"] += 1
+        # Nothing of the section is lost: the next round (or the caller's budget) deals with its size
+        return chunk
+
+    def condense(self, text: str, map_fn: Callable[[str], Optional[str]], token_limit: Optional[int] = None) -> str:
+        """Return `text` unchanged if it fits, otherwise its joined chunk summaries."""
+        if not self.needs_map_reduce(text, token_limit):
+            with self._lock:
+                self._stats["single_shot"] += 1
+            return text
+        with self._lock:
+            self._stats["map_reduce"] += 1
+        for _ in range(self.max_rounds):
+            chunks = self.split(text)
+            summaries = self._map_all(map_fn, chunks)
+            with self._lock:
+                self._stats["chunks_mapped"] += len(chunks)
+                self._stats["map_rounds"] += 1
+            # Page breaks keep the next round's chunks anchored to unchanged summaries
+            condensed = PAGE_BREAK.join(summaries)
+            if len(condensed) >= len(text):
+                break  # this round did not condense anything; keep its input
+            text = condensed
+            if not self.needs_map_reduce(text, token_limit) or len(chunks) == 1:
+                break
+        return text
+
+    def _map_all(self, map_fn: Callable[[str], Optional[str]], chunks: List[str]) -> List[str]:
+        """Summaries of all `chunks` in order, with at most `max_in_flight` of them queued at once."""
+        summaries: List[str] = []
+        for start in range(0, len(chunks), self.max_in_flight):
+            wave = chunks[start:start + self.max_in_flight]
+            summaries.extend(self._pool.map(lambda chunk: self._map_one(map_fn, chunk), wave))
+            with self._lock:
+                self._stats["map_waves"] += 1
+        return summaries
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["token_threshold"] = self.token_threshold
+        stats["chunk_tokens"] = self.chunk_tokens
+        stats["max_in_flight"] = self.max_in_flight
+        return stats
@@ -0,0 +1,248 @@
+"""Boilerplate and near-duplicate removal before text is prompted.
+
+Two passes over the texts of one request (notes first, then each file):
+
+1. Boilerplate: within each file, a line in the top (or bottom) few lines of
+   a page that recurs there, after masking digits, on a large share of its
+   pages and on a run of nearby pages is a running header/footer. Every copy
+   after the first is dropped, so a heading that happens to repeat still
+   survives once. A bare number at a page edge is a page number only when
+   the numbers increase from one page to the next; a lone number is kept.
+2. Near duplicates: paragraphs across *all* texts are MinHashed over word
+   shingles and bucketed with LSH banding; a paragraph whose estimated
+   Jaccard similarity to an earlier one reaches the threshold is dropped.
+
+Page breaks (form feeds) are preserved so page-anchored chunking still works.
+"""
+
+import os
+import re
+import threading
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from services.token_budget import count_tokens
+
+BOILERPLATE_EDGE_LINES = int(os.getenv("BOILERPLATE_EDGE_LINES", "3"))
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+BOILERPLATE_PAGE_FRACTION = float(os.getenv("BOILERPLATE_PAGE_FRACTION", "0.3"))
+BOILERPLATE_MAX_LINE_CHARS = 120
+BOILERPLATE_MAX_PAGE_GAP = 2  # running headers may alternate between odd and even pages
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+DEDUP_MIN_WORDS = int(os.getenv("DEDUP_MIN_WORDS", "8"))
+DEDUP_SHINGLE_WORDS = 3
+MINHASH_BANDS = 8
+MINHASH_ROWS = 8
+
+PAGE_BREAK = "\f"
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+PAGE_NUMBER = re.compile(r"^(?:page\s*)?[-–—]?\s*\d+\s*[-–—]?(?:\s*(?:of|/)\s*\d+)?$", re.IGNORECASE)
+DIGITS = re.compile(r"\d+")
+WORD = re.compile(r"\w+")
+
+_PRIME = np.uint64(4294967291)  # largest prime below 2**32
+_rng = np.random.default_rng(1)
+_A = _rng.integers(1, 2**31, size=MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64)
+_B = _rng.integers(0, 2**31, size=MINHASH_BANDS * MINHASH_ROWS, dtype=np.uint64)
+
+
+@dataclass
+class CleanReport:
+    tokens_before: int = 0
+    tokens_after: int = 0
+    boilerplate_lines: int = 0
+    page_numbers: int = 0
+    duplicate_paragraphs: int = 0
+    examples: List[str] = field(default_factory=list)
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def to_dict(self):
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "tokens_saved": self.tokens_saved,
+            "boilerplate_lines": self.boilerplate_lines,
+            "page_numbers": self.page_numbers,
+            "duplicate_paragraphs": self.duplicate_paragraphs,
+            "boilerplate_examples": self.examples,
+        }
+
+
+def _line_key(line: str) -> str:
+    # "Page 3 of 10" and "Page 4 of 10" are the same footer
+    return DIGITS.sub("#", " ".join(line.lower().split()))
+
+
+def _edge_lines(lines: List[str]) -> List[Tuple[int, str]]:
+    """(index, side) of the non-blank lines in the top and bottom edges of a page."""
+    edge = BOILERPLATE_EDGE_LINES
+    sides = [(i, "top") for i in range(min(edge, len(lines)))]
+    sides += [(i, "bottom") for i in range(max(0, len(lines) - edge), len(lines))]
+    return [(i, side) for i, side in sides if lines[i].strip()]
+
+
+def _longest_run(page_numbers: List[int]) -> int:
+    """Longest stretch of (sorted) pages with at most BOILERPLATE_MAX_PAGE_GAP between neighbours."""
+    longest = run = 1
+    for previous, current in zip(page_numbers, page_numbers[1:]):
+        run = run + 1 if current - previous <= BOILERPLATE_MAX_PAGE_GAP else 1
+        longest = max(longest, run)
+    return longest
+
+
+def _page_number_lines(pages: List[List[str]]) -> set:
+    """(page, line) positions of edge numbers that increase across consecutive pages."""
+    candidates = []
+    for lines in pages:
+        found = {}
+        for i, _ in _edge_lines(lines):
+            stripped = lines[i].strip()
+            if PAGE_NUMBER.match(stripped):
+                found[i] = int(DIGITS.search(stripped).group())
+        candidates.append(found)
+    confirmed = set()
+    for page, found in enumerate(candidates):
+        before = candidates[page - 1].values() if page else ()
+        after = candidates[page + 1].values() if page + 1 < len(candidates) else ()
+        for i, number in found.items():
+            if any(other < number for other in before) or any(other > number for other in after):
+                confirmed.add((page, i))
+    return confirmed
+
+
+def strip_boilerplate(text: str, report: CleanReport) -> str:
+    """Drop running headers/footers and page numbers from one file's pages."""
+    pages = [page.split("\n") for page in text.split(PAGE_BREAK)]
+    page_numbers = _page_number_lines(pages)
+
+    repeated = set()
+    if len(pages) >= BOILERPLATE_MIN_PAGES:
+        seen_on = defaultdict(list)
+        for page, lines in enumerate(pages):
+            keys = {
+                (side, _line_key(lines[i])) for i, side in _edge_lines(lines)
+                if len(lines[i]) <= BOILERPLATE_MAX_LINE_CHARS and not PAGE_NUMBER.match(lines[i].strip())
+            }
+            for key in keys:
+                seen_on[key].append(page)
+        min_pages = max(BOILERPLATE_MIN_PAGES, int(len(pages) * BOILERPLATE_PAGE_FRACTION))
+        repeated = {
+            key for key, on in seen_on.items()
+            if len(on) >= min_pages and _longest_run(on) >= BOILERPLATE_MIN_PAGES
+        }
+
+    first_copy_kept = set()
+    cleaned_pages = []
+    for page, lines in enumerate(pages):
+        seen, dropped = set(), set()
+        for i, side in _edge_lines(lines):
+            if i in seen:
+                continue  # a short page's line can be in both edges
+            seen.add(i)
+            stripped = lines[i].strip()
+            if (page, i) in page_numbers:
+                report.page_numbers += 1
+                dropped.add(i)
+                continue
+            key = (side, _line_key(lines[i]))
+            if key not in repeated:
+                continue
+            if key not in first_copy_kept:
+                first_copy_kept.add(key)
+                continue
+            report.boilerplate_lines += 1
+            dropped.add(i)
+            if len(report.examples) < 5 and stripped not in report.examples:
+                report.examples.append(stripped)
+        cleaned_pages.append("\n".join(line for i, line in enumerate(lines) if i not in dropped))
+    return PAGE_BREAK.join(cleaned_pages)
+
+
+def _minhash(words: List[str]) -> np.ndarray:
+    shingles = {" ".join(words[i:i + DEDUP_SHINGLE_WORDS]) for i in range(max(1, len(words) - DEDUP_SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    # (a * x + b) mod p for every permutation at once; a, b < 2**31 and x < 2**32 cannot overflow uint64
+    return ((hashes[:, None] * _A[None, :] + _B[None, :]) % _PRIME).min(axis=0)
+
+
+class NearDuplicateFilter:
+    """MinHash/LSH index of the paragraphs kept so far in one request."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._signatures: List[np.ndarray] = []
+        self._buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+
+    def is_duplicate(self, paragraph: str) -> bool:
+        """True if paragraph nearly repeats an earlier one; otherwise remembers it."""
+        words = WORD.findall(paragraph.lower())
+        if len(words) < DEDUP_MIN_WORDS:
+            return False
+        signature = _minhash(words)
+        bands = [(band, signature[band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS].tobytes())
+                 for band in range(MINHASH_BANDS)]
+        candidates = {index for key in bands for index in self._buckets.get(key, ())}
+        for index in candidates:
+            if float(np.mean(self._signatures[index] == signature)) >= self.threshold:
+                return True
+        index = len(self._signatures)
+        self._signatures.append(signature)
+        for key in bands:
+            self._buckets[key].append(index)
+        return False
+
+
+def _dedupe(text: str, seen: NearDuplicateFilter, report: CleanReport) -> str:
+    pages = []
+    for page in text.split(PAGE_BREAK):
+        kept = []
+        for paragraph in PARAGRAPH_BREAK.split(page):
+            if seen.is_duplicate(paragraph):
+                report.duplicate_paragraphs += 1
+            else:
+                kept.append(paragraph)
+        pages.append("\n\n".join(kept))
+    return PAGE_BREAK.join(pages)
+
+
+class TextCleaner:
+    """Runs both passes over a request's texts and keeps cumulative savings."""
+
+    def __init__(self, token_counter: Callable[[str], int] = count_tokens):
+        self.token_counter = token_counter
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "tokens_before": 0, "tokens_saved": 0,
+                       "boilerplate_lines": 0, "page_numbers": 0, "duplicate_paragraphs": 0}
+
+    def clean(self, texts: List[str], boilerplate: List[bool]) -> Tuple[List[str], CleanReport]:
+        """Clean `texts` in order; `boilerplate[i]` says whether texts[i] has PDF pages."""
+        report = CleanReport(tokens_before=sum(self.token_counter(text) for text in texts))
+        seen = NearDuplicateFilter()
+        cleaned = []
+        for text, has_pages in zip(texts, boilerplate):
+            if has_pages:
+                text = strip_boilerplate(text, report)
+            cleaned.append(_dedupe(text, seen, report).strip())
+        report.tokens_after = sum(self.token_counter(text) for text in cleaned)
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["tokens_before"] += report.tokens_before
+            self._stats["tokens_saved"] += report.tokens_saved
+            self._stats["boilerplate_lines"] += report.boilerplate_lines
+            self._stats["page_numbers"] += report.page_numbers
+            self._stats["duplicate_paragraphs"] += report.duplicate_paragraphs
+        return cleaned, report
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+text_cleaner = TextCleaner()
@@ -0,0 +1,223 @@
+"""Token accounting and per-endpoint prompt budgets.
+
+Prompt sizes are measured locally before anything is sent: with tiktoken when
+it is installed (one cached encoder per model) and with the ~4 characters per
+token estimate otherwise. Each endpoint has a token budget; inputs over it are
+trimmed (the map-reduce step in services.summarizer handles the large-document
+case before that). Every provider call then records the prompt and completion
+tokens the provider actually billed, next to the local estimate, per endpoint
+and model, for capacity planning.
+"""
+
+import json
+import os
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from services.summarizer import CHARS_PER_TOKEN, estimate_tokens
+
+TRUNCATION_MARKER = "\n\n[... content truncated to fit the token budget ...]"
+
+# Input budgets per endpoint, in tokens; override with TOKEN_BUDGET_<ENDPOINT>
+DEFAULT_BUDGETS = {
+    "process_content": 12000,
+    "quiz": 12000,
+    "map": 4000,
+    "explain_more": 6000,
+    "interactive_questions": 6000,
+    "agent": 8000,
+    "default": 16000,
+}
+
+# Largest prompt each model accepts; prompts over it skip that provider
+MODEL_INPUT_LIMITS = {
+    "openai/gpt-4o": int(os.getenv("GITHUB_MAX_INPUT_TOKENS", "8000")),
+    "gemini-1.5-flash": 1_000_000,
+    "gemini-1.5-pro-latest": 2_000_000,
+}
+
+
+class _HeuristicEncoder:
+    name = "chars/4"
+
+    def count(self, text: str) -> int:
+        return estimate_tokens(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        return text[:max_tokens * CHARS_PER_TOKEN]
+
+
+class _TiktokenEncoder:
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.name = encoding.name
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:max_tokens])
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model: str):
+    """Cached encoder for `model`; Gemini has no local tokenizer, so it shares GPT-4o's."""
+    try:
+        import tiktoken
+    except ImportError:
+        return _HeuristicEncoder()
+    try:
+        return _TiktokenEncoder(tiktoken.encoding_for_model(model.split("/")[-1]))
+    except KeyError:
+        pass
+    except Exception:
+        return _HeuristicEncoder()  # encoding files could not be loaded
+    try:
+        return _TiktokenEncoder(tiktoken.get_encoding("o200k_base"))
+    except Exception:
+        return _HeuristicEncoder()
+
+
+def count_tokens(text: str, model: str = "openai/gpt-4o") -> int:
+    return get_encoder(model).count(text or "")
+
+
+class TokenBudget:
+    """Enforces endpoint budgets and aggregates estimated vs. actual token usage."""
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = dict(DEFAULT_BUDGETS, **(budgets or {}))
+        for endpoint in list(self.budgets):
+            override = os.getenv(f"TOKEN_BUDGET_{endpoint.upper()}")
+            if override:
+                self.budgets[endpoint] = int(override)
+        self._lock = threading.Lock()
+        self._usage: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._trims: Dict[str, int] = {}
+
+    def budget(self, endpoint: str) -> int:
+        return self.budgets.get(endpoint, self.budgets["default"])
+
+    def fits_model(self, prompt_tokens: int, model: str) -> bool:
+        limit = MODEL_INPUT_LIMITS.get(model)
+        return limit is None or prompt_tokens <= limit
+
+    def fit(self, text: str, endpoint: str, model: str = "openai/gpt-4o", reserve: int = 0) -> str:
+        """Trim `text` so it (plus `reserve` tokens of prompt scaffolding) fits the endpoint budget."""
+        limit = self.budget(endpoint) - reserve
+        encoder = get_encoder(model)
+        if not text or encoder.count(text) <= limit:
+            return text
+        with self._lock:
+            self._trims[endpoint] = self._trims.get(endpoint, 0) + 1
+        marker_tokens = encoder.count(TRUNCATION_MARKER)
+        return encoder.truncate(text, max(0, limit - marker_tokens)) + TRUNCATION_MARKER
+
+    def fit_payload(self, payload: Dict[str, Any], endpoint: str, model: str = "openai/gpt-4o",
+                    reserve: int = 0, serialize: Callable[[Any], str] = json.dumps) -> Dict[str, Any]:
+        """Trim a JSON payload until `serialize(payload)` (what is actually sent) fits the endpoint budget.
+
+        The largest top-level field is reduced first: strings are truncated, lists
+        lose their oldest items (one is always kept, then trimmed itself if it is a
+        string). Every field and list item is measured once; trimming subtracts
+        those costs, and the serialized payload is measured again only at the end
+        (another pass runs if the estimate fell short).
+        """
+        payload = dict(payload)
+        encoder = get_encoder(model)
+        limit = self.budget(endpoint) - reserve
+        marker_tokens = encoder.count(TRUNCATION_MARKER)
+        trimmed, exhausted = False, set()
+        total = encoder.count(serialize(payload))
+        while total > limit:
+            if not self._trim_payload(payload, encoder, serialize, total - limit, marker_tokens, exhausted):
+                break
+            trimmed = True
+            total = encoder.count(serialize(payload))
+        if trimmed:
+            with self._lock:
+                self._trims[endpoint] = self._trims.get(endpoint, 0) + 1
+        return payload
+
+    def _trim_payload(self, payload: Dict[str, Any], encoder, serialize: Callable[[Any], str], excess: int,
+                      marker_tokens: int, exhausted: set) -> bool:
+        """One pass of fit_payload: cut about `excess` tokens in place; False if nothing could be cut."""
+        sizes = {key: encoder.count(serialize(value)) for key, value in payload.items()
+                 if isinstance(value, (str, list)) and key not in exhausted}
+        item_costs: Dict[str, List[int]] = {}
+        starts: Dict[str, int] = {}
+        changed = False
+        while excess > 0 and sizes:
+            key = max(sizes, key=sizes.get)
+            value = payload[key]
+            if isinstance(value, list) and len(value) - starts.get(key, 0) > 1:
+                if key not in item_costs:
+                    # +1 for the separator each item brings along
+                    item_costs[key] = [encoder.count(serialize(item)) + 1 for item in value]
+                start = starts.get(key, 0)
+                starts[key] = start + 1  # the oldest entry goes first (e.g. session history)
+                sizes[key] -= item_costs[key][start]
+                excess -= item_costs[key][start]
+                changed = True
+                continue
+            if isinstance(value, list):
+                value = payload[key] = value[starts.pop(key, 0):]
+                if value and isinstance(value[0], str) and encoder.count(value[0]) > marker_tokens:
+                    cut = self._truncate_string(encoder, value[0], excess, marker_tokens)
+                    payload[key] = [cut]
+                    excess -= encoder.count(value[0]) - encoder.count(cut)
+                    changed = True
+                exhausted.add(key)
+                del sizes[key]
+                continue
+            cut = self._truncate_string(encoder, value, excess, marker_tokens)
+            cut_size = encoder.count(serialize(cut))
+            if cut_size < sizes[key]:
+                payload[key] = cut
+                excess -= sizes[key] - cut_size
+                sizes[key] = cut_size
+                changed = True
+            if cut_size >= sizes[key] or encoder.count(cut) <= marker_tokens:
+                exhausted.add(key)  # nothing is left to cut but the marker
+                del sizes[key]
+        for key, start in starts.items():
+            payload[key] = payload[key][start:]
+        return changed
+
+    @staticmethod
+    def _truncate_string(encoder, value: str, excess: int, marker_tokens: int) -> str:
+        if value.endswith(TRUNCATION_MARKER):
+            value = value[:-len(TRUNCATION_MARKER)]
+        keep = max(0, encoder.count(value) - max(excess, 1))
+        return encoder.truncate(value, max(0, keep - marker_tokens)) + TRUNCATION_MARKER
+
+    def record(self, endpoint: str, model: str, estimated_prompt: int,
+               prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None):
+        """Record one call; provider-reported counts are used when present."""
+        with self._lock:
+            usage = self._usage.setdefault(endpoint or "default", {}).setdefault(model, {
+                "calls": 0, "estimated_prompt_tokens": 0, "prompt_tokens": 0,
+                "completion_tokens": 0, "calls_with_provider_usage": 0,
+            })
+            usage["calls"] += 1
+            usage["estimated_prompt_tokens"] += estimated_prompt
+            usage["prompt_tokens"] += prompt_tokens if prompt_tokens is not None else estimated_prompt
+            usage["completion_tokens"] += completion_tokens or 0
+            usage["calls_with_provider_usage"] += int(prompt_tokens is not None)
+
+    def stats(self):
+        with self._lock:
+            usage = {endpoint: {model: dict(counts) for model, counts in models.items()}
+                     for endpoint, models in self._usage.items()}
+            trims = dict(self._trims)
+        return {
+            "encoder": get_encoder("openai/gpt-4o").name,
+            "budgets": dict(self.budgets),
+            "trimmed": trims,
+            "usage": usage,
+        }
+
+
+token_budget = TokenBudget()
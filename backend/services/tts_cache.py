@@ -0,0 +1,219 @@
+"""Content-addressed cache of synthesized sentences.
+
+Entries are keyed by the SHA-256 of (normalized sentence, voice, speed,
+lang_code, engine version), so a different voice or a new engine release never
+returns stale audio. Audio is stored as 16-bit FLAC in `tts_cache.db` shared
+by all workers, size-capped with least-recently-used eviction, and decoded
+float32 arrays for hot sentences are kept in a per-process LRU bounded by
+bytes.
+"""
+
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Iterable, Optional, Set
+
+import numpy as np
+import soundfile as sf
+
+from services.audio_stream import TTS_SAMPLE_RATE
+
+TTS_CACHE_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tts_cache.db")
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+TTS_CACHE_MEMORY_BYTES = int(os.getenv("TTS_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+
+
+def normalize_sentence(sentence: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", sentence).split())
+
+
+def make_segment_key(sentence: str, voice: str, speed: float, lang_code: str, engine_version: str) -> str:
+    payload = json.dumps([normalize_sentence(sentence), voice, float(speed), lang_code, engine_version],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSSegmentCache:
+    """Two-tier (memory LRU + SQLite/FLAC) cache of per-sentence audio."""
+
+    def __init__(self, sample_rate: int = TTS_SAMPLE_RATE, db_path: str = TTS_CACHE_DB_PATH,
+                 max_bytes: int = TTS_CACHE_MAX_BYTES, memory_bytes: int = TTS_CACHE_MEMORY_BYTES):
+        self.sample_rate = sample_rate
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self._memory = OrderedDict()  # key -> float32 array
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0,
+                       "seconds_served_from_cache": 0.0}
+        self.init_database()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        # INSERT OR REPLACE only fires the size triggers for the row it replaces with this on
+        conn.execute("PRAGMA recursive_triggers = ON")
+        return conn
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS tts_segments (
+                    segment_key TEXT PRIMARY KEY,
+                    audio BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_tts_segments_access ON tts_segments (last_access)")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    stored_bytes INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS tts_segments_size_insert AFTER INSERT ON tts_segments BEGIN
+                    UPDATE cache_size SET stored_bytes = stored_bytes + new.size WHERE id = 0;
+                END
+            ''')
+            conn.execute('''
+                CREATE TRIGGER IF NOT EXISTS tts_segments_size_delete AFTER DELETE ON tts_segments BEGIN
+                    UPDATE cache_size SET stored_bytes = stored_bytes - old.size WHERE id = 0;
+                END
+            ''')
+            # Recounted once per start, so rows written before the triggers existed are counted too
+            conn.execute('''
+                INSERT OR REPLACE INTO cache_size (id, stored_bytes)
+                SELECT 0, COALESCE(SUM(size), 0) FROM tts_segments
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _remember(self, key: str, audio: np.ndarray):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = audio
+            self._memory_used += audio.nbytes
+            while self._memory_used > self.memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= evicted.nbytes
+
+    def _count(self, name: str, audio: Optional[np.ndarray] = None):
+        with self._lock:
+            self._stats[name] += 1
+            if audio is not None:
+                self._stats["seconds_served_from_cache"] += len(audio) / self.sample_rate
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+        if audio is not None:
+            self._count("memory_hits", audio)
+            return audio
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT audio FROM tts_segments WHERE segment_key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE tts_segments SET last_access = ? WHERE segment_key = ?", (time.time(), key))
+                conn.commit()
+        finally:
+            conn.close()
+        if row is None:
+            self._count("misses")
+            return None
+        try:
+            audio, _ = sf.read(io.BytesIO(row[0]), dtype="float32")
+        except Exception:
+            self._count("misses")
+            return None
+        self._remember(key, audio)
+        self._count("disk_hits", audio)
+        return audio
+
+    def contains(self, keys: Iterable[str]) -> Set[str]:
+        """Which of `keys` are cached, without decoding any audio."""
+        wanted = list(dict.fromkeys(keys))
+        with self._lock:
+            found = {key for key in wanted if key in self._memory}
+        missing = [key for key in wanted if key not in found]
+        conn = self._connect()
+        try:
+            for start in range(0, len(missing), 500):
+                batch = missing[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                found.update(row[0] for row in conn.execute(
+                    f"SELECT segment_key FROM tts_segments WHERE segment_key IN ({marks})", batch
+                ))
+        finally:
+            conn.close()
+        return found
+
+    def put(self, key: str, audio: np.ndarray):
+        audio = np.asarray(audio, dtype=np.float32)
+        buffer = io.BytesIO()
+        sf.write(buffer, audio, self.sample_rate, format="FLAC", subtype="PCM_16")
+        data = buffer.getvalue()
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO tts_segments (segment_key, audio, size, samples, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (key, data, len(data), len(audio), now, now))
+            evicted = self._evict(conn)
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(key, audio)
+        with self._lock:
+            self._stats["stores"] += 1
+            self._stats["evictions"] += evicted
+
+    def _evict(self, conn) -> int:
+        """Drop least-recently-used segments until the store fits max_bytes."""
+        total = conn.execute("SELECT stored_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+        evicted = 0
+        while total > self.max_bytes:
+            # The oldest segment comes straight off the last_access index
+            row = conn.execute("SELECT segment_key, size FROM tts_segments "
+                               "ORDER BY last_access ASC LIMIT 1").fetchone()
+            if row is None:
+                break
+            conn.execute("DELETE FROM tts_segments WHERE segment_key = ?", (row[0],))
+            total -= row[1]
+            evicted += 1
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_used
+        stats["seconds_served_from_cache"] = round(stats["seconds_served_from_cache"], 1)
+        conn = self._connect()
+        try:
+            count = conn.execute("SELECT COUNT(*) FROM tts_segments").fetchone()[0]
+            size = conn.execute("SELECT stored_bytes FROM cache_size WHERE id = 0").fetchone()[0]
+        finally:
+            conn.close()
+        stats.update({"disk_entries": count, "disk_bytes": size, "max_bytes": self.max_bytes})
+        return stats
+
+
+tts_cache = TTSSegmentCache()
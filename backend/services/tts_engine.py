@@ -0,0 +1,147 @@
+"""Lifecycle of the text-to-speech pipeline.
+
+Importing the app never builds the model. `TTS_PRELOAD` selects when it is
+loaded:
+
+* ``lazy`` (default): on the first synthesis request in each worker, so
+  workers that never serve speech never pay for it.
+* ``worker``: in a background thread as each worker starts (`start`).
+* ``master``: in the gunicorn master before it forks (`preload`, called from
+  gunicorn.conf.py, which also turns on ``preload_app``), so every worker
+  shares the weights copy-on-write; each worker then runs only the warm-up
+  synthesis after fork.
+
+Every load is followed by a short warm-up synthesis, and both steps are
+timed. `ready` turns true once the warm-up is done, which the /ready probe
+uses to keep preloading workers out of rotation until then.
+"""
+
+import os
+import threading
+import time
+from importlib import metadata
+from typing import Optional
+
+TTS_LANG_CODE = os.getenv("TTS_LANG_CODE", "a")
+TTS_VOICE = 'af_heart'
+TTS_PRELOAD = os.getenv("TTS_PRELOAD", "lazy").lower()
+TTS_WARMUP_TEXT = os.getenv("TTS_WARMUP_TEXT", "Hello, and welcome back.")
+
+PRELOAD_MODES = ("lazy", "worker", "master")
+
+
+class TTSEngine:
+    """Loads the pipeline once per process (or once before fork) and warms it up."""
+
+    def __init__(self, lang_code: str = TTS_LANG_CODE, voice: str = TTS_VOICE, preload: str = TTS_PRELOAD,
+                 warmup_text: str = TTS_WARMUP_TEXT):
+        self.lang_code = lang_code
+        self.voice = voice
+        self.preload_mode = preload if preload in PRELOAD_MODES else "lazy"
+        self.warmup_text = warmup_text
+        self._pipeline = None
+        self._warm = False
+        self._error: Optional[str] = None
+        self._load_lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._stats = {"load_seconds": None, "warmup_seconds": None, "loaded_in_pid": None, "warmed_in_pid": None}
+
+    @property
+    def ready(self) -> bool:
+        return self._warm
+
+    @property
+    def required_for_readiness(self) -> bool:
+        # Lazily loading workers must not wait for a request that only readiness would let in
+        return self.preload_mode != "lazy"
+
+    def state(self) -> str:
+        if self._warm:
+            return "warm"
+        if self._error:
+            return "failed"
+        return "loaded" if self._pipeline is not None else "cold"
+
+    def version(self) -> str:
+        """Installed engine version, read without importing the model code."""
+        try:
+            return metadata.version("kokoro")
+        except metadata.PackageNotFoundError:
+            return "unknown"
+
+    def load(self):
+        """Build the pipeline if this process has not yet (it survives fork from a preloading master)."""
+        if self._pipeline is not None:
+            return self._pipeline
+        with self._load_lock:
+            if self._pipeline is None:
+                start = time.perf_counter()
+                try:
+                    from kokoro import KPipeline
+                    self._pipeline = KPipeline(lang_code=self.lang_code)
+                except Exception as e:
+                    self._error = f"load failed: {e}"
+                    raise RuntimeError(f"TTS pipeline could not be loaded: {e}") from e
+                self._stats["load_seconds"] = round(time.perf_counter() - start, 3)
+                self._stats["loaded_in_pid"] = os.getpid()
+                self._error = None
+                print(f"🔊 TTS pipeline loaded in {self._stats['load_seconds']}s (pid {os.getpid()})")
+        return self._pipeline
+
+    def warm_up(self):
+        """Load if needed, then run one short synthesis to initialize lazy model state."""
+        pipeline = self.load()
+        if self._warm:
+            return pipeline
+        with self._warm_lock:
+            if not self._warm:
+                start = time.perf_counter()
+                try:
+                    for _ in pipeline(self.warmup_text, voice=self.voice, speed=1):
+                        pass
+                except Exception as e:
+                    self._error = f"warm-up failed: {e}"
+                    raise RuntimeError(f"TTS warm-up failed: {e}") from e
+                self._stats["warmup_seconds"] = round(time.perf_counter() - start, 3)
+                self._stats["warmed_in_pid"] = os.getpid()
+                self._error = None
+                self._warm = True
+        return pipeline
+
+    def get(self):
+        """The warm pipeline, loading and warming it on first use."""
+        return self.warm_up()
+
+    def start_warmup(self):
+        """Load and warm up in a background thread; failures surface through stats() and /ready."""
+        def run():
+            try:
+                self.warm_up()
+            except RuntimeError as e:
+                print(f"⚠️ {e}")
+
+        threading.Thread(target=run, name="tts-warmup", daemon=True).start()
+
+    def preload(self):
+        """Called in the gunicorn master before it forks: load the weights in ``master`` mode."""
+        if self.preload_mode == "master":
+            # Weights only; the warm-up runs in each worker (`start`) so no inference
+            # threads exist in the master when it forks
+            try:
+                self.load()
+            except RuntimeError as e:
+                print(f"⚠️ {e}")
+
+    def start(self):
+        """Called once in each serving process: load (unless inherited) and warm up in the background."""
+        if self.preload_mode != "lazy":
+            self.start_warmup()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats.update({"state": self.state(), "ready": self._warm, "preload": self.preload_mode,
+                      "error": self._error, "version": self.version()})
+        return stats
+
+
+tts_engine = TTSEngine()
@@ -0,0 +1,276 @@
+"""Multi-core speech synthesis across sentence batches.
+
+Sentences to synthesize are grouped into batches of `TTS_BATCH_SENTENCES` and
+dispatched to a process pool in which every worker loads its own pipeline
+once. A worker writes a batch's float32 samples into a shared-memory block and
+returns only the block name and per-sentence lengths, so audio is never
+pickled; the parent copies the samples out, unlinks the block and yields
+sentences in their original order. Only a bounded window of batches is in
+flight, so long documents do not pile up in memory.
+
+The first sentence is always synthesized in-process while the pool works on
+the rest, so the first audio waits for one sentence rather than a batch.
+Short inputs are synthesized entirely in-process, where pool dispatch would
+cost more than it saves. The pool is started by the first TTS request, which
+warms every worker up in the background. Only with `TTS_PRELOAD=worker` (or
+`TTS_POOL_PRESTART=1`) does `start()` build it when a serving process starts
+(see app.start_worker_services); `is_ready` then reports when every worker
+has finished its warm-up. With ``lazy`` or ``master`` preloading no pool
+worker loads a model until speech is actually requested.
+If a pool worker dies, the request in progress finishes in-process and the
+broken pool is replaced (and warmed up again) on next use or readiness check.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from services.audio_stream import to_float32
+from services.tts_engine import TTS_LANG_CODE, TTS_PRELOAD, TTS_VOICE, TTS_WARMUP_TEXT
+
+# Every pool worker holds its own copy of the model, in every gunicorn worker: keep this small
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(max(1, min(2, (os.cpu_count() or 2) // 2)))))
+TTS_BATCH_SENTENCES = int(os.getenv("TTS_BATCH_SENTENCES", "4"))
+TTS_PARALLEL_MIN_SENTENCES = int(os.getenv("TTS_PARALLEL_MIN_SENTENCES", "8"))
+# torch must not be forked after it has started its thread pools
+TTS_POOL_START_METHOD = os.getenv("TTS_POOL_START_METHOD", "spawn")
+# Unset: prestart only when the engine preloads per worker (TTS_PRELOAD=worker)
+_prestart = os.getenv("TTS_POOL_PRESTART", "").lower()
+TTS_POOL_PRESTART = (_prestart in ("1", "true", "yes")) if _prestart else None
+
+Synthesizer = Callable[[str, str, float], np.ndarray]
+
+_worker_pipeline = None
+
+
+def synthesize_with(pipeline, sentence: str, voice: str, speed: float) -> np.ndarray:
+    """All audio the pipeline produces for one sentence, as mono float32."""
+    parts = [to_float32(audio) for _, _, audio in pipeline(sentence, voice=voice, speed=speed)]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+def _init_worker(lang_code: str, threads: int):
+    global _worker_pipeline
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from kokoro import KPipeline
+    _worker_pipeline = KPipeline(lang_code=lang_code)
+
+
+def warm_worker(text: str, voice: str) -> int:
+    """Worker entry point: one throwaway synthesis so the first real batch runs at full speed."""
+    synthesize_with(_worker_pipeline, text, voice, 1)
+    return os.getpid()
+
+
+def synthesize_batch(sentences: List[str], voice: str, speed: float) -> Tuple[Optional[str], List[int]]:
+    """Worker entry point: (shared-memory block name, samples per sentence)."""
+    parts = [synthesize_with(_worker_pipeline, sentence, voice, speed) for sentence in sentences]
+    lengths = [len(part) for part in parts]
+    total = sum(lengths)
+    if not total:
+        return None, lengths
+    block = shared_memory.SharedMemory(create=True, size=total * 4)
+    try:
+        np.concatenate(parts, out=np.ndarray((total,), dtype=np.float32, buffer=block.buf))
+    finally:
+        block.close()
+    return block.name, lengths
+
+
+def _collect(name: Optional[str], lengths: List[int]) -> List[np.ndarray]:
+    """Copy a batch out of shared memory and free the block."""
+    if name is None:
+        return [np.zeros(0, dtype=np.float32) for _ in lengths]
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        samples = np.ndarray((sum(lengths),), dtype=np.float32, buffer=block.buf).copy()
+    finally:
+        block.close()
+        block.unlink()
+    return np.split(samples, np.cumsum(lengths)[:-1])
+
+
+def _release(future: Future):
+    # Abandoned batch (client went away): still free its shared memory
+    if future.cancelled() or future.exception() is not None:
+        return
+    name, _ = future.result()
+    if name is not None:
+        block = shared_memory.SharedMemory(name=name)
+        block.close()
+        block.unlink()
+
+
+def _is_broken(pool: ProcessPoolExecutor) -> bool:
+    # Set by the executor once a worker process has died; every later submit would raise
+    return bool(getattr(pool, "_broken", False))
+
+
+class TTSScheduler:
+    """Fans sentence batches out to per-process pipelines and yields audio in order."""
+
+    def __init__(self, max_workers: int = TTS_WORKERS, batch_sentences: int = TTS_BATCH_SENTENCES,
+                 parallel_min_sentences: int = TTS_PARALLEL_MIN_SENTENCES,
+                 start_method: str = TTS_POOL_START_METHOD, lang_code: str = TTS_LANG_CODE,
+                 prestart: Optional[bool] = TTS_POOL_PRESTART, preload_mode: str = TTS_PRELOAD):
+        self.max_workers = max(1, max_workers)
+        self.batch_sentences = max(1, batch_sentences)
+        self.parallel_min_sentences = parallel_min_sentences
+        self.start_method = start_method
+        self.lang_code = lang_code
+        # Each pool worker loads its own model, so only a per-worker preload starts them at boot
+        self.prestart = preload_mode == "worker" if prestart is None else prestart
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_pid = None
+        self._warmups: List[Future] = []
+        self._stats = {"requests": 0, "parallel_requests": 0, "sentences": 0, "batches": 0,
+                       "shared_memory_bytes": 0, "seconds": 0.0, "broken_pools": 0, "local_fallbacks": 0}
+
+    @property
+    def uses_pool(self) -> bool:
+        return self.max_workers > 1
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Pools don't survive fork, so each gunicorn worker builds its own; a pool broken
+        # by a dead worker is replaced as well
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid() or _is_broken(self._pool):
+                if self._pool is not None and self._pool_pid == os.getpid():
+                    self._pool.shutdown(wait=False, cancel_futures=True)
+                    self._stats["broken_pools"] += 1
+                try:
+                    context = multiprocessing.get_context(self.start_method)
+                except ValueError:
+                    context = None
+                threads = max(1, (os.cpu_count() or 1) // self.max_workers)
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                 initializer=_init_worker, initargs=(self.lang_code, threads))
+                self._pool_pid = os.getpid()
+                # Workers are spawned on demand, so one warm-up per worker spawns them all
+                self._warmups = [self._pool.submit(warm_worker, TTS_WARMUP_TEXT, TTS_VOICE)
+                                 for _ in range(self.max_workers)]
+            return self._pool
+
+    def start(self):
+        """Called once per serving process: start and warm up the pool now if prestarting."""
+        if self.uses_pool and self.prestart:
+            self._get_pool()
+
+    def is_ready(self) -> bool:
+        """Whether every pool worker is warm; a broken pool is replaced (and reports not ready)."""
+        if not (self.uses_pool and self.prestart):
+            return True
+        with self._lock:
+            current = self._pool is not None and self._pool_pid == os.getpid()
+            broken = current and _is_broken(self._pool)
+            warmups = list(self._warmups) if current else []
+        if broken:
+            self._get_pool()
+            return False
+        return bool(warmups) and all(future.done() and future.exception() is None for future in warmups)
+
+    def _pool_state(self) -> str:
+        if not self.uses_pool:
+            return "disabled"
+        with self._lock:
+            current = self._pool is not None and self._pool_pid == os.getpid()
+            if current and _is_broken(self._pool):
+                return "broken"
+            warmups = list(self._warmups) if current else []
+        if not warmups:
+            return "not started" if self.prestart else "on demand"
+        if any(future.done() and future.exception() is not None for future in warmups):
+            return "failed"
+        return "warm" if all(future.done() for future in warmups) else "warming"
+
+    def synthesize(self, sentences: Sequence[str], voice: str, speed: float,
+                   local: Synthesizer) -> Iterator[np.ndarray]:
+        """Audio for each sentence, in order; `local` synthesizes in-process for short inputs."""
+        start = time.perf_counter()
+        parallel = self.uses_pool and len(sentences) >= self.parallel_min_sentences
+        if self.uses_pool and not parallel:
+            # The first request starts the pool (warming up in the background) for the long ones to come
+            self._get_pool()
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["parallel_requests"] += int(parallel)
+            self._stats["sentences"] += len(sentences)
+        try:
+            if not parallel:
+                for sentence in sentences:
+                    yield local(sentence, voice, speed)
+            else:
+                yield from self._synthesize_parallel(sentences, voice, speed, local)
+        finally:
+            with self._lock:
+                self._stats["seconds"] += time.perf_counter() - start
+
+    def _synthesize_parallel(self, sentences: Sequence[str], voice: str, speed: float,
+                             local: Synthesizer) -> Iterator[np.ndarray]:
+        pool = self._get_pool()
+        batches = deque(
+            list(sentences[start:start + self.batch_sentences])
+            for start in range(1, len(sentences), self.batch_sentences)
+        )
+        in_flight = deque()
+
+        def submit():
+            # Two batches per worker keeps every core busy without buffering the whole document
+            while batches and len(in_flight) < self.max_workers * 2:
+                in_flight.append(pool.submit(synthesize_batch, batches.popleft(), voice, speed))
+
+        done = 0  # sentences already yielded
+        try:
+            submit()
+            # The pool starts on the rest while the first sentence is synthesized here
+            audio = local(sentences[0], voice, speed)
+            done += 1
+            yield audio
+            while in_flight:
+                name, lengths = in_flight.popleft().result()
+                with self._lock:
+                    self._stats["batches"] += 1
+                    self._stats["shared_memory_bytes"] += sum(lengths) * 4
+                submit()
+                for audio in _collect(name, lengths):
+                    done += 1
+                    yield audio
+        except BrokenProcessPool:
+            # A pool worker died; finish this request in-process (the next _get_pool replaces the pool)
+            with self._lock:
+                self._stats["local_fallbacks"] += 1
+            for sentence in sentences[done:]:
+                yield local(sentence, voice, speed)
+        finally:
+            for future in in_flight:
+                if not future.cancel():
+                    future.add_done_callback(_release)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["seconds"] = round(stats["seconds"], 3)
+        stats.update({"workers": self.max_workers, "batch_sentences": self.batch_sentences,
+                      "parallel_min_sentences": self.parallel_min_sentences, "pool": self._pool_state()})
+        return stats
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None and self._pool_pid == os.getpid():
+                self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+            self._pool_pid = None
+            self._warmups = []
@@ -0,0 +1,425 @@
+"""In-process dense vector index over document chunks.
+
+Each indexed document gets its own directory under `vector_index/` holding a
+float32 matrix of L2-normalised chunk vectors (`vectors.npy`, opened with
+`mmap_mode="r"` so workers share the page cache instead of private copies),
+the chunk texts, and optionally an IVF partitioning. Queries are answered with
+batched matrix products. Documents are content-addressed by the SHA-256 of
+their text, so re-indexing the same text is a no-op.
+
+Chunks are embedded with a signed hashing vectorizer (unigrams + bigrams) by
+default, which needs nothing beyond NumPy. Setting
+`VECTOR_EMBEDDER=sentence-transformers:<model>` uses that local CPU model
+instead when the package is installed.
+
+Chunk vectors are also cached by chunk hash in `embeddings.db`, so a new
+version of a document only embeds the chunks whose text changed.
+
+Document ids come from clients, so only the 32-hex-digit ids `document_id`
+produces are ever joined into paths. Each access refreshes the document
+directory's mtime, and once the index outgrows `VECTOR_INDEX_MAX_BYTES` the
+least recently used documents are removed. Evictions are reported to
+`eviction_listeners`, so an index built alongside (BM25) can drop the same
+documents: its hits are only useful with the chunk texts stored here.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+VECTOR_INDEX_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "vector_index")
+VECTOR_EMBEDDER = os.getenv("VECTOR_EMBEDDER", "hashing")
+VECTOR_DIM = int(os.getenv("VECTOR_DIM", "1024"))
+VECTOR_IVF_MIN_CHUNKS = int(os.getenv("VECTOR_IVF_MIN_CHUNKS", "4096"))
+VECTOR_IVF_NPROBE = int(os.getenv("VECTOR_IVF_NPROBE", "8"))
+VECTOR_OPEN_DOCUMENTS = int(os.getenv("VECTOR_OPEN_DOCUMENTS", "64"))
+VECTOR_CACHE_MAX_ROWS = int(os.getenv("VECTOR_CACHE_MAX_ROWS", "200000"))
+VECTOR_INDEX_MAX_BYTES = int(os.getenv("VECTOR_INDEX_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+VECTOR_SCORE_BLOCK = 65536  # rows scored per matrix product, bounds temporary memory
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['\-][a-z0-9]+)*")
+DOCUMENT_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class HashingEmbedder:
+    """Signed feature hashing of unigrams and bigrams with sublinear term frequency."""
+
+    def __init__(self, dim: int = VECTOR_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            tokens = tokenize(text)
+            features = Counter(tokens)
+            features.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+            for feature, count in features.items():
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                matrix[row, h % self.dim] += sign * (1.0 + math.log(count))
+        return _normalize(matrix)
+
+
+class SentenceTransformerEmbedder:
+    """Local CPU sentence-transformers model, loaded on first use."""
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name, device="cpu")
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.name = f"st-{model_name}"
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = self.model.encode(list(texts), batch_size=32, convert_to_numpy=True, show_progress_bar=False)
+        return _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim))
+
+
+def make_embedder(spec: str = VECTOR_EMBEDDER):
+    if spec.startswith("sentence-transformers:"):
+        try:
+            return SentenceTransformerEmbedder(spec.split(":", 1)[1])
+        except Exception as e:
+            print(f"⚠️ Could not load {spec} ({e}); using the hashing vectorizer")
+    return HashingEmbedder()
+
+
+def document_id(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def is_document_id(value) -> bool:
+    return isinstance(value, str) and DOCUMENT_ID_PATTERN.fullmatch(value) is not None
+
+
+def touch(path: str):
+    """Mark a document directory as recently used."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def remove_document_dir(root: str, doc_id: str) -> bool:
+    """Delete one document directory; False if it was already gone."""
+    # Rename first so readers never open a half-deleted document
+    trash = os.path.join(root, f".evicted-{doc_id}-{os.getpid()}")
+    try:
+        os.rename(os.path.join(root, doc_id), trash)
+    except OSError:
+        return False  # another worker removed it first
+    shutil.rmtree(trash, ignore_errors=True)
+    return True
+
+
+def evict_documents(root: str, max_bytes: int, keep: Sequence[str] = ()) -> List[str]:
+    """Remove least recently used document directories under `root` until they fit in `max_bytes`."""
+    documents = []
+    total = 0
+    for entry in os.scandir(root):
+        if not entry.is_dir(follow_symlinks=False) or not is_document_id(entry.name):
+            continue
+        try:
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            documents.append((entry.stat().st_mtime, entry.name, size))
+        except OSError:
+            continue  # removed by another worker meanwhile
+        total += size
+    evicted = []
+    for _, doc_id, size in sorted(documents):
+        if total <= max_bytes:
+            break
+        if doc_id in keep or not remove_document_dir(root, doc_id):
+            continue
+        total -= size
+        evicted.append(doc_id)
+    return evicted
+
+
+@dataclass
+class SearchHit:
+    chunk_id: int
+    score: float
+    text: str
+
+
+class _Document:
+    """One document's memory-mapped vectors, chunk texts and optional IVF lists."""
+
+    def __init__(self, path: str):
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "chunks.json"), encoding="utf-8") as f:
+            self.chunks = json.load(f)
+        self.centroids = self.list_order = self.list_offsets = None
+        ivf_path = os.path.join(path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            self.centroids = ivf["centroids"]
+            self.list_order = ivf["order"]
+            self.list_offsets = ivf["offsets"]
+
+    def candidates(self, queries: np.ndarray, nprobe: int) -> Optional[np.ndarray]:
+        """Row ids in the nprobe closest IVF lists of any query, or None for exhaustive search."""
+        if self.centroids is None:
+            return None
+        nprobe = min(nprobe, len(self.centroids))
+        probed = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        lists = np.unique(probed)
+        return np.concatenate([self.list_order[self.list_offsets[i]:self.list_offsets[i + 1]] for i in lists])
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """Indices of the k best scores per row, best first."""
+    k = min(k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def train_ivf(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0):
+    """Spherical k-means; returns (centroids, row order grouped by list, list offsets)."""
+    rng = np.random.default_rng(seed)
+    centroids = np.array(vectors[rng.choice(len(vectors), size=nlist, replace=False)], dtype=np.float32)
+    assignments = np.zeros(len(vectors), dtype=np.int32)
+    for _ in range(iterations):
+        for start in range(0, len(vectors), VECTOR_SCORE_BLOCK):
+            block = np.asarray(vectors[start:start + VECTOR_SCORE_BLOCK])
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, np.asarray(vectors))
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]  # keep empty lists where they were
+        centroids = _normalize(sums)
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    offsets = np.searchsorted(assignments[order], np.arange(nlist + 1)).astype(np.int64)
+    return centroids, order, offsets
+
+
+class VectorIndex:
+    """Per-document dense index with exhaustive or IVF top-k search."""
+
+    def __init__(self, root: str = VECTOR_INDEX_DIR, embedder=None,
+                 ivf_min_chunks: int = VECTOR_IVF_MIN_CHUNKS, nprobe: int = VECTOR_IVF_NPROBE,
+                 open_documents: int = VECTOR_OPEN_DOCUMENTS, cache_max_rows: int = VECTOR_CACHE_MAX_ROWS,
+                 max_bytes: int = VECTOR_INDEX_MAX_BYTES):
+        self.embedder = embedder or make_embedder()
+        self.root = os.path.join(root, re.sub(r"[^A-Za-z0-9._-]", "_", self.embedder.name))
+        self.ivf_min_chunks = ivf_min_chunks
+        self.nprobe = nprobe
+        self.open_documents = open_documents
+        self.cache_max_rows = cache_max_rows
+        self.max_bytes = max_bytes
+        self._open = OrderedDict()  # doc_id -> _Document
+        self._lock = threading.Lock()
+        self._stats = {"documents_indexed": 0, "chunks_indexed": 0, "chunks_embedded": 0, "already_indexed": 0,
+                       "documents_evicted": 0, "documents_removed": 0, "queries": 0, "ivf_queries": 0,
+                       "rows_scored": 0}
+        self.eviction_listeners: List[Callable[[str], None]] = []
+        os.makedirs(self.root, exist_ok=True)
+        self.cache_path = os.path.join(self.root, "embeddings.db")
+        self.init_database()
+
+    def _connect(self):
+        return sqlite3.connect(self.cache_path, timeout=10)
+
+    def init_database(self):
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS chunk_vectors (
+                    chunk_hash TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_vectors_access ON chunk_vectors (last_access)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _embed(self, chunks: List[str]) -> np.ndarray:
+        """Embed chunks, reusing cached vectors for chunk texts seen before."""
+        vectors = np.zeros((len(chunks), self.embedder.dim), dtype=np.float32)
+        hashes = [hashlib.sha1(chunk.encode("utf-8")).hexdigest() for chunk in chunks]
+        cached = {}
+        now = time.time()
+        conn = self._connect()
+        try:
+            unique = list(dict.fromkeys(hashes))
+            for start in range(0, len(unique), 500):
+                batch = unique[start:start + 500]
+                marks = ",".join("?" * len(batch))
+                for chunk_hash, blob in conn.execute(
+                    f"SELECT chunk_hash, vector FROM chunk_vectors WHERE chunk_hash IN ({marks})", batch
+                ).fetchall():
+                    cached[chunk_hash] = np.frombuffer(blob, dtype=np.float32)
+                conn.execute(f"UPDATE chunk_vectors SET last_access = ? WHERE chunk_hash IN ({marks})", (now, *batch))
+            missing = [i for i, chunk_hash in enumerate(hashes) if chunk_hash not in cached]
+            if missing:
+                embedded = self.embedder.embed([chunks[i] for i in missing])
+                vectors[missing] = embedded
+                conn.executemany(
+                    "INSERT OR REPLACE INTO chunk_vectors (chunk_hash, vector, last_access) VALUES (?, ?, ?)",
+                    [(hashes[i], embedded[row].tobytes(), now) for row, i in enumerate(missing)]
+                )
+                conn.execute('''
+                    DELETE FROM chunk_vectors WHERE chunk_hash IN (
+                        SELECT chunk_hash FROM chunk_vectors ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                    )
+                ''', (self.cache_max_rows,))
+            conn.commit()
+        finally:
+            conn.close()
+        for i, chunk_hash in enumerate(hashes):
+            if chunk_hash in cached:
+                vectors[i] = cached[chunk_hash]
+        with self._lock:
+            self._stats["chunks_embedded"] += len(missing)
+        return vectors
+
+    def _path(self, doc_id: str) -> str:
+        if not is_document_id(doc_id):
+            raise ValueError(f"Invalid document id {doc_id!r}")
+        return os.path.join(self.root, doc_id)
+
+    def has_document(self, doc_id: str) -> bool:
+        return is_document_id(doc_id) and os.path.exists(os.path.join(self._path(doc_id), "chunks.json"))
+
+    def add_document(self, text: str, chunks: List[str], doc_id: Optional[str] = None) -> str:
+        """Embed and persist `chunks` of `text`; returns the document id."""
+        doc_id = doc_id or document_id(text)
+        if self.has_document(doc_id):
+            touch(self._path(doc_id))
+            with self._lock:
+                self._stats["already_indexed"] += 1
+            return doc_id
+        path = self._path(doc_id)
+        vectors = self._embed(chunks)
+        # Build in a scratch directory and rename, so readers never see a partial document
+        staging = tempfile.mkdtemp(dir=self.root, prefix=".staging-")
+        try:
+            np.save(os.path.join(staging, "vectors.npy"), vectors)
+            if len(chunks) >= self.ivf_min_chunks:
+                centroids, order, offsets = train_ivf(vectors, nlist=int(math.sqrt(len(chunks))))
+                np.savez(os.path.join(staging, "ivf.npz"), centroids=centroids, order=order, offsets=offsets)
+            # chunks.json is written last: its presence marks a complete document
+            with open(os.path.join(staging, "chunks.json"), "w", encoding="utf-8") as f:
+                json.dump(chunks, f, ensure_ascii=False)
+            try:
+                os.rename(staging, path)
+            except OSError:
+                pass  # another worker indexed the same text first
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        evicted = evict_documents(self.root, self.max_bytes, keep=(doc_id,))
+        with self._lock:
+            self._stats["documents_indexed"] += 1
+            self._stats["chunks_indexed"] += len(chunks)
+            self._stats["documents_evicted"] += len(evicted)
+            for evicted_id in evicted:
+                self._open.pop(evicted_id, None)
+        for evicted_id in evicted:
+            for listener in self.eviction_listeners:
+                listener(evicted_id)
+        return doc_id
+
+    def remove_document(self, doc_id: str) -> bool:
+        """Drop one document (e.g. because a companion index evicted it)."""
+        if not is_document_id(doc_id):
+            return False
+        removed = remove_document_dir(self.root, doc_id)
+        with self._lock:
+            self._open.pop(doc_id, None)
+            self._stats["documents_removed"] += int(removed)
+        return removed
+
+    def _document(self, doc_id: str) -> Optional[_Document]:
+        if not is_document_id(doc_id):
+            return None
+        touch(self._path(doc_id))
+        with self._lock:
+            document = self._open.get(doc_id)
+            if document is not None:
+                self._open.move_to_end(doc_id)
+                return document
+        if not self.has_document(doc_id):
+            return None
+        document = _Document(self._path(doc_id))
+        with self._lock:
+            self._open[doc_id] = document
+            while len(self._open) > self.open_documents:
+                self._open.popitem(last=False)
+        return document
+
+    def search_batch(self, doc_id: str, queries: List[str], k: int = 4) -> List[List[SearchHit]]:
+        """Top-k chunks of one document for each query, via one matrix product per block."""
+        document = self._document(doc_id)
+        if document is None or not queries or not len(document.chunks):
+            return [[] for _ in queries]
+        query_vectors = self.embedder.embed(queries)
+        candidates = document.candidates(query_vectors, self.nprobe)
+        if candidates is None:
+            scores = np.concatenate([
+                query_vectors @ np.asarray(document.vectors[start:start + VECTOR_SCORE_BLOCK]).T
+                for start in range(0, len(document.chunks), VECTOR_SCORE_BLOCK)
+            ], axis=1)
+            rows = np.arange(len(document.chunks))
+        else:
+            rows = np.sort(candidates)
+            scores = query_vectors @ np.asarray(document.vectors[rows]).T
+        with self._lock:
+            self._stats["queries"] += len(queries)
+            self._stats["ivf_queries"] += len(queries) if candidates is not None else 0
+            self._stats["rows_scored"] += len(rows) * len(queries)
+        results = []
+        for query_scores, best in zip(scores, _top_k(scores, k)):
+            results.append([
+                SearchHit(int(rows[i]), float(query_scores[i]), document.chunks[int(rows[i])])
+                for i in best if query_scores[i] > 0
+            ])
+        return results
+
+    def search(self, doc_id: str, query: str, k: int = 4) -> List[SearchHit]:
+        return self.search_batch(doc_id, [query], k)[0]
+
+    def chunk_texts(self, doc_id: str, chunk_ids: Sequence[int]) -> List[str]:
+        document = self._document(doc_id)
+        if document is None:
+            return []
+        return [document.chunks[i] for i in chunk_ids if 0 <= i < len(document.chunks)]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_documents"] = len(self._open)
+        stats["embedder"] = self.embedder.name
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+
+vector_index = VectorIndex()
@@ -0,0 +1,66 @@
+import io
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from services.audio_encoding import FORMATS, AudioEncoder, AudioOutput, _StreamSink, resample
+
+RATE = 24000
+
+
+def tone(frequency, seconds=0.5, rate=RATE):
+    return (0.3 * np.sin(2 * np.pi * frequency * np.arange(int(rate * seconds)) / rate)).astype(np.float32)
+
+
+def dominant_frequency(audio, rate):
+    spectrum = np.abs(np.fft.rfft(audio))
+    return np.fft.rfftfreq(len(audio), 1 / rate)[spectrum.argmax()]
+
+
+def test_resample_keeps_duration_and_pitch():
+    out = resample(tone(440), RATE, 16000)
+    assert len(out) == 8000
+    assert dominant_frequency(out, 16000) == pytest.approx(440, abs=5)
+
+
+def test_resample_filters_what_the_target_rate_cannot_hold():
+    # 7 kHz is above the 4 kHz Nyquist limit at 8 kHz and must not fold back in
+    out = resample(tone(7000), RATE, 8000)
+    assert np.abs(out).max() < 0.05
+
+
+def test_resample_is_a_no_op_at_the_same_rate():
+    audio = tone(440)
+    assert resample(audio, RATE, RATE) is audio
+
+
+def test_stream_sink_hands_out_bytes_once_and_drops_late_fixups():
+    sink = _StreamSink()
+    sink.write(b"header--")
+    sink.write(b"body")
+    assert sink.drain() == b"header--body"
+    sink.seek(0)
+    sink.write(b"HEADER")  # lands in bytes already sent
+    assert sink.drain() == b""
+    sink.seek(0, io.SEEK_END)
+    sink.write(b"tail")
+    assert sink.tell() == 16
+    assert sink.drain() == b"tail"
+
+
+@pytest.mark.parametrize("name", sorted(FORMATS))
+def test_streamed_output_decodes(name):
+    encoder = AudioEncoder(AudioOutput(FORMATS[name]), streaming=True)
+    data = b"".join(encoder.write(tone(440, 0.25)) for _ in range(4)) + encoder.close()
+    audio, rate = sf.read(io.BytesIO(data))
+    assert rate == RATE
+    assert len(audio) == pytest.approx(RATE, rel=0.05)
+    assert encoder.bytes_out == len(data)
+
+
+def test_flac_is_never_streamed():
+    encoder = AudioEncoder(AudioOutput(FORMATS["flac"]), streaming=True)
+    assert not encoder.streaming
+    assert encoder.write(tone(440)) == b""
+    assert sf.read(io.BytesIO(encoder.close()))[0].shape == (RATE // 2,)
@@ -0,0 +1,51 @@
+import pytest
+
+from services.bm25_index import BM25Index
+from services.vector_index import document_id
+
+CHUNKS = [
+    "Photosynthesis turns light into chemical energy in the chloroplast.",
+    "Mitochondria release that energy through cellular respiration.",
+    "The Krebs cycle is one stage of cellular respiration in the mitochondria.",
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    return BM25Index(root=str(tmp_path / "bm25"))
+
+
+def test_search_ranks_chunks_by_the_query_terms(index):
+    doc_id = index.add_document(document_id("doc"), CHUNKS)
+    hits = index.search(doc_id, "krebs cycle respiration", k=3)
+    assert [chunk_id for chunk_id, _ in hits] == [2, 1]
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search(doc_id, "quantum", k=3) == []
+
+
+def test_documents_persist_and_reindexing_is_a_no_op(index):
+    doc_id = index.add_document(document_id("doc"), CHUNKS)
+    reopened = BM25Index(root=index.root)
+    assert reopened.has_document(doc_id)
+    assert reopened.search(doc_id, "chloroplast")[0][0] == 0
+    reopened.add_document(doc_id, CHUNKS)
+    assert reopened.stats()["already_indexed"] == 1
+
+
+def test_only_document_ids_reach_the_filesystem(index):
+    assert not index.has_document("../../etc")
+    assert index.search("../../etc", "energy") == []
+    with pytest.raises(ValueError):
+        index.add_document("../../etc", CHUNKS)
+
+
+def test_least_recently_used_documents_are_evicted_and_reported(tmp_path):
+    index = BM25Index(root=str(tmp_path / "bm25"), max_bytes=1)
+    evicted = []
+    index.eviction_listeners.append(evicted.append)
+    first = index.add_document(document_id("first"), CHUNKS)
+    second = index.add_document(document_id("second"), CHUNKS)
+    assert evicted == [first]
+    assert not index.has_document(first) and index.has_document(second)
+    assert index.remove_document(second)
+    assert not index.has_document(second)
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from services.chunker import iter_chunks, split_text
+from services.token_budget import count_tokens
+
+PAGE = ("First sentence of the page. Second sentence follows here. " * 8 + "\n\n") * 3
+
+
+def test_chunks_fit_and_overlap():
+    chunks = split_text(PAGE, chunk_size=200, chunk_overlap=50)
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 200 for chunk in chunks)
+    for previous, current in zip(chunks, chunks[1:]):
+        head = current[:20]
+        assert head in previous  # each chunk starts inside the previous chunk's tail
+
+
+def test_every_word_survives_chunking():
+    words = PAGE.split()
+    chunked = " ".join(split_text(PAGE, chunk_size=120, chunk_overlap=0)).split()
+    assert chunked == words
+
+
+def test_an_unbreakable_run_is_hard_split():
+    url = "https://example.com/" + "a" * 450
+    chunks = split_text(url, chunk_size=100, chunk_overlap=0)
+    assert "".join(chunks) == url
+    assert all(len(chunk) <= 100 for chunk in chunks)
+
+
+def test_page_stream_matches_form_feed_joined_text():
+    pages = [f"Page {n} text. " * 20 for n in range(4)]
+    assert split_text(iter(pages), 150, 30) == split_text("\f".join(pages), 150, 30)
+
+
+def test_page_anchors_end_a_chunk_at_every_page_break():
+    pages = ["Alpha page.", "Beta page.", "Gamma page."]
+    assert split_text(pages, chunk_size=1000, chunk_overlap=0, page_anchors=1) == pages
+    assert split_text(pages, chunk_size=1000, chunk_overlap=0) == ["Alpha page.\nBeta page.\nGamma page."]
+
+
+def test_overlap_must_be_smaller_than_the_chunk():
+    with pytest.raises(ValueError):
+        next(iter_chunks("text", chunk_size=10, chunk_overlap=10))
+
+
+def utf8_length(text):
+    return len(text.encode("utf-8"))
+
+
+@pytest.mark.parametrize("length_function", [len, utf8_length, count_tokens])
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(50, 10), (120, 0), (300, 60)])
+def test_every_chunk_stays_under_the_limit(length_function, chunk_size, chunk_overlap):
+    rng = random.Random(chunk_size)
+    words = "photosynthesis chlorophyll naïve 東京 e=mc² https://example.com/a?b=c mitochondria".split()
+    pages = ["\n\n".join(" ".join(rng.choice(words) for _ in range(rng.randint(5, 80))) + "." for _ in range(5))
+             for _ in range(6)]
+    pages.append("東京x9Q" * 400)  # one unbreakable run, hard-split by length_function
+    chunks = split_text(pages, chunk_size, chunk_overlap, length_function=length_function)
+    assert chunks and all(length_function(chunk) <= chunk_size for chunk in chunks)
+
+
+def test_hard_split_fills_chunks_by_the_length_function():
+    run = "x9Q" * 2000
+    chunks = split_text(run, chunk_size=100, chunk_overlap=0, length_function=count_tokens)
+    assert "".join(chunks) == run
+    # Cut by tokens, not by 100 characters (which would be far fewer than 100 tokens)
+    assert all(count_tokens(chunk) > 90 for chunk in chunks[:-1])
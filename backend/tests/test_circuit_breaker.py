@@ -0,0 +1,53 @@
+import time
+
+from services.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitBreakerRegistry
+
+
+def tripped(recovery_timeout=60.0, **kwargs):
+    breaker = CircuitBreaker("test", failure_threshold=2, recovery_timeout=recovery_timeout, **kwargs)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_consecutive_failures_and_short_circuits():
+    breaker = CircuitBreaker("test", failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED  # the success reset the count
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow_request()
+    assert breaker.snapshot()["short_circuited"] == 1
+
+
+def test_half_open_lets_a_limited_number_of_trials_through():
+    breaker = tripped(recovery_timeout=0.01)
+    time.sleep(0.02)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.release()  # the trial never reached the provider
+    assert breaker.allow_request()
+
+
+def test_a_trial_success_closes_and_a_trial_failure_reopens():
+    breaker = tripped(recovery_timeout=0.01)
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+    breaker = tripped(recovery_timeout=0.01)
+    time.sleep(0.02)
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert [t["to"] for t in breaker.transitions] == [OPEN, HALF_OPEN, OPEN]
+
+
+def test_registry_keeps_one_breaker_per_provider():
+    registry = CircuitBreakerRegistry()
+    assert registry.get("github") is registry.get("github")
+    assert set(registry.stats()) == {"github"}
@@ -0,0 +1,137 @@
+import pytest
+import requests
+
+import app
+from services.extraction_cache import ExtractionCache
+from services.pdf_extraction import SpooledPDF
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b"", content_type="application/octet-stream"):
+        self.status_code = status_code
+        self.body = body
+        self.headers = {"content-type": content_type}
+        self.chunks_read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error", response=self)
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.body), chunk_size):
+            self.chunks_read += 1
+            yield self.body[start:start + chunk_size]
+
+
+class FakeSession:
+    """Stands in for http_client, answering every GET with the next queued response"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append((url, kwargs.get("headers", {})))
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def fresh_verdicts(monkeypatch):
+    monkeypatch.setattr(app, "_pdf_verdicts", {})
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ExtractionCache(db_path=str(tmp_path / "extraction_cache.db"))
+    monkeypatch.setattr(app, "extraction_cache", cache)
+    return cache
+
+
+def serve(monkeypatch, bodies):
+    """Answer download_file from `bodies` (url -> bytes) without touching the network"""
+    def download_file(file_url, validators=None):
+        spool = SpooledPDF()
+        spool.write(bodies[file_url])
+        return spool, None, None
+    monkeypatch.setattr(app, "download_file", download_file)
+
+
+def test_a_pdf_that_fails_to_extract_is_skipped_and_not_cached(cache, monkeypatch):
+    urls = ["https://example.com/good.pdf", "https://example.com/corrupt.pdf"]
+    serve(monkeypatch, {urls[0]: b"%PDF-good", urls[1]: b"%PDF-corrupt"})
+
+    def extract(spool, lineage=None):
+        if lineage == f"url:{urls[1]}":
+            raise ValueError("broken xref table")
+        return "Photosynthesis converts light into chemical energy."
+    monkeypatch.setattr(app, "extract_text_from_pdf", extract)
+
+    text = app.gather_content_text("", urls)
+    assert "Photosynthesis" in text
+    assert cache.lookup_url(urls[0]) is not None
+    assert cache.lookup_url(urls[1]) is None
+
+
+def test_a_request_whose_only_pdf_fails_to_extract_is_rejected(cache, monkeypatch):
+    url = "https://example.com/corrupt.pdf"
+    serve(monkeypatch, {url: b"%PDF-corrupt"})
+
+    def extract(spool, lineage=None):
+        raise ValueError("broken xref table")
+    monkeypatch.setattr(app, "extract_text_from_pdf", extract)
+
+    with pytest.raises(app.ContentProcessingError) as excinfo:
+        app.gather_content_text("", [url])
+    assert excinfo.value.status_code == 400
+
+
+def test_the_probe_asks_for_a_range_and_reads_only_the_magic_number(monkeypatch):
+    session = FakeSession(FakeResponse(206, b"%PDF-1.7" + b"\0" * 1016))
+    monkeypatch.setattr(app, "http_client", session)
+    assert app.is_valid_pdf("https://example.com/download?id=1")
+    assert session.requests[0][1]["Range"] == f"bytes=0-{app.PDF_PROBE_BYTES - 1}"
+
+
+def test_a_server_that_ignores_range_is_not_read_past_the_probe(monkeypatch):
+    response = FakeResponse(200, b"%PDF-1.7" + b"\0" * 10 * app.PDF_PROBE_BYTES)
+    monkeypatch.setattr(app, "http_client", FakeSession(response))
+    assert app.is_valid_pdf("https://example.com/download?id=1")
+    assert response.chunks_read == 1  # the rest of the body is left to the download
+
+
+def test_a_non_pdf_is_rejected_before_it_is_downloaded(cache, monkeypatch):
+    session = FakeSession(FakeResponse(206, b"<!DOCTYPE html><html>", content_type="text/html"))
+    monkeypatch.setattr(app, "http_client", session)
+    monkeypatch.setattr(app, "download_file", lambda *args: pytest.fail("a non-PDF must not be downloaded"))
+    with pytest.raises(app.NotAPDFError):
+        app.download_and_extract("https://example.com/page")
+    assert len(session.requests) == 1
+
+
+def test_a_416_leaves_the_decision_to_the_download(monkeypatch):
+    monkeypatch.setattr(app, "http_client", FakeSession(FakeResponse(416)))
+    assert app.is_valid_pdf("https://example.com/empty")
+    assert app.cached_pdf_verdict("https://example.com/empty") is None
+
+
+def test_a_verdict_is_reused_without_probing_again(monkeypatch):
+    session = FakeSession(FakeResponse(206, b"GIF89a", content_type="image/gif"))
+    monkeypatch.setattr(app, "http_client", session)
+    assert not app.is_valid_pdf("https://example.com/image")
+    assert not app.is_valid_pdf("https://example.com/image")
+    assert len(session.requests) == 1
+
+
+def test_a_download_records_the_verdict_for_the_next_probe(monkeypatch):
+    session = FakeSession(FakeResponse(200, b"%PDF-1.7 body"))
+    monkeypatch.setattr(app, "http_client", session)
+    spool, _, _ = app.download_file("https://example.com/download?id=2")
+    spool.close()
+    assert app.is_valid_pdf("https://example.com/download?id=2")
+    assert len(session.requests) == 1
@@ -0,0 +1,83 @@
+import sqlite3
+
+from services.extraction_cache import ExtractionCache
+
+
+def make_cache(tmp_path, **kwargs):
+    return ExtractionCache(db_path=str(tmp_path / "extraction_cache.db"), **kwargs)
+
+
+def stored_bytes(cache):
+    conn = sqlite3.connect(cache.db_path)
+    try:
+        tracked = conn.execute("SELECT stored_bytes FROM cache_size").fetchone()[0]
+        actual = conn.execute('''
+            SELECT (SELECT COALESCE(SUM(stored_size), 0) FROM extracted_texts)
+                 + (SELECT COALESCE(SUM(stored_size), 0) FROM document_pages)
+        ''').fetchone()[0]
+    finally:
+        conn.close()
+    return tracked, actual
+
+
+def test_text_round_trips_and_misses_are_counted(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_text("abc", "hello world " * 50)
+    assert cache.get_text("abc") == "hello world " * 50
+    assert cache.get_text("missing") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_the_running_total_follows_inserts_replacements_and_evictions(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=10 ** 9)
+    cache.put_text("a", "first version")
+    cache.put_text("a", "second, longer version of the text")
+    cache.put_pages("url:x", {"p1": "page one", "p2": "page two"})
+    cache.put_pages("url:x", {"p1": "page one, edited"})
+    tracked, actual = stored_bytes(cache)
+    assert tracked == actual > 0
+    # A restart recounts, so a total that drifted (or a store from before the triggers) is corrected
+    conn = sqlite3.connect(cache.db_path)
+    conn.execute("UPDATE cache_size SET stored_bytes = 0")
+    conn.commit()
+    conn.close()
+    assert stored_bytes(make_cache(tmp_path)) == (actual, actual)
+
+
+def test_documents_and_pages_are_evicted_least_recently_used_first(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_text("old", "o" * 2000)
+    cache.put_pages("url:x", {"p1": "page text " * 100})
+    cache.put_text("new", "n" * 2000)
+    cache.get_text("old")  # now more recently used than the page
+    _, total = stored_bytes(cache)
+    cache.max_bytes = total  # the next write must evict exactly the least recently used row
+    cache.put_text("newest", "z" * 2000)
+    assert cache.get_pages("url:x", ["p1"]) == {}
+    assert cache.get_text("old") == "o" * 2000
+    assert cache.stats()["evictions"] == 1
+    tracked, actual = stored_bytes(cache)
+    assert tracked == actual <= cache.max_bytes
+
+
+def test_evicting_a_document_forgets_its_urls(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put_text("a", "text")
+    cache.remember_url("https://example.com/a.pdf", "a", etag='"v1"')
+    assert cache.lookup_url("https://example.com/a.pdf").etag == '"v1"'
+    cache.max_bytes = 0
+    cache.put_pages("url:y", {"p": "page"})
+    assert cache.lookup_url("https://example.com/a.pdf") is None
+
+
+def test_touching_a_url_keeps_it_past_the_url_cap(tmp_path):
+    cache = make_cache(tmp_path, max_urls=2)
+    cache.put_text("a", "text")
+    cache.remember_url("https://example.com/1.pdf", "a")
+    cache.remember_url("https://example.com/2.pdf", "a")
+    cache.touch_url("https://example.com/1.pdf")  # answered 304: still current
+    cache.remember_url("https://example.com/3.pdf", "a")
+    assert cache.lookup_url("https://example.com/1.pdf") is not None
+    assert cache.lookup_url("https://example.com/2.pdf") is None
+    assert cache.stats()["url_evictions"] == 1
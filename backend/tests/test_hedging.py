@@ -0,0 +1,82 @@
+import threading
+
+from services.hedging import HedgedRequester
+
+
+def make_hedger(**kwargs):
+    kwargs.setdefault("default_delay", 0.05)
+    kwargs.setdefault("min_samples", 1000)  # keep the default delay
+    return HedgedRequester(**kwargs)
+
+
+def test_a_fast_primary_wins_without_a_hedge():
+    hedger = make_hedger()
+    assert hedger.race(("github", lambda: "a"), ("gemini", lambda: "b")) == ("github", "a")
+    stats = hedger.stats()
+    assert stats["hedges_started"] == 0
+    assert stats["providers"]["github"]["wins"] == 1
+    assert "gemini" not in stats["providers"]  # never called
+
+
+def test_a_slow_primary_is_hedged_and_loses():
+    hedger = make_hedger()
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "late"
+
+    try:
+        assert hedger.race(("github", slow), ("gemini", lambda: "b")) == ("gemini", "b")
+    finally:
+        release.set()
+    stats = hedger.stats()
+    assert stats["hedges_started"] == 1
+    assert stats["providers"]["gemini"]["hedged_wins"] == 1
+    assert stats["providers"]["gemini"]["win_rate"] == 1.0
+
+
+def test_a_failed_primary_falls_back_to_the_secondary():
+    hedger = make_hedger(default_delay=5)
+    assert hedger.race(("github", lambda: None), ("gemini", lambda: "b")) == ("gemini", "b")
+    stats = hedger.stats()
+    assert stats["hedges_started"] == 0  # a fallback, not a hedge
+    assert stats["providers"]["github"]["failures"] == 1
+    assert stats["providers"]["gemini"]["hedged_wins"] == 0
+
+
+def test_a_saturated_pool_runs_the_secondary_in_the_caller():
+    hedger = make_hedger(max_workers=1)
+    release = threading.Event()
+    blocker = hedger._pool.submit(release.wait, 5)
+    primary_calls = []
+    try:
+        result = hedger.race(("github", lambda: primary_calls.append(1) or "a"),
+                             ("gemini", lambda: threading.current_thread().name))
+    finally:
+        release.set()
+        blocker.result()
+    provider, thread_name = result
+    assert provider == "gemini" and not thread_name.startswith("llm-hedge")
+    assert primary_calls == []  # the queued primary was cancelled, not run later
+    stats = hedger.stats()
+    assert stats["saturated_races"] == 1 and stats["hedges_started"] == 1
+
+
+def test_a_saturated_pool_still_tries_the_primary_inline():
+    hedger = make_hedger(max_workers=1)
+    release = threading.Event()
+    blocker = hedger._pool.submit(release.wait, 5)
+    try:
+        assert hedger.race(("github", lambda: "a"), ("gemini", lambda: None)) == ("github", "a")
+    finally:
+        release.set()
+        blocker.result()
+
+
+def test_without_hedging_the_chain_is_sequential():
+    hedger = make_hedger(enabled=False)
+    order = []
+    assert hedger.race(("github", lambda: order.append("github")),
+                       ("gemini", lambda: order.append("gemini") or "b")) == ("gemini", "b")
+    assert order == ["github", "gemini"]
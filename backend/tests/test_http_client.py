@@ -0,0 +1,61 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from services import http_client as http_client_module
+from services.http_client import PooledHTTPClient, http_stats
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client():
+    http_stats.reset()
+    client = PooledHTTPClient(host_pool_sizes={})
+    yield client
+    client.close()
+    http_stats.reset()
+
+
+def test_requests_share_one_session_and_reuse_its_connection(server, client):
+    session = client.session
+    for _ in range(3):
+        assert client.get(f"{server}/file").text == "ok"
+    assert client.session is session
+    stats = client.stats()
+    host = stats["hosts"]["127.0.0.1"]
+    assert (host["requests"], host["handshakes"], host["pool_hits"]) == (3, 1, 2)
+    assert stats["totals"]["reuse_ratio"] == pytest.approx(0.667)
+
+
+def test_a_forked_worker_builds_its_own_session(client, monkeypatch):
+    session = client.session
+    monkeypatch.setattr(http_client_module.os, "getpid", lambda: -1)
+    assert client.session is not session
+
+
+def test_host_pool_sizes_are_parsed_leniently():
+    assert http_client_module._parse_host_pool_sizes("a.com=32, b.com = 8,broken,c.com=x") == {"a.com": 32, "b.com": 8}
@@ -0,0 +1,180 @@
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from services.job_queue import CANCELLED, FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, process_start_time
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        queue = JobQueue(db_path=str(tmp_path / "jobs.db"), **kwargs)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        if queue._pool is not None:
+            queue._pool.shutdown(wait=True)
+
+
+def drain(queue):
+    """Wait for every job this queue's pool has been given."""
+    queue._pool.shutdown(wait=True)
+    queue._pool = None
+
+
+def insert_running(queue, job_id, worker, updated_at):
+    conn = sqlite3.connect(queue.db_path)
+    conn.execute('''
+        INSERT INTO jobs (job_id, job_type, status, payload, stage, worker, attempts, created_at, updated_at)
+        VALUES (?, 'echo', ?, ?, 'started', ?, 1, ?, ?)
+    ''', (job_id, RUNNING, json.dumps({"value": job_id}), worker, updated_at, updated_at))
+    conn.commit()
+    conn.close()
+
+
+def dead_pid():
+    child = subprocess.Popen([sys.executable, "-c", "pass"])
+    child.wait()
+    return child.pid
+
+
+def echo(payload, progress):
+    progress("working", value=payload["value"])
+    return {"echo": payload["value"]}
+
+
+def test_a_job_runs_to_completion(make_queue):
+    queue = make_queue()
+    queue.register("echo", echo)
+    job_id = queue.submit("echo", {"value": 7})
+    drain(queue)
+    job = queue.get(job_id)
+    assert job["status"] == SUCCEEDED and job["stage"] == "done"
+    assert job["result"] == {"echo": 7} and job["attempts"] == 1
+
+
+def test_a_failing_job_keeps_its_error_payload(make_queue):
+    queue = make_queue()
+
+    class PayloadError(Exception):
+        payload = {"error": "bad file", "file": 2}
+
+    def fail(payload, progress):
+        raise PayloadError()
+
+    queue.register("fail", fail)
+    job_id = queue.submit("fail", {})
+    drain(queue)
+    assert queue.get(job_id)["status"] == FAILED
+    assert queue.get(job_id)["error"] == {"error": "bad file", "file": 2}
+
+
+def test_a_running_job_stops_at_its_next_progress_after_cancel(make_queue):
+    queue = make_queue()
+    started, cancelled = threading.Event(), threading.Event()
+
+    def slow(payload, progress):
+        started.set()
+        cancelled.wait(5)
+        progress("after cancel")
+        return {}
+
+    queue.register("slow", slow)
+    job_id = queue.submit("slow", {})
+    assert started.wait(5)
+    assert queue.cancel(job_id) == RUNNING
+    cancelled.set()
+    drain(queue)
+    assert queue.get(job_id)["status"] == CANCELLED
+
+
+def test_the_heartbeat_keeps_a_long_job_fresh(make_queue):
+    queue = make_queue(heartbeat_interval=0.05)
+    started, release = threading.Event(), threading.Event()
+
+    def long_call(payload, progress):
+        started.set()
+        release.wait(5)  # one long call, no progress in between
+        return {}
+
+    queue.register("long", long_call)
+    job_id = queue.submit("long", {})
+    assert started.wait(5)
+    first = queue.get(job_id)["updated_at"]
+    deadline = time.monotonic() + 5
+    while queue.get(job_id)["updated_at"] == first and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert queue.get(job_id)["updated_at"] > first
+    release.set()
+    drain(queue)
+
+
+def test_jobs_of_a_dead_process_are_requeued_and_run(make_queue):
+    queue = make_queue()
+    queue.register("echo", echo)
+    pid = dead_pid()
+    insert_running(queue, "orphan", f"{socket.gethostname()}:{pid}:12345", time.time())
+    assert queue.start() == 1
+    drain(queue)
+    job = queue.get("orphan")
+    assert job["status"] == SUCCEEDED and job["attempts"] == 2
+
+
+def test_a_reused_pid_is_detected_by_its_start_time(make_queue):
+    queue = make_queue()
+    parent = os.getppid()
+    if process_start_time(parent) is None:
+        pytest.skip("process start times are not readable here")
+    assert queue._is_orphaned("job", f"{socket.gethostname()}:{parent}:1", time.time(), time.time())
+    live = f"{socket.gethostname()}:{parent}:{process_start_time(parent)}"
+    assert not queue._is_orphaned("job", live, time.time(), time.time())
+
+
+def test_other_hosts_are_judged_by_their_heartbeat(make_queue):
+    queue = make_queue(stale_after=60)
+    now = time.time()
+    assert not queue._is_orphaned("job", "elsewhere:1:1", now - 10, now)
+    assert queue._is_orphaned("job", "elsewhere:1:1", now - 120, now)
+
+
+def test_our_own_jobs_are_orphaned_only_if_no_thread_runs_them(make_queue):
+    queue = make_queue()
+    now = time.time()
+    assert queue._is_orphaned("job", queue.worker_id, now, now)
+    queue._track("job")
+    assert not queue._is_orphaned("job", queue.worker_id, now, now)
+    queue._untrack("job")
+
+
+def test_finished_jobs_are_purged_after_retention(make_queue):
+    queue = make_queue(retention=60)
+    queue.register("echo", echo)
+    job_id = queue.submit("echo", {"value": 1})
+    drain(queue)
+    assert queue.purge(time.time()) == 0
+    assert queue.purge(time.time() + 120) == 1
+    assert queue.get(job_id) is None
+
+
+def test_recovery_resubmits_queued_jobs(make_queue):
+    queue = make_queue()
+    queue.register("echo", echo)
+    insert_running(queue, "waiting", None, time.time())
+    conn = sqlite3.connect(queue.db_path)
+    conn.execute("UPDATE jobs SET status = ? WHERE job_id = 'waiting'", (QUEUED,))
+    conn.commit()
+    conn.close()
+    queue.start()
+    drain(queue)
+    assert queue.get("waiting")["status"] == SUCCEEDED
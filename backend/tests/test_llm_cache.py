@@ -0,0 +1,89 @@
+import sqlite3
+
+from services.llm_cache import LLMResponseCache, make_cache_key
+
+
+def make_cache(tmp_path, **kwargs):
+    return LLMResponseCache(db_path=str(tmp_path / "llm_cache.db"), **kwargs)
+
+
+def test_keys_cover_provider_model_prompt_and_temperature():
+    key = make_cache_key("github", "gpt-4o", "prompt", 0.8)
+    assert key == make_cache_key("github", "gpt-4o", "prompt", 0.8)
+    assert len({key, make_cache_key("gemini", "gpt-4o", "prompt", 0.8), make_cache_key("github", "other", "prompt", 0.8),
+                make_cache_key("github", "gpt-4o", "prompt!", 0.8), make_cache_key("github", "gpt-4o", "prompt")}) == 5
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    make_cache(tmp_path).set("key", "answer")
+    other = make_cache(tmp_path)
+    assert other.get("key") == "answer"
+    assert other.get("key") == "answer"
+    stats = other.stats()
+    assert stats["disk_hits"] == 1 and stats["memory_hits"] == 1
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = make_cache(tmp_path, ttl=-1)
+    cache.set("key", "answer")
+    assert cache.get("key") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_memory_tier_keeps_the_most_recently_used(tmp_path):
+    cache = make_cache(tmp_path, memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+    assert cache.stats()["memory_entries"] == 2
+    assert cache.get("a") == "a"  # evicted from memory, still on disk
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_disk_tier_evicts_least_recently_used_beyond_max_bytes(tmp_path):
+    cache = make_cache(tmp_path, memory_entries=0, max_bytes=25)
+    cache.set("a", "x" * 10)
+    cache.set("b", "y" * 10)
+    assert cache.get("a") == "x" * 10  # now more recently used than "b"
+    cache.set("c", "z" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") == "x" * 10 and cache.get("c") == "z" * 10
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["disk_bytes"] == 20
+
+
+def stored_bytes(cache):
+    conn = sqlite3.connect(cache.db_path)
+    try:
+        tracked = conn.execute("SELECT stored_bytes FROM cache_size").fetchone()[0]
+        actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_responses").fetchone()[0]
+    finally:
+        conn.close()
+    return tracked, actual
+
+
+def test_the_running_total_follows_replacements_and_evictions(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("a", "short")
+    cache.set("a", "a longer answer")
+    cache.set("b", "another answer")
+    assert stored_bytes(cache) == (29, 29)
+    cache.max_bytes = 20
+    cache.set("c", "fresh")  # evicts "a", the least recently used
+    assert stored_bytes(cache) == (19, 19)
+    # A restart recounts, so a total that drifted (or a store from before the triggers) is corrected
+    conn = sqlite3.connect(cache.db_path)
+    conn.execute("UPDATE cache_size SET stored_bytes = 0")
+    conn.commit()
+    conn.close()
+    assert stored_bytes(make_cache(tmp_path)) == (19, 19)
+    cache.ttl = -1
+    cache.set("d", "expired on arrival")
+    assert stored_bytes(cache) == (0, 0)
+
+
+def test_get_any_counts_one_miss(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.set("b", "answer")
+    assert cache.get_any(["a", "b"]) == "answer"
+    assert cache.get_any(["x", "y"]) is None
+    assert cache.stats()["misses"] == 1
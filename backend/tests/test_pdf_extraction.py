@@ -0,0 +1,110 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import pdf_extraction
+from services.pdf_extraction import PDFExtractor, SpooledPDF, _publish, extract_shared_pages
+
+
+def test_a_small_spool_stays_in_memory(tmp_path):
+    with SpooledPDF(max_size=100, spill_dir=str(tmp_path)) as spool:
+        spool.write(b"%PDF-1.7 ")
+        spool.write(b"body")
+        assert not spool.spilled
+        assert spool.source() == b"%PDF-1.7 body"
+        assert spool.sha256 == hashlib.sha256(b"%PDF-1.7 body").hexdigest()
+    assert os.listdir(tmp_path) == []
+
+
+def test_a_large_spool_spills_to_one_file_and_removes_it(tmp_path):
+    with SpooledPDF(max_size=10, spill_dir=str(tmp_path)) as spool:
+        for chunk in (b"%PDF-1.7 ", b"a" * 20, b"b" * 20):
+            spool.write(chunk)
+        path = spool.source()
+        assert spool.spilled and path == spool.path
+        with open(path, "rb") as f:
+            assert f.read() == b"%PDF-1.7 " + b"a" * 20 + b"b" * 20
+    assert not os.path.exists(path)
+
+
+def test_shared_pages_are_read_per_task_and_not_kept(monkeypatch):
+    seen = []
+    monkeypatch.setattr(pdf_extraction, "extract_pages", lambda source, indices: seen.append(source) or [])
+    block = _publish(b"%PDF-1.7 document")
+    try:
+        extract_shared_pages(block.name, 17, [0])
+        extract_shared_pages(block.name, 17, [1])
+    finally:
+        block.close()
+        block.unlink()
+    assert seen == [b"%PDF-1.7 document"] * 2
+    assert not any(isinstance(value, tuple) and b"%PDF-1.7 document" in value
+                   for value in vars(pdf_extraction).values())
+
+
+@pytest.fixture
+def fake_pypdf(monkeypatch):
+    """Twenty fake pages; records the thread every page is fingerprinted and extracted on."""
+    calls = {"fingerprint": [], "extract": []}
+
+    def fingerprint_pages(source, indices=None):
+        indices = range(20) if indices is None else indices
+        calls["fingerprint"] += [(index, threading.current_thread().name) for index in indices]
+        return [f"fp{index}" for index in indices]
+
+    def extract_pages(source, indices):
+        calls["extract"] += [(index, threading.current_thread().name) for index in indices]
+        return [(index + 1, f"text {index}", "pypdf", 0.0) for index in indices]
+
+    monkeypatch.setattr(pdf_extraction, "count_pages", lambda source: 20)
+    monkeypatch.setattr(pdf_extraction, "fingerprint_pages", fingerprint_pages)
+    monkeypatch.setattr(pdf_extraction, "extract_pages", extract_pages)
+    return calls
+
+
+def pooled_extractor(monkeypatch, **kwargs):
+    extractor = PDFExtractor(max_workers=4, pages_per_shard=5, **kwargs)
+    pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="pdf-pool")
+    monkeypatch.setattr(extractor, "_get_pool", lambda: pool)
+    return extractor
+
+
+def test_large_documents_are_fingerprinted_in_the_pool(monkeypatch, fake_pypdf):
+    extractor = pooled_extractor(monkeypatch, parallel_min_pages=4)
+    known = {f"fp{index}": f"cached {index}" for index in range(0, 20, 2)}
+    looked_up = []
+
+    def page_lookup(fingerprints):
+        looked_up.append((list(fingerprints), threading.current_thread().name))
+        return {fingerprint: known[fingerprint] for fingerprint in fingerprints if fingerprint in known}
+
+    result = extractor.extract(b"%PDF-1.7", page_lookup=page_lookup)
+    assert all(thread.startswith("pdf-pool") for _, thread in fake_pypdf["fingerprint"])
+    assert looked_up[0][0] == [f"fp{index}" for index in range(20)]
+    assert not looked_up[0][1].startswith("pdf-pool")  # the cache is only read by the request thread
+    assert sorted(index for index, _ in fake_pypdf["extract"]) == list(range(1, 20, 2))
+    assert [page.text for page in result.pages] == [
+        f"cached {index}" if index % 2 == 0 else f"text {index}" for index in range(20)
+    ]
+    assert result.parallel
+
+
+def test_few_changed_pages_are_extracted_in_process(monkeypatch, fake_pypdf):
+    extractor = pooled_extractor(monkeypatch, parallel_min_pages=4)
+    result = extractor.extract(b"%PDF-1.7", page_lookup=lambda fingerprints: {
+        fingerprint: "cached" for fingerprint in fingerprints if fingerprint != "fp7"})
+    assert [index for index, _ in fake_pypdf["extract"]] == [7]
+    assert not fake_pypdf["extract"][0][1].startswith("pdf-pool")
+    assert not result.parallel
+    assert result.pages[7].text == "text 7" and result.pages[8].backend == "cached"
+
+
+def test_small_documents_never_use_the_pool(monkeypatch, fake_pypdf):
+    extractor = pooled_extractor(monkeypatch, parallel_min_pages=50)
+    result = extractor.extract(b"%PDF-1.7", page_lookup=lambda fingerprints: {})
+    threads = [thread for _, thread in fake_pypdf["fingerprint"] + fake_pypdf["extract"]]
+    assert threads and not any(thread.startswith("pdf-pool") for thread in threads)
+    assert len(result.pages) == 20 and not result.parallel
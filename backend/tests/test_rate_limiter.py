@@ -0,0 +1,60 @@
+import pytest
+
+from services.rate_limiter import BucketConfig, SharedTokenBucketLimiter
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(tmp_path, clock):
+    return SharedTokenBucketLimiter(db_path=str(tmp_path / "rate_limits.db"),
+                                    buckets={"model": BucketConfig(rate=10, capacity=3)}, clock=clock)
+
+
+def test_burst_is_free_then_slots_are_spaced_by_the_interval(limiter):
+    waits = [limiter.reserve("model") for _ in range(5)]
+    assert waits[:3] == [0.0, 0.0, 0.0]
+    assert waits[3] == pytest.approx(0.1)
+    assert waits[4] == pytest.approx(0.2)
+
+
+def test_tokens_refill_as_the_clock_advances(limiter, clock):
+    for _ in range(4):
+        limiter.reserve("model")
+    clock.now += 0.25
+    # 0.25s refills 2.5 tokens, but one of them already went to the fourth caller
+    assert limiter.reserve("model") == 0.0
+    assert limiter.reserve("model") == pytest.approx(0.05)
+
+
+def test_a_wait_over_max_wait_is_rejected_without_using_a_slot(limiter):
+    for _ in range(3):
+        limiter.reserve("model")
+    assert limiter.reserve("model", max_wait=0.01) is None
+    assert limiter.reserve("model") == pytest.approx(0.1)
+    stats = limiter.stats()["model"]
+    assert (stats["granted"], stats["rejected"], stats["waited"]) == (4, 1, 1)
+
+
+def test_limiters_on_one_database_share_their_buckets(limiter, clock):
+    other = SharedTokenBucketLimiter(db_path=limiter.db_path, buckets=limiter.buckets, clock=clock)
+    for _ in range(3):
+        limiter.reserve("model")
+    assert other.reserve("model") == pytest.approx(0.1)
+
+
+def test_unknown_buckets_use_the_default(limiter):
+    assert limiter.config_for("other") is limiter.default_bucket
+    assert limiter.reserve("other") == 0.0
+    assert limiter.reserve("other", max_wait=0.5) is None
@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services import single_flight
+from services.single_flight import SingleFlight, SingleFlightTimeout
+
+
+@pytest.fixture
+def waiting(monkeypatch):
+    """Returns a Barrier for n waiters: the test passes it once n callers wait on the leader."""
+    barriers = []
+
+    class _Done(threading.Event):
+        def wait(self, timeout=None):
+            if barriers:
+                barriers[0].wait(5)
+            return super().wait(timeout)
+
+    class _Call(single_flight._Call):
+        def __init__(self):
+            super().__init__()
+            self.done = _Done()
+
+    monkeypatch.setattr(single_flight, "_Call", _Call)
+
+    def barrier(waiters):
+        barriers.append(threading.Barrier(waiters + 1))
+        return barriers[0]
+
+    return barrier
+
+
+def lead(started, release, calls=None, result="result"):
+    def work():
+        if calls is not None:
+            calls.append(1)
+        started.set()
+        release.wait(5)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+    return work
+
+
+def test_concurrent_callers_share_one_execution(waiting):
+    flight = SingleFlight("test")
+    started, release, calls = threading.Event(), threading.Event(), []
+    all_waiting = waiting(3)
+    work = lead(started, release, calls)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        futures = [pool.submit(flight.do, "key", work)]
+        assert started.wait(5)
+        futures += [pool.submit(flight.do, "key", work) for _ in range(3)]
+        all_waiting.wait(5)
+        release.set()
+        assert [future.result() for future in futures] == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.stats()["coalesced"] == 3
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_leader_errors_reach_every_waiter(waiting):
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    all_waiting = waiting(1)
+    fail = lead(started, release, result=RuntimeError("provider down"))
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(flight.do, "key", fail)]
+        assert started.wait(5)
+        futures.append(pool.submit(flight.do, "key", fail))
+        all_waiting.wait(5)
+        release.set()
+        for future in futures:
+            with pytest.raises(RuntimeError, match="provider down"):
+                future.result()
+    assert flight.stats()["errors"] == 1
+
+
+def test_a_waiter_gives_up_after_its_timeout():
+    flight = SingleFlight("test")
+    started, release = threading.Event(), threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        leader = pool.submit(flight.do, "key", lead(started, release, result=True))
+        assert started.wait(5)
+        with pytest.raises(SingleFlightTimeout):
+            flight.do("key", lambda: None, timeout=0.01)
+        release.set()
+        assert leader.result() is True
+    assert flight.stats()["timeouts"] == 1
+
+
+def test_later_calls_run_again():
+    flight = SingleFlight("test")
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
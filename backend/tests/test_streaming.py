@@ -0,0 +1,138 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+from requests.exceptions import ConnectionError as HTTPConnectionError
+
+import app
+from services.circuit_breaker import CircuitBreakerRegistry
+from services.llm_cache import LLMResponseCache
+
+NOTES = "Mitochondria produce ATP through cellular respiration."
+
+
+class FakeGitHub:
+    """OpenAI-style client whose streams yield `deltas`, then raise `error` if given"""
+
+    def __init__(self, deltas, error=None):
+        self.deltas = deltas
+        self.error = error
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, stream=False, **kwargs):
+        assert stream
+        for delta in self.deltas:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+        if self.error is not None:
+            raise self.error
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "llm_cache", LLMResponseCache(db_path=str(tmp_path / "llm_cache.db")))
+    monkeypatch.setattr(app, "circuit_breakers", CircuitBreakerRegistry())
+    monkeypatch.setattr(app, "index_document", lambda text: "doc")
+    monkeypatch.setattr(app, "client", None)
+
+
+def use_github(monkeypatch, github):
+    monkeypatch.setattr(app, "client", github)
+    monkeypatch.setattr(app, "github_token", "token")
+
+
+def gemini_streams(monkeypatch, deltas, error=None):
+    def stream_generate(prompt, model, endpoint="default"):
+        yield from deltas
+        if error is not None:
+            raise error
+    monkeypatch.setattr(app.gemini_flash_api, "stream_generate", stream_generate)
+
+
+def post(body):
+    with app.app.test_client() as client:
+        return client.post("/process-content", json=body)
+
+
+def sse_events(response):
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        if block:
+            fields = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_tokens_are_streamed_then_done_carries_the_whole_answer(monkeypatch):
+    gemini_streams(monkeypatch, ["## Cells", " make ATP"])
+    response = post({"notes": NOTES, "stream": True})
+    assert response.mimetype == "text/event-stream"
+    events = sse_events(response)
+    assert [event for event, _ in events] == ["status", "status", "token", "token", "done"]
+    assert [data["text"] for event, data in events if event == "token"] == ["## Cells", " make ATP"]
+    done = events[-1][1]
+    assert done["response"] == "## Cells make ATP"
+    assert done["status"] == "success" and done["document_id"] == "doc"
+
+
+def test_a_provider_failing_mid_stream_is_reset_and_the_next_one_starts_over(monkeypatch):
+    use_github(monkeypatch, FakeGitHub(["## Half an", " answer"], error=HTTPConnectionError("reset by peer")))
+    gemini_streams(monkeypatch, ["## Whole", " answer"])
+    events = sse_events(post({"notes": NOTES, "stream": True}))
+    assert events[2:] == [
+        ("token", {"text": "## Half an"}),
+        ("token", {"text": " answer"}),
+        ("reset", {}),
+        ("token", {"text": "## Whole"}),
+        ("token", {"text": " answer"}),
+        events[-1],
+    ]
+    assert events[-1][0] == "done" and events[-1][1]["response"] == "## Whole answer"
+    assert app.circuit_breakers.get("github").snapshot()["failures"] == 1
+
+
+def test_the_last_provider_failing_mid_stream_falls_back_to_the_demo_answer(monkeypatch):
+    gemini_streams(monkeypatch, ["## Half"], error=HTTPConnectionError("reset by peer"))
+    events = sse_events(post({"notes": NOTES, "stream": True}))
+    demo = app.demo_answer(NOTES)
+    assert events[2:] == [
+        ("token", {"text": "## Half"}),
+        ("reset", {}),
+        ("token", {"text": demo}),
+        events[-1],
+    ]
+    assert events[-1][0] == "done" and events[-1][1]["response"] == demo
+
+
+def test_a_stream_answer_is_cached_and_replayed_as_one_token(monkeypatch):
+    gemini_streams(monkeypatch, ["## Cells", " make ATP"])
+    sse_events(post({"notes": NOTES, "stream": True}))  # the stream only runs as it is read
+    gemini_streams(monkeypatch, [], error=AssertionError("the cached answer should be served"))
+    events = sse_events(post({"notes": NOTES, "stream": True}))
+    assert events[2:] == [("token", {"text": "## Cells make ATP"}), events[-1]]
+
+
+def test_content_errors_are_reported_as_an_error_event(monkeypatch):
+    monkeypatch.setattr(app, "gather_content_text", lambda notes, files: (_ for _ in ()).throw(
+        app.ContentProcessingError({"error": "No content to process."})))
+    events = sse_events(post({"notes": NOTES, "stream": True}))
+    assert events == [("status", {"stage": "started"}),
+                      ("error", {"error": "No content to process.", "status_code": 400})]
+
+
+def test_without_stream_the_same_answer_is_returned_as_json(monkeypatch):
+    gemini_streams(monkeypatch, ["## Cells", " make ATP"])
+    streamed = sse_events(post({"notes": NOTES, "stream": True, "bypass_cache": True}))[-1][1]
+    monkeypatch.setattr(app.gemini_flash_api, "generate", lambda prompt, model=None, endpoint="default":
+                        "## Cells make ATP")
+    response = post({"notes": NOTES, "bypass_cache": True})
+    assert response.mimetype == "application/json"
+    body = response.get_json()
+    assert body["response"] == streamed["response"]
+    assert {key: value for key, value in body.items() if key != "response"} == \
+        {key: value for key, value in streamed.items() if key != "response"}
+
+
+def test_without_stream_and_without_providers_the_demo_answer_is_returned(monkeypatch):
+    monkeypatch.setattr(app.gemini_flash_api, "generate", lambda prompt, model=None, endpoint="default": None)
+    body = post({"notes": NOTES}).get_json()
+    assert body["status"] == "success" and body["response"] == app.demo_answer(NOTES)
@@ -0,0 +1,57 @@
+import threading
+
+from services.chunker import split_text
+from services.summarizer import MapReduceSummarizer
+
+
+def make_summarizer(**kwargs):
+    return MapReduceSummarizer(split_text, token_threshold=50, chunk_tokens=40, chunk_overlap=0,
+                               page_anchors=1, token_counter=len, **kwargs)
+
+
+def test_every_chunk_of_a_long_document_is_mapped():
+    pages = [f"page{n:03d} " + "x" * 30 for n in range(200)]
+    summarizer = make_summarizer(max_in_flight=8, max_rounds=1)
+    seen = []
+
+    def map_fn(chunk):
+        seen.append(chunk)
+        return chunk[:7]  # the page label
+
+    condensed = summarizer.condense("\f".join(pages), map_fn)
+    assert len(seen) == 200
+    assert condensed.split("\f") == [page[:7] for page in pages]  # nothing after the wave size is dropped
+    assert summarizer.stats()["map_waves"] == 25
+
+
+def test_waves_bound_the_calls_in_flight():
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def map_fn(chunk):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        try:
+            return chunk[:3]
+        finally:
+            with lock:
+                in_flight[0] -= 1
+
+    summarizer = make_summarizer(max_in_flight=3, max_workers=8, max_rounds=1)
+    summarizer.condense("\f".join("y" * 35 for _ in range(30)), map_fn)
+    assert peak[0] <= 3
+
+
+def test_a_failed_chunk_is_passed_on_whole():
+    summarizer = make_summarizer(map_retries=1, max_rounds=1)
+    pages = ["a" * 35, "b" * 35, "c" * 35]
+    condensed = summarizer.condense("\f".join(pages), lambda chunk: None if chunk.startswith("b") else chunk[:2])
+    assert condensed.split("\f") == ["aa", "b" * 35, "cc"]
+    stats = summarizer.stats()
+    assert stats["map_failures"] == 1 and stats["map_retries"] == 1
+
+
+def test_short_text_is_not_mapped():
+    summarizer = make_summarizer()
+    assert summarizer.condense("short", lambda chunk: "never") == "short"
+    assert summarizer.stats()["single_shot"] == 1
@@ -0,0 +1,74 @@
+from services.text_cleaner import PAGE_BREAK, CleanReport, NearDuplicateFilter, TextCleaner, strip_boilerplate
+
+
+def body(page):
+    # Longer than both edges together, and unique per page even once digits are masked
+    return "\n".join(f"page {'abcdefghijklmnop'[page]} line {letter}" for letter in "abcdefgh")
+
+
+def pages(*bodies):
+    return PAGE_BREAK.join(bodies)
+
+
+def test_increasing_page_numbers_are_dropped():
+    text = pages(*(f"Body of page {n}\nmore text\n{n}" for n in range(1, 5)))
+    report = CleanReport()
+    cleaned = strip_boilerplate(text, report).split(PAGE_BREAK)
+    assert report.page_numbers == 4
+    assert all(not page.endswith(str(n)) for n, page in enumerate(cleaned, 1))
+
+
+def test_lone_number_at_page_edge_is_kept():
+    text = pages("Intro\ntext", "Answer to the exercise\n42", "Closing\ntext")
+    report = CleanReport()
+    assert "42" in strip_boilerplate(text, report)
+    assert report.page_numbers == 0
+
+
+def test_numbers_that_do_not_increase_are_kept():
+    text = pages("Table total\n7", "Table total\n7", "Table total\n3")
+    report = CleanReport()
+    cleaned = strip_boilerplate(text, report)
+    assert report.page_numbers == 0
+    assert cleaned.count("7") == 2 and "3" in cleaned
+
+
+def test_running_header_keeps_its_first_copy():
+    text = pages(*(f"ACME Annual Report\n{body(n)}" for n in range(1, 6)))
+    report = CleanReport()
+    cleaned = strip_boilerplate(text, report)
+    assert cleaned.count("ACME Annual Report") == 1
+    assert report.boilerplate_lines == 4
+    assert all(body(n) in cleaned for n in range(1, 6))
+
+
+def test_heading_on_scattered_pages_is_not_boilerplate():
+    # "Exercises" opens 3 of 12 pages, but never on a run of nearby pages
+    bodies = [body(n) for n in range(12)]
+    for n in (0, 5, 10):
+        bodies[n] = f"Exercises\n{body(n)}"
+    report = CleanReport()
+    assert strip_boilerplate(pages(*bodies), report).count("Exercises") == 3
+    assert report.boilerplate_lines == 0
+
+
+def test_header_and_footer_sides_are_counted_separately():
+    # The same words at the top of some pages and the bottom of others are not one running line
+    bodies = [f"Summary\n{body(0)}", f"{body(1)}\nSummary", f"Summary\n{body(2)}", f"{body(3)}\nSummary"]
+    report = CleanReport()
+    assert strip_boilerplate(pages(*bodies), report).count("Summary") == 4
+
+
+def test_near_duplicate_paragraphs_are_dropped_across_texts():
+    paragraph = "the quick brown fox jumps over the lazy dog near the river bank today"
+    cleaned, report = TextCleaner(token_counter=len).clean(
+        [paragraph, "Intro\n\n" + paragraph + "!"], [False, False]
+    )
+    assert cleaned == [paragraph, "Intro"]
+    assert report.duplicate_paragraphs == 1
+
+
+def test_short_paragraphs_are_never_duplicates():
+    seen = NearDuplicateFilter()
+    assert not seen.is_duplicate("Yes.")
+    assert not seen.is_duplicate("Yes.")
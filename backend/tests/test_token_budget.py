@@ -0,0 +1,56 @@
+import json
+
+from services.token_budget import TRUNCATION_MARKER, TokenBudget, get_encoder
+
+encoder = get_encoder("openai/gpt-4o")
+
+
+def test_fit_leaves_short_text_alone_and_trims_long_text():
+    budget = TokenBudget({"test": 100})
+    assert budget.fit("short text", "test") == "short text"
+    trimmed = budget.fit("word " * 1000, "test", reserve=20)
+    assert trimmed.endswith(TRUNCATION_MARKER)
+    assert encoder.count(trimmed) <= 80
+    assert budget.stats()["trimmed"] == {"test": 1}
+
+
+def test_fit_payload_measures_what_is_sent():
+    budget = TokenBudget({"test": 200})
+    # Non-ASCII text costs far more tokens once json.dumps escapes it
+    payload = {"question": "é" * 400, "level": 2}
+    fitted = budget.fit_payload(payload, "test")
+    assert encoder.count(json.dumps(fitted)) <= 200
+    assert fitted["level"] == 2 and fitted["question"].endswith(TRUNCATION_MARKER)
+
+
+def test_fit_payload_drops_the_oldest_list_entries_first():
+    budget = TokenBudget({"test": 300})
+    history = [{"role": "user", "content": f"message {n} " + "words " * 20} for n in range(20)]
+    fitted = budget.fit_payload({"question": "What next?", "history": history}, "test")
+    assert encoder.count(json.dumps(fitted)) <= 300
+    assert fitted["question"] == "What next?"
+    assert 0 < len(fitted["history"]) < 20
+    assert fitted["history"] == history[-len(fitted["history"]):]
+
+
+def test_fit_payload_returns_fitting_payloads_unchanged():
+    budget = TokenBudget({"test": 300})
+    payload = {"question": "What next?", "history": ["one", "two"]}
+    assert budget.fit_payload(payload, "test") == payload
+    assert budget.stats()["trimmed"] == {}
+
+
+def test_fit_payload_measures_each_entry_once():
+    budget = TokenBudget({"test": 300})
+    history = [f"message {n} " + "words " * 20 for n in range(2000)]
+    calls = []
+
+    def serialize(value):
+        calls.append(1)
+        return json.dumps(value)
+
+    fitted = budget.fit_payload({"question": "What next?", "history": history}, "test", serialize=serialize)
+    assert encoder.count(json.dumps(fitted)) <= 300
+    assert fitted["history"] == history[-len(fitted["history"]):]
+    # The whole payload, each field and each item once per pass; not once per dropped item
+    assert len(calls) < 3 * len(history)
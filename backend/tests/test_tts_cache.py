@@ -0,0 +1,98 @@
+import sqlite3
+
+import numpy as np
+
+from services.tts_cache import TTSSegmentCache, make_segment_key
+
+
+def tone(seconds=0.25, frequency=440, rate=24000):
+    return (0.3 * np.sin(2 * np.pi * frequency * np.arange(int(rate * seconds)) / rate)).astype(np.float32)
+
+
+def make_cache(tmp_path, **kwargs):
+    return TTSSegmentCache(db_path=str(tmp_path / "tts_cache.db"), **kwargs)
+
+
+def test_keys_normalize_text_but_not_voice_speed_or_engine():
+    key = make_segment_key("Hello  world.", "af_heart", 1, "a", "0.9")
+    assert key == make_segment_key(" Hello world. ", "af_heart", 1.0, "a", "0.9")
+    others = {make_segment_key("Hello world.", "af_bella", 1, "a", "0.9"),
+              make_segment_key("Hello world.", "af_heart", 1.2, "a", "0.9"),
+              make_segment_key("Hello world.", "af_heart", 1, "b", "0.9"),
+              make_segment_key("Hello world.", "af_heart", 1, "a", "1.0")}
+    assert key not in others and len(others) == 4
+
+
+def test_audio_round_trips_through_flac(tmp_path):
+    audio = tone()
+    make_cache(tmp_path).put("key", audio)
+    other = make_cache(tmp_path)  # a fresh process: served from disk
+    restored = other.get("key")
+    assert restored.dtype == np.float32 and len(restored) == len(audio)
+    assert np.abs(restored - audio).max() < 1e-3  # 16-bit quantization only
+    assert other.get("key") is restored  # now from the memory tier
+    stats = other.stats()
+    assert stats["disk_hits"] == 1 and stats["memory_hits"] == 1
+
+
+def test_contains_reports_memory_and_disk_entries(tmp_path):
+    cache = make_cache(tmp_path, memory_bytes=0)
+    cache.put("a", tone())
+    assert cache.contains(["a", "b", "a"]) == {"a"}
+    assert cache.stats()["memory_entries"] == 0
+
+
+def test_memory_tier_is_bounded_by_bytes(tmp_path):
+    audio = tone()
+    cache = make_cache(tmp_path, memory_bytes=audio.nbytes * 2)
+    for key in ("a", "b", "c"):
+        cache.put(key, audio)
+    stats = cache.stats()
+    assert stats["memory_entries"] == 2 and stats["memory_bytes"] <= audio.nbytes * 2
+
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path, memory_bytes=0)
+    cache.put("a", tone(frequency=440))
+    size = cache.stats()["disk_bytes"]
+    cache.max_bytes = int(size * 2.5)
+    cache.put("b", tone(frequency=550))
+    assert cache.get("a") is not None  # now more recently used than "b"
+    cache.put("c", tone(frequency=660))
+    assert cache.contains(["a", "b", "c"]) == {"a", "c"}
+    assert cache.stats()["evictions"] == 1
+
+
+def stored_bytes(cache):
+    conn = sqlite3.connect(cache.db_path)
+    try:
+        tracked = conn.execute("SELECT stored_bytes FROM cache_size").fetchone()[0]
+        actual = conn.execute("SELECT COALESCE(SUM(size), 0) FROM tts_segments").fetchone()[0]
+    finally:
+        conn.close()
+    return tracked, actual
+
+
+def test_the_running_total_follows_inserts_replacements_and_evictions(tmp_path):
+    cache = make_cache(tmp_path, memory_bytes=0)
+    cache.put("a", tone(seconds=0.1))
+    cache.put("a", tone(seconds=0.5))
+    cache.put("b", tone(frequency=550))
+    tracked, actual = stored_bytes(cache)
+    assert tracked == actual > 0
+    cache.max_bytes = actual - 1
+    cache.put("c", tone(frequency=660, seconds=0.05))
+    tracked, actual = stored_bytes(cache)
+    assert tracked == actual <= cache.max_bytes
+    # A restart recounts, so a total that drifted (or a store from before the triggers) is corrected
+    conn = sqlite3.connect(cache.db_path)
+    conn.execute("UPDATE cache_size SET stored_bytes = 0")
+    conn.commit()
+    conn.close()
+    assert stored_bytes(make_cache(tmp_path)) == (actual, actual)
+
+
+def test_misses_are_counted(tmp_path):
+    cache = make_cache(tmp_path)
+    assert cache.get("missing") is None
+    assert cache.stats()["misses"] == 1
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from services.tts_scheduler import TTSScheduler
+
+
+def fake_local(sentence, voice, speed):
+    return np.full(len(sentence), speed, dtype=np.float32)
+
+
+@pytest.mark.parametrize("preload_mode, prestart", [("lazy", False), ("master", False), ("worker", True)])
+def test_prestart_follows_the_preload_mode(preload_mode, prestart):
+    assert TTSScheduler(max_workers=2, preload_mode=preload_mode).prestart is prestart
+
+
+def test_an_explicit_prestart_overrides_the_preload_mode():
+    assert TTSScheduler(max_workers=2, prestart=True, preload_mode="lazy").prestart is True
+    assert TTSScheduler(max_workers=2, prestart=False, preload_mode="worker").prestart is False
+
+
+def test_start_builds_no_pool_unless_prestarting(monkeypatch):
+    scheduler = TTSScheduler(max_workers=2, preload_mode="lazy")
+    monkeypatch.setattr(scheduler, "_get_pool", lambda: pytest.fail("pool started at boot"))
+    scheduler.start()
+    assert scheduler.is_ready()
+    assert scheduler.stats()["pool"] == "on demand"
+
+
+def test_the_first_request_starts_the_pool(monkeypatch):
+    scheduler = TTSScheduler(max_workers=2, parallel_min_sentences=8, preload_mode="lazy")
+    started = []
+    monkeypatch.setattr(scheduler, "_get_pool", lambda: started.append(1))
+    audio = list(scheduler.synthesize(["One.", "Two words."], "voice", 1.0, local=fake_local))
+    assert [len(part) for part in audio] == [4, 10]  # short input: in-process, in order
+    assert started == [1]
+
+
+def test_a_single_worker_never_uses_a_pool(monkeypatch):
+    scheduler = TTSScheduler(max_workers=1)
+    monkeypatch.setattr(scheduler, "_get_pool", lambda: pytest.fail("no pool with one worker"))
+    sentences = [f"Sentence {n}." for n in range(12)]
+    audio = list(scheduler.synthesize(sentences, "voice", 1.0, local=fake_local))
+    assert [len(part) for part in audio] == [len(sentence) for sentence in sentences]
+    assert scheduler.stats()["pool"] == "disabled"
+    assert scheduler.stats()["parallel_requests"] == 0
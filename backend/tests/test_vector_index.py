@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from services.vector_index import HashingEmbedder, VectorIndex, document_id, evict_documents, is_document_id
+
+TOPICS = ["photosynthesis light chlorophyll", "mitochondria respiration atp", "newton force mass acceleration",
+          "supply demand market price", "dna replication helix polymerase", "volcano magma eruption lava",
+          "sonnet rhyme meter poem", "fraction numerator denominator", "glacier ice erosion valley",
+          "enzyme substrate catalyst", "tariff trade import export", "electron orbital shell atom",
+          "democracy vote election parliament", "tectonic plate earthquake fault", "prime number divisor",
+          "neuron synapse axon signal"]
+CHUNKS = [f"{topic} chunk {i}" for i, topic in enumerate(TOPICS)]
+TEXT = "\n\n".join(CHUNKS)
+
+
+def make_index(tmp_path, name="index", **kwargs):
+    return VectorIndex(root=str(tmp_path / name), embedder=HashingEmbedder(dim=256), **kwargs)
+
+
+def document_size(index, doc_id):
+    path = os.path.join(index.root, doc_id)
+    return sum(entry.stat().st_size for entry in os.scandir(path))
+
+
+def test_ivf_search_agrees_with_exhaustive_search_when_every_list_is_probed(tmp_path):
+    exhaustive = make_index(tmp_path, "exhaustive")
+    ivf = make_index(tmp_path, "ivf", ivf_min_chunks=4, nprobe=4)  # 16 chunks -> 4 lists, all probed
+    doc_id = exhaustive.add_document(TEXT, CHUNKS)
+    assert ivf.add_document(TEXT, CHUNKS) == doc_id
+    assert os.path.exists(os.path.join(ivf.root, doc_id, "ivf.npz"))
+    queries = ["how does chlorophyll use light", "earthquake along a fault", "atp respiration"]
+    expected = exhaustive.search_batch(doc_id, queries, k=3)
+    found = ivf.search_batch(doc_id, queries, k=3)
+    assert [[hit.chunk_id for hit in hits] for hits in found] == [[hit.chunk_id for hit in hits] for hits in expected]
+    assert [hits[0].text for hits in found] == [CHUNKS[0], CHUNKS[13], CHUNKS[1]]
+    assert ivf.stats()["ivf_queries"] == 3 and exhaustive.stats()["ivf_queries"] == 0
+
+
+def test_a_narrow_ivf_probe_scores_fewer_rows(tmp_path):
+    index = make_index(tmp_path, ivf_min_chunks=4, nprobe=1)
+    doc_id = index.add_document(TEXT, CHUNKS)
+    index.search(doc_id, "volcano lava")
+    assert 0 < index.stats()["rows_scored"] < len(CHUNKS)
+
+
+def test_only_hex_document_ids_are_accepted(tmp_path):
+    index = make_index(tmp_path)
+    doc_id = index.add_document(TEXT, CHUNKS)
+    assert doc_id == document_id(TEXT) and is_document_id(doc_id)
+    for bad in ["../" + doc_id[3:], doc_id.upper(), doc_id[:-1], doc_id + "0", "g" * 32, None, 42]:
+        assert not is_document_id(bad)
+        assert not index.has_document(bad)
+        assert index.search_batch(bad, ["atp"]) == [[]]
+        assert index.chunk_texts(bad, [0]) == []
+        assert index.remove_document(bad) is False
+    with pytest.raises(ValueError):
+        index.add_document(TEXT, CHUNKS, doc_id="../../etc")
+
+
+def test_least_recently_used_documents_are_evicted_and_listeners_told(tmp_path):
+    index = make_index(tmp_path)
+    evicted = []
+    index.eviction_listeners.append(evicted.append)
+    first = index.add_document("first", [chunk.replace("chunk", "first") for chunk in CHUNKS])
+    second = index.add_document("second", [chunk.replace("chunk", "other") for chunk in CHUNKS])
+    index.max_bytes = document_size(index, first) + document_size(index, second)
+    # The first document is read more recently, so the second is the least recently used
+    os.utime(os.path.join(index.root, second), (1000, 1000))
+    os.utime(os.path.join(index.root, first), (2000, 2000))
+    third = index.add_document("third", [chunk.replace("chunk", "third") for chunk in CHUNKS])
+    assert evicted == [second]
+    assert index.has_document(first) and index.has_document(third) and not index.has_document(second)
+    assert index.stats()["documents_evicted"] == 1
+
+
+def test_eviction_only_considers_document_directories(tmp_path):
+    root = tmp_path / "root"
+    (root / "not-a-document").mkdir(parents=True)
+    (root / "not-a-document" / "big.bin").write_bytes(b"x" * 1000)
+    doc = root / ("a" * 32)
+    doc.mkdir()
+    (doc / "vectors.npy").write_bytes(b"x" * 100)
+    assert evict_documents(str(root), max_bytes=200) == []
+    assert evict_documents(str(root), max_bytes=50) == ["a" * 32]
+    assert (root / "not-a-document").exists() and not doc.exists()